@@ -0,0 +1,61 @@
+"""
+Utilidades comunes para los benchmarks.
+
+Cada benchmark corre contra una base SQLite temporal (nunca la de
+data/db.sqlite3) con las migraciones aplicadas:
+
+    python -m bench.<nombre>
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def preparar_django(migrar=True):
+    """Configura Django con una base temporal y devuelve su ruta."""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    tmp = tempfile.mkdtemp(prefix="restaurante-bench-")
+    os.environ.setdefault("SQLITE_PATH", os.path.join(tmp, "db.sqlite3"))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "restaurante.settings")
+    os.environ.setdefault("DEBUG", "False")
+
+    import django
+    django.setup()
+    if migrar:
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0)
+    return os.environ["SQLITE_PATH"]
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = min(len(orden) - 1, max(0, round(p / 100 * (len(orden) - 1))))
+    return orden[k]
+
+
+def resumen(nombre, latencias, total_s):
+    """Imprime ops/s y latencias (ms) de una serie de mediciones."""
+    ops = len(latencias)
+    print(
+        f"{nombre:<32} ops={ops:<6} ops/s={ops / total_s:>9.1f} "
+        f"p50={percentil(latencias, 50) * 1000:>7.2f}ms "
+        f"p99={percentil(latencias, 99) * 1000:>7.2f}ms "
+        f"media={statistics.fmean(latencias) * 1000 if latencias else 0:>7.2f}ms"
+    )
+
+
+class Cronometro:
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self.inicio
@@ -0,0 +1,188 @@
+"""
+Simulación de la cocina con carga sintética: mesas que llegan al azar
+(Poisson) con 1 a 4 platos de distintas estaciones y tiempos, y cocineros
+por estación que toman el siguiente ticket. Compara el orden de llegada
+(FIFO por creado_en) con el planificador (pedidos/planificador.py).
+
+Dos variantes del planificador: "prioridad" toma siempre el primero de
+"orden" de su estación; "disparo" además no empieza un plato antes de su
+inicio_limite, así los cortos esperan para salir con el resto de su mesa
+(el cocinero queda libre para lo que vence antes).
+
+Mide la espera media por ticket (llegada -> listo), los tickets fuera de
+SLA (listo después de llegada + tiempo objetivo + tolerancia), cuánto
+tarda la mesa completa y la dispersión por mesa (entre el primer y el
+último plato listo).
+
+Al final mide lo que cuesta un sondeo de GET /api/cocina/lista/
+(ColaCocina.leer) con --pendientes tickets: completo, delta sin cambios
+(no recalcula "orden") y delta tras cambiar un ticket.
+
+    python -m bench.cocina_planificador [--minutos 240] [--mesas-hora 10] [--cocineros 2]
+"""
+import argparse
+import datetime
+import heapq
+import random
+import statistics
+import time
+
+from bench._entorno import percentil, preparar_django
+
+# plato -> (minutos objetivo, estación)
+PLATOS = {
+    1: (20, "parrilla"), 2: (14, "parrilla"),
+    3: (6, "frio"), 4: (4, "frio"), 5: (5, "frio"),
+    6: (15, "cocina"), 7: (10, "cocina"), 8: (8, "cocina"),
+}
+INICIO = datetime.datetime(2026, 1, 1, 19, 0, tzinfo=datetime.timezone.utc)
+
+
+def generar(minutos, mesas_hora, semilla):
+    """Tickets (id, mesa, plato, llegada en segundos) de una noche sintética."""
+    rnd = random.Random(semilla)
+    t, tickets, mesa = 0.0, [], 0
+    while True:
+        t += rnd.expovariate(mesas_hora / 3600)
+        if t > minutos * 60:
+            return tickets
+        mesa += 1
+        for n, plato in enumerate(rnd.choices(list(PLATOS), k=rnd.randint(1, 4))):
+            tickets.append((f"m{mesa}-{n}", f"m{mesa}", plato, t))
+
+
+def simular(tickets, cocineros, politica, tolerancia):
+    from pedidos.planificador import Planificador
+
+    plan = Planificador(cocineros=cocineros)
+    plan.cargar_platos((pk, m, est) for pk, (m, est) in PLATOS.items())
+    libres = {est: cocineros for _, est in PLATOS.values()}
+    pendientes = {est: {} for est in libres}  # estación -> {id: ticket}
+    info = {pid: (mesa, plato, llegada) for pid, mesa, plato, llegada in tickets}
+    eventos = [(llegada, 0, "llega", pid) for pid, _, _, llegada in tickets]
+    heapq.heapify(eventos)
+    inicio, listo = {}, {}
+
+    def ticket(pid, estado):
+        mesa, plato, llegada = info[pid]
+        creado = (INICIO + datetime.timedelta(seconds=llegada)).isoformat()
+        return {"id": pid, "mesa": mesa, "plato": plato, "estado": estado, "creado_en": creado}
+
+    def tomar(estacion, ahora):
+        cola = pendientes[estacion]
+        while libres[estacion] and cola:
+            if politica == "fifo":
+                pid = min(cola, key=lambda p: (info[p][2], p))
+            else:
+                o = next(o for o in plan.orden() if o["id"] in cola)
+                limite = (datetime.datetime.fromisoformat(o["inicio_limite"]) - INICIO).total_seconds()
+                if politica == "disparo" and limite > ahora:
+                    # todavía no toca "disparar" este plato: esperar a que salga con su mesa
+                    heapq.heappush(eventos, (limite, 2, "disparar", estacion))
+                    return
+                pid = o["id"]
+            del cola[pid]
+            libres[estacion] -= 1
+            inicio[pid] = ahora
+            minutos = PLATOS[info[pid][1]][0]
+            heapq.heappush(eventos, (ahora + minutos * 60, 1, "listo", pid))
+
+    while eventos:
+        ahora, _, tipo, pid = heapq.heappop(eventos)
+        if tipo == "disparar":
+            tomar(pid, ahora)
+            continue
+        estacion = PLATOS[info[pid][1]][1]
+        if tipo == "llega":
+            pendientes[estacion][pid] = True
+            plan.poner(ticket(pid, "EN_PREPARACION"))
+        else:
+            listo[pid] = ahora
+            libres[estacion] += 1
+            plan.poner(ticket(pid, "LISTO"))
+        tomar(estacion, ahora)
+
+    # espera del ticket: desde que llega hasta que está listo para servir
+    esperas = [listo[p] - info[p][2] for p in info]
+    fuera = sum(
+        listo[p] > info[p][2] + (PLATOS[info[p][1]][0] + tolerancia) * 60 for p in info
+    )
+    por_mesa = {}
+    for p in info:
+        por_mesa.setdefault(info[p][0], []).append((info[p][2], listo[p]))
+    completas = [max(l for _, l in v) - v[0][0] for v in por_mesa.values()]
+    dispersion = [
+        max(l for _, l in v) - min(l for _, l in v) for v in por_mesa.values() if len(v) > 1
+    ]
+    print(
+        f"{politica:<10} espera media={statistics.fmean(esperas) / 60:5.1f}min "
+        f"p95={percentil(esperas, 95) / 60:5.1f}min "
+        f"fuera de SLA={fuera / len(info):6.1%} "
+        f"mesa completa={statistics.fmean(completas) / 60:5.1f}min "
+        f"dispersión por mesa={statistics.fmean(dispersion) / 60:5.1f}min"
+    )
+
+
+def lecturas(pendientes, repeticiones):
+    preparar_django(migrar=False)
+    from pedidos.cola_cocina import ColaCocina
+    from pedidos.planificador import Planificador
+
+    plan = Planificador()
+    plan.cargar_platos((pk, m, est) for pk, (m, est) in PLATOS.items())
+    cola = ColaCocina(planificador=plan)
+    rnd = random.Random(7)
+
+    def ticket(n, estado="EN_PREPARACION"):
+        creado = (INICIO + datetime.timedelta(seconds=n * 20)).isoformat()
+        return {"id": f"t{n}", "mesa": f"m{n // 3}", "cliente": None, "plato": rnd.choice(list(PLATOS)),
+                "estado": estado, "creado_en": creado, "actualizado_en": creado}
+
+    cola.cargar([ticket(n) for n in range(pendientes)])
+    version = cola.leer()["version"]
+
+    def medir(nombre, leer, cambiar=None):
+        tiempos = []
+        for _ in range(repeticiones):
+            if cambiar:
+                cambiar()
+            t0 = time.perf_counter()
+            leer()
+            tiempos.append(time.perf_counter() - t0)
+        print(f"leer {nombre:<22} p50={percentil(tiempos, 50) * 1e6:8.1f}us "
+              f"p99={percentil(tiempos, 99) * 1e6:8.1f}us")
+
+    medir("completo", cola.leer)
+    medir("delta sin cambios", lambda: cola.leer(version))
+    estado = {"v": version, "n": pendientes}
+
+    def cambiar():
+        estado["v"] = cola.leer()["version"]
+        cola.aplicar(ticket(estado["n"]))
+        estado["n"] += 1
+
+    medir("delta con un cambio", lambda: cola.leer(estado["v"]), cambiar)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutos", type=int, default=240)
+    parser.add_argument("--mesas-hora", type=float, default=10)
+    parser.add_argument("--cocineros", type=int, default=2, help="por estación")
+    parser.add_argument("--tolerancia", type=int, default=10, help="minutos sobre el objetivo")
+    parser.add_argument("--semilla", type=int, default=7)
+    parser.add_argument("--pendientes", type=int, default=300, help="tickets para medir leer()")
+    parser.add_argument("--repeticiones", type=int, default=500)
+    args = parser.parse_args()
+
+    tickets = generar(args.minutos, args.mesas_hora, args.semilla)
+    mesas = len({t[1] for t in tickets})
+    print(f"{len(tickets)} tickets de {mesas} mesas en {args.minutos} min, "
+          f"{args.cocineros} cocineros por estación")
+    for politica in ("fifo", "prioridad", "disparo"):
+        simular(tickets, args.cocineros, politica, args.tolerancia)
+    lecturas(args.pendientes, args.repeticiones)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Creación de pedidos con un historial grande (por defecto 1M pedidos
+cerrados): validación anterior (EXISTS sin índice + INSERT) contra el
+índice único parcial de pedido_mesa_activa_unica.
+
+    python -m bench.crear_pedidos [--historial 1000000] [--creaciones 2000]
+"""
+import argparse
+import uuid
+
+from bench._entorno import Cronometro, preparar_django
+
+INDICES = ["pedido_mesa_activa_unica", "pedido_mesa_estado_idx", "pedido_estado_creado_idx"]
+
+
+def _cargar_historial(n, mesas=200):
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    ahora = timezone.now()
+    sql = (
+        "INSERT INTO pedidos_pedido (id, mesa, cliente, plato, estado, creado_en, actualizado_en) "
+        "VALUES (%s, %s, '', '', %s, %s, %s)"
+    )
+    lote = 50_000
+    with transaction.atomic(), connection.cursor() as cur:
+        for inicio in range(0, n, lote):
+            filas = [
+                (uuid.uuid4().hex, str(i % mesas), "CERRADO" if i % 10 else "CANCELADO", ahora, ahora)
+                for i in range(inicio, min(n, inicio + lote))
+            ]
+            cur.executemany(sql, filas)
+
+
+def _crear_legacy(mesa):
+    """Validación anterior: EXISTS sobre los activos de la mesa y luego INSERT."""
+    from django.core.exceptions import ValidationError
+    from pedidos.models import Pedido
+
+    activos = Pedido.objects.exclude(estado__in=[Pedido.Estado.CERRADO, Pedido.Estado.CANCELADO])
+    if activos.filter(mesa=mesa).exists():
+        raise ValidationError("La mesa ya tiene un pedido activo.")
+    Pedido.objects.create(mesa=mesa)
+
+
+def _medir(nombre, crear, creaciones):
+    from django.core.exceptions import ValidationError
+    from pedidos.models import Pedido
+
+    rechazos = 0
+    with Cronometro() as c:
+        for i in range(creaciones):
+            # la mitad de los intentos chocan con una mesa ya ocupada
+            mesa = f"{nombre}-{i // 2}"
+            try:
+                crear(mesa)
+            except ValidationError:
+                rechazos += 1
+    Pedido.objects.filter(mesa__startswith=f"{nombre}-").update(estado=Pedido.Estado.CERRADO)
+    print(f"{nombre:<8} {creaciones / c.segundos:>9.0f} intentos/s  (rechazados={rechazos})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--historial", type=int, default=1_000_000)
+    parser.add_argument("--creaciones", type=int, default=2000)
+    args = parser.parse_args()
+
+    preparar_django()
+    from django.db import connection
+    from pedidos import services
+
+    with Cronometro() as c:
+        _cargar_historial(args.historial)
+    print(f"historial: {args.historial} pedidos cargados en {c.segundos:.1f}s")
+
+    _medir("despues", lambda mesa: services.crear_pedido(mesa=mesa), args.creaciones)
+
+    with connection.cursor() as cur:
+        for nombre in INDICES:
+            cur.execute(f'DROP INDEX IF EXISTS "{nombre}"')
+    _medir("antes", _crear_legacy, args.creaciones)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Outbox de integraciones (pedidos/salida.py y despachador.py), SQLite.
+
+1. Latencia de confirmar: con el outbox la petición sólo hace el UPDATE y
+   el INSERT de los mensajes, aunque M1/M4 tarden --latencia ms.
+2. Throughput del despachador vaciando esos mensajes contra M1/M4 falsos
+   que tardan --latencia ms por llamada, con concurrencia 1 y N.
+
+    python -m bench.despachador_salida [--pedidos 200] [--latencia 20] [--concurrencia 8]
+"""
+import argparse
+import time
+
+from bench._entorno import percentil, preparar_django
+
+
+class RemotoLento:
+    """M1 y M4 falsos: cada llamada espera `latencia` segundos."""
+
+    def __init__(self, latencia):
+        self.latencia = latencia
+
+    def _llamar(self):
+        time.sleep(self.latencia)
+        return {"ok": True}
+
+    def validar_reservar(self, pedido_id, items):
+        self._llamar()
+        return {"ok": True, "reserva_id": f"r-{pedido_id}"}
+
+    def enviar(self, payload):
+        return self._llamar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pedidos", type=int, default=200)
+    parser.add_argument("--latencia", type=float, default=20, help="ms por llamada a M1/M4")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    args = parser.parse_args()
+
+    preparar_django()
+    from django.test import override_settings
+    from rest_framework.test import APIRequestFactory
+    from pedidos.despachador import Despachador, metricas
+    from pedidos.models import MensajeSalida, Pedido
+    from pedidos.views import PedidoViewSet
+
+    factory = APIRequestFactory()
+    vista = PedidoViewSet.as_view({"post": "confirmar"})
+    remoto = RemotoLento(args.latencia / 1000)
+
+    for concurrencia in (1, args.concurrencia):
+        objs = [Pedido() for _ in range(args.pedidos)]
+        Pedido.objects.bulk_create(objs)
+
+        latencias = []
+        with override_settings(INTEGRACIONES_OUTBOX=True):
+            for p in objs:
+                t0 = time.perf_counter()
+                r = vista(factory.post(f"/api/pedidos/{p.id}/confirmar/"), pk=str(p.id))
+                latencias.append(time.perf_counter() - t0)
+                assert r.status_code == 200, r.data
+        print(
+            f"confirmar (outbox)       p50={percentil(latencias, 50) * 1000:7.2f}ms "
+            f"p99={percentil(latencias, 99) * 1000:7.2f}ms "
+            f"(M1/M4 tardan {args.latencia:.0f}ms por llamada)"
+        )
+
+        despachador = Despachador(concurrencia=concurrencia, m1=remoto, m4=remoto)
+        metricas.reiniciar()
+        t0 = time.perf_counter()
+        while despachador.ciclo():
+            pass
+        total = time.perf_counter() - t0
+        despachador.cerrar()
+        pendientes = MensajeSalida.objects.filter(estado=MensajeSalida.Estado.PENDIENTE).count()
+        enviados = metricas.snapshot()["enviados"]
+        print(
+            f"despachador concurrencia={concurrencia:<3} enviados={enviados} en {total:6.2f}s "
+            f"-> {enviados / total:7.1f} mensajes/s (pendientes={pendientes})"
+        )
+
+
+if __name__ == "__main__":
+    main()
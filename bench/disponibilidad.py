@@ -0,0 +1,83 @@
+"""
+Porciones preparables por plato con 2k ingredientes y 500 platos:
+cálculo plato por plato con consultas (lo ingenuo) vs carga completa del
+motor (3 consultas + una pasada) vs actualización incremental de un
+ingrediente.
+
+    python -m bench.disponibilidad [--ingredientes 2000] [--platos 500] [--lineas 8]
+"""
+import argparse
+import random
+from decimal import Decimal
+
+from bench._entorno import Cronometro, preparar_django, resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ingredientes", type=int, default=2000)
+    parser.add_argument("--platos", type=int, default=500)
+    parser.add_argument("--lineas", type=int, default=8, help="ingredientes por receta")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    preparar_django()
+    from menu_stock.disponibilidad import MotorDisponibilidad, cargar_desde_bd
+    from menu_stock.models import CategoriaMenu, Ingrediente, Plato, Receta
+
+    rnd = random.Random(7)
+    cat = CategoriaMenu.objects.create(nombre="Bench")
+    Ingrediente.objects.bulk_create(
+        Ingrediente(nombre=f"ing{i}", cantidad_disponible=rnd.randint(0, 500), unidad_medida="g")
+        for i in range(args.ingredientes)
+    )
+    Plato.objects.bulk_create(
+        Plato(nombre=f"plato{i}", precio=1000, categoria=cat) for i in range(args.platos)
+    )
+    ing_ids = list(Ingrediente.objects.values_list("pk", flat=True))
+    plato_ids = list(Plato.objects.values_list("pk", flat=True))
+    Receta.objects.bulk_create(
+        Receta(plato_id=p, ingrediente_id=i, cantidad=Decimal(rnd.randint(1, 20)))
+        for p in plato_ids for i in rnd.sample(ing_ids, args.lineas)
+    )
+    print(f"{args.ingredientes} ingredientes, {args.platos} platos, {args.platos * args.lineas} líneas de receta")
+
+    def ingenuo():
+        out = {}
+        for plato in Plato.objects.filter(activo=True):
+            out[plato.pk] = min(
+                int(r.ingrediente.cantidad_disponible // r.cantidad)
+                for r in Receta.objects.filter(plato=plato).select_related("ingrediente")
+            )
+        return out
+
+    motor = MotorDisponibilidad()
+    lat = {"ingenuo (1+N consultas)": [], "motor carga completa": [], "motor incremental (1 ing)": []}
+    totales = dict.fromkeys(lat, 0.0)
+    for _ in range(args.repeticiones):
+        for nombre in lat:
+            if nombre.startswith("ingenuo") and len(lat[nombre]) >= 3:
+                continue  # es lento: con 3 corridas basta
+            ing = rnd.choice(ing_ids)
+            cantidad = Decimal(rnd.randint(0, 500))
+            with Cronometro() as c:
+                if nombre.startswith("ingenuo"):
+                    ingenuo()
+                elif nombre.endswith("completa"):
+                    cargar_desde_bd(motor)
+                else:
+                    motor.actualizar_stock({ing: cantidad})
+            lat[nombre].append(c.segundos)
+            totales[nombre] += c.segundos
+
+    for nombre, valores in lat.items():
+        resumen(nombre, valores, totales[nombre])
+
+    cargar_desde_bd(motor)
+    if motor.porciones() != ingenuo():
+        raise SystemExit("¡El motor no coincide con el cálculo plato por plato!")
+    print("OK: el motor coincide con el cálculo plato por plato")
+
+
+if __name__ == "__main__":
+    main()
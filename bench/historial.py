@@ -0,0 +1,80 @@
+"""
+Historial de pedidos (pedidos/historial.py): compactación de una tabla
+PedidoEvento con --dias días de historia sintética y latencia de
+reconstruir() para pedidos que siguen en la tabla y para pedidos que ya
+están en los archivos por día (mmap + búsqueda binaria), SQLite.
+
+    python -m bench.historial [--dias 60] [--pedidos-dia 500] [--retencion 7]
+"""
+import argparse
+import datetime
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from bench._entorno import percentil, preparar_django
+
+CAMINO = ["CREADO", "EN_PREPARACION", "LISTO", "ENTREGADO", "CERRADO"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dias", type=int, default=60)
+    parser.add_argument("--pedidos-dia", type=int, default=500)
+    parser.add_argument("--retencion", type=int, default=7)
+    parser.add_argument("--consultas", type=int, default=300)
+    args = parser.parse_args()
+
+    preparar_django()
+    from django.utils import timezone
+    from pedidos import historial
+    from pedidos.models import PedidoEvento
+
+    rnd = random.Random(7)
+    ahora = timezone.now()
+    por_edad = {}  # "tabla" / "archivos" -> [pedido]
+    for dia in range(args.dias):
+        inicio = ahora - datetime.timedelta(days=dia)
+        filas = []
+        for _ in range(args.pedidos_dia):
+            pedido, t = uuid.uuid4(), inicio - datetime.timedelta(seconds=rnd.uniform(0, 20000))
+            mesa = str(rnd.randint(1, 30))
+            for n, estado in enumerate(CAMINO):
+                filas.append(PedidoEvento(
+                    pedido=pedido, ocurrido_en=t + datetime.timedelta(minutes=10 * n),
+                    tipo="creado" if n == 0 else "estado", estado_anterior=CAMINO[n - 1] if n else "",
+                    estado=estado, mesa=mesa, cliente=f"cliente {rnd.randint(1, 2000)}",
+                ))
+            por_edad.setdefault("tabla" if dia < args.retencion - 1 else "archivos", []).append(pedido)
+        PedidoEvento.objects.bulk_create(filas, batch_size=2000)
+
+    total = PedidoEvento.objects.count()
+    with tempfile.TemporaryDirectory() as directorio:
+        t0 = time.perf_counter()
+        hechos = historial.compactar(args.retencion, directorio)
+        duracion = time.perf_counter() - t0
+        compactados = sum(n for _, n in hechos)
+        tamano = sum(p.stat().st_size for p in Path(directorio).glob("*.col"))
+        print(
+            f"compactar: {compactados} de {total} eventos en {len(hechos)} archivos, {duracion:.2f}s "
+            f"({compactados / duracion:.0f} eventos/s), {tamano / compactados:.1f} bytes/evento; "
+            f"quedan {PedidoEvento.objects.count()} en la tabla"
+        )
+        for origen, pedidos in por_edad.items():
+            latencias = []
+            for pedido in rnd.sample(pedidos, min(args.consultas, len(pedidos))):
+                t0 = time.perf_counter()
+                estado = historial.reconstruir(pedido, directorio=directorio)
+                latencias.append(time.perf_counter() - t0)
+                assert estado["estado"] == "CERRADO", estado
+            print(
+                f"reconstruir desde {origen:<9} p50={percentil(latencias, 50) * 1000:6.2f}ms "
+                f"p99={percentil(latencias, 99) * 1000:6.2f}ms"
+            )
+        historial.abiertos.limpiar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Reservas concurrentes contra el inventario SQLite del mock desde varios
+procesos (como los workers de gunicorn/uvicorn) y varios hilos por
+proceso. Verifica que no haya sobreventa y mide reservas/s.
+
+    python -m bench.inventario_mock [--procesos 3] [--hilos 16] [--reservas 10000] [--stock 2000]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from bench._entorno import BASE_DIR, Cronometro, resumen
+
+DEMANDA = {"pan": 1, "carne": 1}
+
+
+def _worker(ruta, hilos, reservas):
+    import sys
+    sys.path.insert(0, str(BASE_DIR))
+    from mock.inventario import InventarioSQLite, SinStock
+
+    inv = InventarioSQLite(ruta, {})
+
+    def intentar(_):
+        t0 = time.perf_counter()
+        try:
+            inv.reservar(DEMANDA)
+            ok = True
+        except SinStock:
+            ok = False
+        return ok, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=hilos) as ex:
+        return list(ex.map(intentar, range(reservas)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--procesos", type=int, default=3)
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--reservas", type=int, default=10_000)
+    parser.add_argument("--stock", type=int, default=2_000)
+    args = parser.parse_args()
+
+    from mock.inventario import InventarioSQLite
+
+    ruta = os.path.join(tempfile.mkdtemp(prefix="restaurante-bench-"), "inventario.sqlite3")
+    InventarioSQLite(ruta, {ing: args.stock for ing in DEMANDA}).cerrar()
+
+    por_proceso = args.reservas // args.procesos
+    with Cronometro() as c:
+        # "spawn": una conexión SQLite no debe cruzar un fork
+        with ProcessPoolExecutor(max_workers=args.procesos, mp_context=get_context("spawn")) as ex:
+            futuros = [ex.submit(_worker, ruta, args.hilos, por_proceso) for _ in range(args.procesos)]
+            resultados = [r for f in futuros for r in f.result()]
+
+    exitos = sum(ok for ok, _ in resultados)
+    stock = InventarioSQLite(ruta, {}).stock()
+    print(f"{args.procesos} procesos x {args.hilos} hilos, {len(resultados)} reservas, stock {args.stock}")
+    resumen("reservas sqlite", [s for _, s in resultados], c.segundos)
+    print(f"exitosas={exitos} stock_final={stock}")
+    esperadas = min(args.stock, len(resultados))
+    if exitos != esperadas or any(v != args.stock - esperadas for v in stock.values()):
+        raise SystemExit("¡Sobreventa o stock inconsistente!")
+    print("OK: sin sobreventa")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compara cómo la UI obtenía los pedidos (HTTP loopback contra /api/pedidos/)
+con la llamada directa a pedidos.services, con 1, 10 y 50 clientes
+concurrentes.
+
+    python -m bench.loopback_vs_directo [--pedidos 200] [--iteraciones 40]
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench._entorno import Cronometro, preparar_django, resumen
+
+
+def _levantar_servidor():
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class Handler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadedWSGIServer(("127.0.0.1", 0), Handler, allow_reuse_address=True)
+    srv.set_app(get_wsgi_application())
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_port}"
+
+
+def _correr(clientes, iteraciones, operacion):
+    from django.db import connections
+
+    latencias = []
+    lock = threading.Lock()
+
+    def cliente():
+        propias = []
+        for _ in range(iteraciones):
+            t0 = time.perf_counter()
+            operacion()
+            propias.append(time.perf_counter() - t0)
+        connections.close_all()
+        with lock:
+            latencias.extend(propias)
+
+    with Cronometro() as c:
+        with ThreadPoolExecutor(max_workers=clientes) as ex:
+            for f in [ex.submit(cliente) for _ in range(clientes)]:
+                f.result()
+    return latencias, c.segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pedidos", type=int, default=200)
+    parser.add_argument("--iteraciones", type=int, default=40)
+    args = parser.parse_args()
+
+    preparar_django()
+    import requests
+    from pedidos.models import Pedido
+    from ui.views import PEDIDO_CAMPOS
+    from pedidos import services
+
+    Pedido.objects.bulk_create(
+        Pedido(mesa=str(i), cliente=f"Cliente {i}", plato="1") for i in range(args.pedidos)
+    )
+    srv, base = _levantar_servidor()
+    sesion_local = threading.local()
+
+    def loopback():
+        s = getattr(sesion_local, "s", None) or requests.Session()
+        sesion_local.s = s
+        r = s.get(f"{base}/api/pedidos/", timeout=10)
+        r.raise_for_status()
+        r.json()
+
+    def directo():
+        list(services.listar_pedidos().values(*PEDIDO_CAMPOS))
+
+    print(f"{args.pedidos} pedidos, {args.iteraciones} iteraciones por cliente")
+    try:
+        for clientes in (1, 10, 50):
+            for nombre, op in (("loopback", loopback), ("directo", directo)):
+                lat, total = _correr(clientes, args.iteraciones, op)
+                resumen(f"{nombre} clientes={clientes}", lat, total)
+    finally:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Contención de escritura en SQLite con 3 procesos (como 3 workers de
+gunicorn/uvicorn) creando pedidos y recorriendo sus transiciones contra el
+mismo archivo. Compara el perfil "basico" (SQLite de fábrica) con
+"produccion" (WAL, busy_timeout, transacciones IMMEDIATE, mmap, caché):
+tasa de errores "database is locked" y latencias por operación.
+
+    python -m bench.sqlite_contencion [--procesos 3] [--pedidos 300]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from bench._entorno import percentil
+
+FLUJO = ["confirmar", "marcar_listo", "entregar", "cerrar"]
+
+
+def _django(perfil, ruta, migrar=False):
+    # cada proceso lee el perfil de las variables de entorno al cargar settings
+    os.environ["SQLITE_PERFIL"] = perfil
+    os.environ["SQLITE_PATH"] = ruta
+    from bench._entorno import preparar_django
+
+    preparar_django(migrar=migrar)
+
+
+def _worker(perfil, ruta, n, inicio, salida):
+    _django(perfil, ruta)
+    from django.db import OperationalError, transaction
+    from pedidos.models import Pedido
+
+    def operacion(i):
+        # una "request": crear el pedido y avanzar su flujo en una transacción
+        with transaction.atomic():
+            p = Pedido.objects.create(mesa=f"{os.getpid()}-{i}", cliente="bench")
+            for metodo in FLUJO:
+                getattr(p, metodo)()
+
+    latencias, errores = [], 0
+    inicio.wait()
+    for i in range(n):
+        t0 = time.perf_counter()
+        try:
+            operacion(i)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            errores += 1
+        latencias.append(time.perf_counter() - t0)
+    salida.put((latencias, errores))
+
+
+def correr(perfil, procesos, pedidos):
+    ruta = os.path.join(tempfile.mkdtemp(prefix="restaurante-bench-"), "db.sqlite3")
+    ctx = multiprocessing.get_context("spawn")
+    migracion = ctx.Process(target=_django, args=(perfil, ruta, True))
+    migracion.start()
+    migracion.join()
+
+    inicio, salida = ctx.Event(), ctx.Queue()
+    hijos = [
+        ctx.Process(target=_worker, args=(perfil, ruta, pedidos, inicio, salida))
+        for _ in range(procesos)
+    ]
+    for h in hijos:
+        h.start()
+    time.sleep(1.0)  # que todos terminen de arrancar Django
+    t0 = time.perf_counter()
+    inicio.set()
+    resultados = [salida.get() for _ in hijos]
+    total_s = time.perf_counter() - t0
+    for h in hijos:
+        h.join()
+
+    latencias = [l for lat, _ in resultados for l in lat]
+    errores = sum(e for _, e in resultados)
+    ops = len(latencias)
+    print(
+        f"{perfil:<11} ops={ops:<5} locked={errores:<5} ({errores / ops:6.1%}) "
+        f"ok/s={(ops - errores) / total_s:>7.1f} "
+        f"p50={percentil(latencias, 50) * 1000:>7.2f}ms "
+        f"p99={percentil(latencias, 99) * 1000:>8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--procesos", type=int, default=3)
+    parser.add_argument("--pedidos", type=int, default=300, help="por proceso")
+    args = parser.parse_args()
+
+    print(f"{args.procesos} procesos x {args.pedidos} pedidos (crear + {len(FLUJO)} transiciones)")
+    for perfil in ("basico", "produccion"):
+        correr(perfil, args.procesos, args.pedidos)
+
+
+if __name__ == "__main__":
+    main()
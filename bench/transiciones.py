@@ -0,0 +1,72 @@
+"""
+Transiciones por segundo en SQLite: camino anterior (full_clean + SELECT
+del estado previo + save) contra el UPDATE condicional de Pedido.
+
+    python -m bench.transiciones [--pedidos 2000] [--historial 20000]
+"""
+import argparse
+
+from bench._entorno import Cronometro, preparar_django
+
+FLUJO = ["confirmar", "marcar_listo", "entregar", "cerrar"]
+
+
+def _legacy(pedido, destino):
+    """Reproduce la transición anterior: 3 consultas por cambio de estado."""
+    from pedidos.models import Pedido
+
+    Pedido.objects.filter(pk=pedido.pk).values_list("estado", flat=True).first()
+    pedido.estado = destino
+    pedido.full_clean()
+    campos = ["estado", "actualizado_en"]
+    if destino == Pedido.Estado.ENTREGADO:
+        campos.append("entregado_en")
+    pedido.save(update_fields=campos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pedidos", type=int, default=2000)
+    parser.add_argument("--historial", type=int, default=20000,
+                        help="pedidos CERRADO previos (hacen crecer el EXISTS de clean())")
+    args = parser.parse_args()
+
+    preparar_django()
+    from django.db import transaction
+    from pedidos.models import Pedido
+
+    E = Pedido.Estado
+    destinos = [E.EN_PREPARACION, E.LISTO, E.ENTREGADO, E.CERRADO]
+
+    Pedido.objects.bulk_create(
+        (Pedido(mesa=str(i % 50), estado=E.CERRADO) for i in range(args.historial)),
+        batch_size=5000,
+    )
+
+    def lote(prefijo):
+        objs = [Pedido(mesa=f"{prefijo}{i}") for i in range(args.pedidos)]
+        Pedido.objects.bulk_create(objs, batch_size=5000)
+        return objs
+
+    total = args.pedidos * len(FLUJO)
+    print(f"{args.pedidos} pedidos x {len(FLUJO)} transiciones, historial={args.historial}")
+
+    objs = lote("L")
+    with Cronometro() as c, transaction.atomic():
+        for p in objs:
+            for destino in destinos:
+                _legacy(p, destino)
+    antes = total / c.segundos
+    print(f"antes  (full_clean + save): {antes:>10.0f} transiciones/s")
+
+    objs = lote("N")
+    with Cronometro() as c, transaction.atomic():
+        for p in objs:
+            for metodo in FLUJO:
+                getattr(p, metodo)()
+    despues = total / c.segundos
+    print(f"despues (UPDATE condicional): {despues:>8.0f} transiciones/s  (x{despues / antes:.1f})")
+
+
+if __name__ == "__main__":
+    main()
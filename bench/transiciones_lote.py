@@ -0,0 +1,56 @@
+"""
+Latencia de POST /api/pedidos/transiciones/ con 100 transiciones contra
+100 llamadas individuales a /api/pedidos/{id}/listo/ (SQLite).
+
+    python -m bench.transiciones_lote [--items 100] [--repeticiones 50]
+"""
+import argparse
+import time
+
+from bench._entorno import percentil, preparar_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    preparar_django()
+    from rest_framework.test import APIRequestFactory
+    from pedidos.models import Pedido
+    from pedidos.views import PedidoViewSet
+
+    factory = APIRequestFactory()
+    vista_lote = PedidoViewSet.as_view({"post": "transiciones"})
+    vista_listo = PedidoViewSet.as_view({"patch": "listo"})
+
+    def preparar():
+        objs = [Pedido(estado=Pedido.Estado.EN_PREPARACION) for _ in range(args.items)]
+        Pedido.objects.bulk_create(objs)
+        return objs
+
+    lote, individual = [], []
+    for _ in range(args.repeticiones):
+        objs = preparar()
+        body = [{"id": str(p.id), "accion": "listo"} for p in objs]
+        t0 = time.perf_counter()
+        r = vista_lote(factory.post("/api/pedidos/transiciones/", body, format="json"))
+        lote.append(time.perf_counter() - t0)
+        assert r.status_code == 200, r.data
+
+        objs = preparar()
+        t0 = time.perf_counter()
+        for p in objs:
+            vista_listo(factory.patch(f"/api/pedidos/{p.id}/listo/"), pk=str(p.id))
+        individual.append(time.perf_counter() - t0)
+
+    for nombre, lat in (("lote", lote), ("una por una", individual)):
+        print(
+            f"{args.items} transiciones {nombre:<12} "
+            f"p50={percentil(lat, 50) * 1000:7.2f}ms p99={percentil(lat, 99) * 1000:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
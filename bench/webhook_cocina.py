@@ -0,0 +1,72 @@
+"""
+Eventos por segundo del webhook de cocina (POST /api/webhooks/cocina/eventos/,
+pedidos/webhooks.py) en un worker, con lotes de distinto tamaño: firma,
+deduplicación y transiciones incluidas (SQLite).
+
+Cada pedido tiene --lineas líneas; por pedido llegan un item.listo por
+línea (el último lo pasa a LISTO) y el reenvío de uno de ellos (duplicado).
+
+    python -m bench.webhook_cocina [--eventos 20000] [--lineas 3] [--lotes 1,100,1000,5000]
+"""
+import argparse
+import json
+import time
+
+from bench._entorno import preparar_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--eventos", type=int, default=20000, help="eventos por tamaño de lote")
+    parser.add_argument("--lineas", type=int, default=3)
+    parser.add_argument("--lotes", default="1,100,1000,5000")
+    args = parser.parse_args()
+
+    preparar_django()
+    from django.conf import settings
+    from django.test import RequestFactory
+    from menu_stock.models import CategoriaMenu, Plato
+    from pedidos.adapters import build_signature
+    from pedidos.models import Pedido, PedidoItem
+    from pedidos.views import webhook_cocina
+
+    factory = RequestFactory()
+    cat = CategoriaMenu.objects.create(nombre="Bench")
+    plato = Plato.objects.create(nombre="Bench", precio=1, categoria=cat)
+    por_pedido = args.lineas + 1
+
+    def preparar(n):
+        pedidos = [Pedido(estado=Pedido.Estado.EN_PREPARACION) for _ in range(n // por_pedido + 1)]
+        Pedido.objects.bulk_create(pedidos)
+        items = [PedidoItem(pedido=p, plato=plato) for p in pedidos for _ in range(args.lineas)]
+        PedidoItem.objects.bulk_create(items)
+        eventos = []
+        for item in items:
+            evento = {"id": f"e{item.pk}", "tipo": "item.listo", "pedido_id": str(item.pedido_id), "item_id": item.pk}
+            eventos.append(evento)
+            if len(eventos) % por_pedido == args.lineas:
+                eventos.append(evento)  # reenvío
+        return eventos[:n]
+
+    for tam in (int(t) for t in args.lotes.split(",")):
+        eventos = preparar(args.eventos)
+        cuerpos = []
+        for i in range(0, len(eventos), tam):
+            cuerpo = json.dumps(eventos[i:i + tam]).encode()
+            cuerpos.append((cuerpo, "sha256=" + build_signature(settings.M3_WEBHOOK_SECRET, cuerpo)))
+        t0 = time.perf_counter()
+        for cuerpo, firma in cuerpos:
+            r = webhook_cocina(factory.post(
+                "/api/webhooks/cocina/eventos/", cuerpo,
+                content_type="application/json", HTTP_X_SIGNATURE=firma,
+            ))
+            assert r.status_code == 200, r.content
+        total = time.perf_counter() - t0
+        print(
+            f"lotes de {tam:<5} {len(eventos)} eventos en {total:6.2f}s "
+            f"-> {len(eventos) / total:8.0f} eventos/s ({len(cuerpos) / total:7.1f} peticiones/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MenuStockConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'menu_stock'
+
+    def ready(self):
+        from . import signals  # noqa: F401
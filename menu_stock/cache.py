@@ -0,0 +1,100 @@
+"""
+Caché de las respuestas del menú (platos, categorías, ingredientes).
+
+El listado se serializa una vez a JSON y se guarda en el caché de Django
+junto con su ETag. Los clientes que mandan If-None-Match reciben 304 sin
+cuerpo. signals.py borra la entrada cuando cambia un modelo del menú
+(después del commit) y reservas.py cuando cambia el stock.
+
+Con varios workers el caché debe ser compartido (settings.CACHES usa
+archivos en data/cache por defecto) para que la invalidación llegue a
+todos; MENU_CACHE_TTL acota cuánto puede durar una entrada igual.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+PREFIJO = "menu_stock:"
+CLAVES = ("platos", "platos_resumen", "categorias", "ingredientes")
+
+
+class MetricasCache:
+    """Aciertos / fallos por clave, para calcular el hit rate."""
+
+    EVENTOS = ("aciertos", "fallos", "no_modificados", "refrescos")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = {}
+
+    def registrar(self, clave, evento):
+        with self._lock:
+            d = self._datos.setdefault(clave, dict.fromkeys(self.EVENTOS, 0))
+            d[evento] += 1
+
+    def snapshot(self):
+        with self._lock:
+            out = {}
+            for clave, d in self._datos.items():
+                d = dict(d)
+                total = d["aciertos"] + d["fallos"]
+                d["hit_rate"] = round(d["aciertos"] / total, 4) if total else 0.0
+                out[clave] = d
+            return out
+
+    def reiniciar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+metricas = MetricasCache()
+
+
+def invalidar(*claves):
+    """Borra las entradas indicadas (o todas) cuando la transacción confirma."""
+    claves = claves or CLAVES
+    transaction.on_commit(lambda: cache.delete_many([PREFIJO + c for c in claves]))
+
+
+def respuesta_cacheada(request, clave, construir):
+    """
+    Devuelve el JSON cacheado de `clave` (o 304 si el cliente ya lo tiene).
+    `construir()` produce los datos a serializar cuando no hay entrada.
+    """
+    entrada = cache.get(PREFIJO + clave)
+    if entrada is None:
+        metricas.registrar(clave, "fallos")
+        cuerpo = JSONRenderer().render(construir())
+        entrada = ('"%s"' % hashlib.sha1(cuerpo).hexdigest(), cuerpo)
+        cache.set(PREFIJO + clave, entrada, settings.MENU_CACHE_TTL)
+    else:
+        metricas.registrar(clave, "aciertos")
+
+    etag, cuerpo = entrada
+    if request.headers.get("If-None-Match") == etag:
+        metricas.registrar(clave, "no_modificados")
+        resp = HttpResponseNotModified()
+    else:
+        resp = HttpResponse(cuerpo, content_type="application/json")
+    resp["ETag"] = etag
+    return resp
+
+
+class ListadoCacheadoMixin:
+    """list() cacheado para los ViewSets del menú (sólo JSON y sin parámetros)."""
+
+    cache_clave = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+        return respuesta_cacheada(
+            request,
+            self.cache_clave,
+            lambda: self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data,
+        )
@@ -0,0 +1,117 @@
+"""
+Porciones que se pueden preparar ahora de cada plato activo.
+
+porciones(plato) = min(cantidad_disponible[ing] // receta[plato][ing])
+
+El motor guarda la matriz de recetas en forma dispersa (sólo las líneas
+que existen) en dos sentidos: plato -> {ingrediente: cantidad} y el
+índice inverso ingrediente -> {plato: cantidad}. La carga completa son
+tres consultas y una sola pasada por las recetas; cuando cambia el stock
+de un ingrediente se recalculan sólo los platos que lo usan.
+
+Cada proceso tiene su motor. Los cambios de stock hechos en este proceso
+(señales de Ingrediente, reservas.py) se aplican al instante; los de
+otros workers se recogen al recargar cada DISPONIBILIDAD_RESYNC segundos.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Ingrediente, Plato, Receta
+
+
+def _porciones(receta, stock):
+    if not receta:
+        return None  # sin receta cargada: no se puede calcular
+    return max(0, min(int(stock.get(ing, 0) // cant) for ing, cant in receta.items()))
+
+
+class MotorDisponibilidad:
+    def __init__(self, reloj=time.monotonic):
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._stock = {}
+        self._recetas = {}   # plato -> {ingrediente: cantidad}
+        self._usos = {}      # ingrediente -> {plato: cantidad}
+        self._porciones = {}
+        self._cargado_en = None
+
+    def cargar(self, stock, lineas, platos):
+        """
+        Reconstruye todo. stock: {ingrediente: cantidad}; lineas: iterable de
+        (plato, ingrediente, cantidad); platos: ids de los platos a considerar.
+        """
+        platos = set(platos)
+        recetas = {p: {} for p in platos}
+        usos = {}
+        for plato, ing, cant in lineas:
+            if plato not in platos or cant <= 0:
+                continue
+            recetas[plato][ing] = recetas[plato].get(ing, 0) + cant
+            usos.setdefault(ing, {})[plato] = recetas[plato][ing]
+        stock = dict(stock)
+        porciones = {p: _porciones(receta, stock) for p, receta in recetas.items()}
+        with self._lock:
+            self._stock, self._recetas, self._usos = stock, recetas, usos
+            self._porciones = porciones
+            self._cargado_en = self._reloj()
+
+    def actualizar_stock(self, cambios):
+        """
+        Aplica {ingrediente: nueva cantidad} y recalcula sólo los platos
+        afectados. Devuelve {plato: porciones} de los que cambiaron.
+        """
+        cambiados = {}
+        with self._lock:
+            afectados = set()
+            for ing, cantidad in cambios.items():
+                self._stock[ing] = cantidad
+                afectados.update(self._usos.get(ing, ()))
+            for plato in afectados:
+                nuevo = _porciones(self._recetas[plato], self._stock)
+                if nuevo != self._porciones.get(plato):
+                    self._porciones[plato] = nuevo
+                    cambiados[plato] = nuevo
+        return cambiados
+
+    def invalidar(self):
+        """Las recetas o los platos cambiaron: recargar todo en la próxima lectura."""
+        with self._lock:
+            self._cargado_en = None
+
+    def vigente(self, resync):
+        with self._lock:
+            return self._cargado_en is not None and self._reloj() - self._cargado_en < resync
+
+    def porciones(self):
+        with self._lock:
+            return dict(self._porciones)
+
+
+motor = MotorDisponibilidad()
+
+
+def cargar_desde_bd(m=None):
+    """Carga completa del motor: 3 consultas con values_list, sin instanciar modelos."""
+    m = m or motor
+    m.cargar(
+        Ingrediente.objects.values_list("pk", "cantidad_disponible"),
+        Receta.objects.values_list("plato_id", "ingrediente_id", "cantidad"),
+        Plato.objects.filter(activo=True).values_list("pk", flat=True),
+    )
+    return m
+
+
+def porciones_actuales():
+    """{plato_id: porciones} de los platos activos (None si no tienen receta)."""
+    if not motor.vigente(settings.DISPONIBILIDAD_RESYNC):
+        cargar_desde_bd()
+    return motor.porciones()
+
+
+def refrescar_ingredientes(ids):
+    """Relee el stock de esos ingredientes (una consulta) y actualiza el motor."""
+    return motor.actualizar_stock(dict(
+        Ingrediente.objects.filter(pk__in=list(ids)).values_list("pk", "cantidad_disponible")
+    ))
@@ -0,0 +1,55 @@
+"""
+Modelo de lectura aplanado de platos (PlatoResumen).
+
+Cada fila guarda lo que muestra el menú: datos del plato, nombre de la
+categoría e ingredientes con cantidad y unidad. Listar el menú desde aquí
+es una sola consulta sin joins; las señales de signals.py llaman a
+reconstruir() cuando cambia un plato, su receta, su categoría o un
+ingrediente que usa.
+"""
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Plato, PlatoResumen, Receta
+
+CAMPOS = ["nombre", "precio", "activo", "categoria_id", "categoria_nombre", "ingredientes", "actualizado_en"]
+
+
+def platos_con_detalle():
+    """Platos con categoría e ingredientes de la receta en 2 consultas en total."""
+    return Plato.objects.select_related("categoria").prefetch_related(
+        Prefetch("recetas", queryset=Receta.objects.select_related("ingrediente").order_by("pk"))
+    )
+
+
+def _resumen(plato):
+    return PlatoResumen(
+        plato=plato,
+        nombre=plato.nombre,
+        precio=plato.precio,
+        activo=plato.activo,
+        categoria_id=plato.categoria_id,
+        categoria_nombre=plato.categoria.nombre,
+        ingredientes=[
+            {
+                "ingrediente_id": r.ingrediente_id,
+                "nombre": r.ingrediente.nombre,
+                "cantidad": str(r.cantidad),
+                "unidad_medida": r.ingrediente.unidad_medida,
+            }
+            for r in plato.recetas.all()
+        ],
+        actualizado_en=timezone.now(),
+    )
+
+
+def reconstruir(plato_ids=None):
+    """Recalcula el resumen de los platos indicados (o de todos) con un upsert."""
+    platos = platos_con_detalle()
+    if plato_ids is not None:
+        platos = platos.filter(pk__in=list(plato_ids))
+    filas = [_resumen(p) for p in platos]
+    PlatoResumen.objects.bulk_create(
+        filas, update_conflicts=True, unique_fields=["plato"], update_fields=CAMPOS,
+    )
+    return len(filas)
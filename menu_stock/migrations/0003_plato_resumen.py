@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_resumen(apps, schema_editor):
+    Plato = apps.get_model("menu_stock", "Plato")
+    PlatoResumen = apps.get_model("menu_stock", "PlatoResumen")
+    filas = []
+    for plato in Plato.objects.select_related("categoria").prefetch_related("recetas__ingrediente"):
+        filas.append(PlatoResumen(
+            plato=plato,
+            nombre=plato.nombre,
+            precio=plato.precio,
+            activo=plato.activo,
+            categoria_id=plato.categoria_id,
+            categoria_nombre=plato.categoria.nombre,
+            ingredientes=[
+                {
+                    "ingrediente_id": r.ingrediente_id,
+                    "nombre": r.ingrediente.nombre,
+                    "cantidad": str(r.cantidad),
+                    "unidad_medida": r.ingrediente.unidad_medida,
+                }
+                for r in sorted(plato.recetas.all(), key=lambda r: r.pk)
+            ],
+        ))
+    PlatoResumen.objects.bulk_create(filas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_stock', '0002_reservas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatoResumen',
+            fields=[
+                ('plato', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='menu_stock.plato')),
+                ('nombre', models.CharField(max_length=100)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('activo', models.BooleanField(default=True)),
+                ('categoria_id', models.IntegerField()),
+                ('categoria_nombre', models.CharField(max_length=100)),
+                ('ingredientes', models.JSONField(default=list)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
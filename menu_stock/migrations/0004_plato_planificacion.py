@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_stock', '0003_plato_resumen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plato',
+            name='estacion',
+            field=models.CharField(default='cocina', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='plato',
+            name='tiempo_preparacion',
+            field=models.PositiveIntegerField(default=15),
+        ),
+    ]
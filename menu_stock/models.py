@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 
 class CategoriaMenu(models.Model):
@@ -23,6 +24,9 @@ class Plato(models.Model):
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     categoria = models.ForeignKey(CategoriaMenu, on_delete=models.CASCADE)
     activo = models.BooleanField(default=True)
+    # planificación de cocina (pedidos/planificador.py)
+    tiempo_preparacion = models.PositiveIntegerField(default=15)  # minutos objetivo
+    estacion = models.CharField(max_length=30, default="cocina")  # parrilla, frio, ...
 
     def __str__(self):
         return self.nombre
@@ -32,3 +36,45 @@ class Receta(models.Model):
     plato = models.ForeignKey(Plato, related_name="recetas", on_delete=models.CASCADE)
     ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE)
     cantidad = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+class Reserva(models.Model):
+    """Reserva de stock de un lote de líneas (pedido, plato, cantidad)."""
+    class Estado(models.TextChoices):
+        RESERVADA = "RESERVADA", "Reservada"
+        CONFIRMADA = "CONFIRMADA", "Confirmada"
+        LIBERADA = "LIBERADA", "Liberada"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    estado = models.CharField(max_length=12, choices=Estado.choices, default=Estado.RESERVADA)
+    lineas = models.JSONField(default=list)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Reserva {self.id} ({self.estado})"
+
+
+class ReservaIngrediente(models.Model):
+    """Cantidad descontada de un ingrediente por una reserva (demanda agregada)."""
+    reserva = models.ForeignKey(Reserva, related_name="ingredientes", on_delete=models.CASCADE)
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.PROTECT)
+    cantidad = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+class PlatoResumen(models.Model):
+    """
+    Modelo de lectura aplanado: un plato con su categoría y su lista de
+    ingredientes ya calculada. Lo mantiene menu_stock/lectura.py.
+    """
+    plato = models.OneToOneField(Plato, primary_key=True, related_name="resumen", on_delete=models.CASCADE)
+    nombre = models.CharField(max_length=100)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    activo = models.BooleanField(default=True)
+    categoria_id = models.IntegerField()
+    categoria_nombre = models.CharField(max_length=100)
+    ingredientes = models.JSONField(default=list)  # [{"ingrediente_id", "nombre", "cantidad", "unidad_medida"}]
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumen {self.nombre}"
@@ -0,0 +1,115 @@
+"""
+Reserva de stock por lotes contra Ingrediente.
+
+Una reserva recibe muchas líneas (pedido, plato, cantidad), agrega la
+demanda de ingredientes de todas las recetas y la descuenta de una vez:
+todo o nada, dentro de una transacción y con las filas de Ingrediente
+bloqueadas. Después se puede liberar (devuelve el stock) o confirmar.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .cache import invalidar
+from .disponibilidad import refrescar_ingredientes
+from .models import Ingrediente, Plato, Receta, Reserva, ReservaIngrediente
+
+
+class PlatoInexistente(Exception):
+    pass
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltantes):
+        super().__init__("Stock insuficiente.")
+        self.faltantes = faltantes
+
+
+def demanda_por_ingrediente(lineas):
+    """{ingrediente_id: cantidad total} para las líneas, con una sola consulta de recetas."""
+    por_plato = defaultdict(int)
+    for linea in lineas:
+        por_plato[int(linea["plato_id"])] += int(linea.get("cantidad", 1))
+
+    existentes = set(Plato.objects.filter(pk__in=por_plato).values_list("pk", flat=True))
+    faltan = set(por_plato) - existentes
+    if faltan:
+        raise PlatoInexistente(f"Plato no existe: {sorted(faltan)}")
+
+    demanda = defaultdict(Decimal)
+    recetas = Receta.objects.filter(plato_id__in=por_plato).values_list(
+        "plato_id", "ingrediente_id", "cantidad"
+    )
+    for plato_id, ingrediente_id, cantidad in recetas:
+        demanda[ingrediente_id] += cantidad * por_plato[plato_id]
+    return dict(demanda)
+
+
+def reservar(lineas):
+    """Reserva todas las líneas o ninguna. Lanza StockInsuficiente / PlatoInexistente."""
+    with transaction.atomic():
+        demanda = demanda_por_ingrediente(lineas)
+        disponibles = dict(
+            Ingrediente.objects.select_for_update()
+            .filter(pk__in=demanda)
+            .order_by("pk")
+            .values_list("pk", "cantidad_disponible")
+        )
+        faltantes = {
+            ing: {"requerido": str(cant), "disponible": str(disponibles.get(ing, 0))}
+            for ing, cant in demanda.items()
+            if disponibles.get(ing, 0) < cant
+        }
+        if faltantes:
+            raise StockInsuficiente(faltantes)
+
+        if demanda:
+            _ajustar(demanda, signo=-1)
+        reserva = Reserva.objects.create(lineas=[dict(l) for l in lineas])
+        ReservaIngrediente.objects.bulk_create(
+            ReservaIngrediente(reserva=reserva, ingrediente_id=ing, cantidad=cant)
+            for ing, cant in demanda.items()
+        )
+    reserva.demanda = demanda
+    return reserva
+
+
+def liberar(reserva_id):
+    """Devuelve el stock de una reserva RESERVADA. Idempotente."""
+    with transaction.atomic():
+        reserva = Reserva.objects.select_for_update().get(pk=reserva_id)
+        if reserva.estado == Reserva.Estado.RESERVADA:
+            demanda = dict(reserva.ingredientes.values_list("ingrediente_id", "cantidad"))
+            if demanda:
+                _ajustar(demanda, signo=1)
+            reserva.estado = Reserva.Estado.LIBERADA
+            reserva.save(update_fields=["estado", "actualizado_en"])
+    return reserva
+
+
+def confirmar(reserva_id):
+    """Deja el descuento como definitivo. Idempotente; no se puede confirmar una liberada."""
+    with transaction.atomic():
+        reserva = Reserva.objects.select_for_update().get(pk=reserva_id)
+        if reserva.estado == Reserva.Estado.RESERVADA:
+            reserva.estado = Reserva.Estado.CONFIRMADA
+            reserva.save(update_fields=["estado", "actualizado_en"])
+    return reserva
+
+
+def _ajustar(demanda, signo):
+    """Un único UPDATE ... SET cantidad_disponible = cantidad_disponible ± CASE id ... END."""
+    delta = Case(
+        *[When(pk=ing, then=Value(cant)) for ing, cant in demanda.items()],
+        output_field=Ingrediente._meta.get_field("cantidad_disponible"),
+    )
+    nuevo = F("cantidad_disponible") - delta if signo < 0 else F("cantidad_disponible") + delta
+    Ingrediente.objects.filter(pk__in=demanda).update(cantidad_disponible=nuevo)
+    invalidar("ingredientes")
+    ids = list(demanda)
+    transaction.on_commit(lambda: refrescar_ingredientes(ids))
+    if signo < 0 and Ingrediente.objects.filter(pk__in=demanda, cantidad_disponible__lt=0).exists():
+        # otro proceso descontó entre la lectura y el UPDATE: se revierte todo
+        raise StockInsuficiente({})
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import CategoriaMenu, Ingrediente, Plato, Receta
+from .models import CategoriaMenu, Ingrediente, Plato, PlatoResumen, Receta
 
 class CategoriaMenuSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,3 +25,17 @@ class PlatoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Plato
         fields = "__all__"
+
+
+class PlatoResumenSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="plato_id", read_only=True)
+
+    class Meta:
+        model = PlatoResumen
+        fields = ["id", "nombre", "precio", "activo", "categoria_id", "categoria_nombre", "ingredientes"]
+
+
+class LineaReservaSerializer(serializers.Serializer):
+    pedido_id = serializers.CharField(required=False, allow_blank=True)
+    plato_id = serializers.IntegerField()
+    cantidad = serializers.IntegerField(min_value=1, default=1)
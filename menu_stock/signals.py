@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache, lectura
+from .disponibilidad import motor
+from .models import CategoriaMenu, Ingrediente, Plato, Receta
+
+
+def _reconstruir_al_confirmar(plato_ids):
+    ids = list(plato_ids)
+    if ids:
+        transaction.on_commit(lambda: lectura.reconstruir(ids))
+
+
+@receiver(post_save, sender=Plato)
+def plato_guardado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reconstruir_al_confirmar([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Receta)
+def receta_cambiada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reconstruir_al_confirmar([instance.plato_id])
+
+
+@receiver(post_save, sender=CategoriaMenu)
+def categoria_guardada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reconstruir_al_confirmar(instance.plato_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Ingrediente)
+def ingrediente_guardado(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # el stock (cantidad_disponible) no es parte del resumen
+    if raw or created or (update_fields and set(update_fields) <= {"cantidad_disponible"}):
+        return
+    _reconstruir_al_confirmar(
+        Receta.objects.filter(ingrediente=instance).values_list("plato_id", flat=True).distinct()
+    )
+
+
+# después de las reconstrucciones de arriba: el resumen ya está al día al invalidar
+@receiver([post_save, post_delete], sender=Plato)
+@receiver([post_save, post_delete], sender=Receta)
+@receiver([post_save, post_delete], sender=CategoriaMenu)
+@receiver([post_save, post_delete], sender=Ingrediente)
+def menu_cambiado(sender, raw=False, **kwargs):
+    if not raw:
+        cache.invalidar()
+
+
+@receiver(post_save, sender=Ingrediente)
+def stock_cambiado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cambios = {instance.pk: instance.cantidad_disponible}
+        transaction.on_commit(lambda: motor.actualizar_stock(cambios))
+
+
+@receiver(post_delete, sender=Ingrediente)
+@receiver([post_save, post_delete], sender=Plato)
+@receiver([post_save, post_delete], sender=Receta)
+def recetas_cambiadas(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(motor.invalidar)
@@ -1,3 +1,225 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .cache import metricas
+from .disponibilidad import MotorDisponibilidad, motor
+from .models import CategoriaMenu, Ingrediente, Plato, Receta, Reserva
+
+CACHE_LOCAL = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ReservaLoteTest(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        cat = CategoriaMenu.objects.create(nombre="Fondos")
+        self.pan = Ingrediente.objects.create(nombre="pan", cantidad_disponible=10, unidad_medida="u")
+        self.carne = Ingrediente.objects.create(nombre="carne", cantidad_disponible=3, unidad_medida="u")
+        self.hamb = Plato.objects.create(nombre="Hamburguesa", precio=5000, categoria=cat)
+        self.hotdog = Plato.objects.create(nombre="Hot Dog", precio=3000, categoria=cat)
+        Receta.objects.create(plato=self.hamb, ingrediente=self.pan, cantidad=1)
+        Receta.objects.create(plato=self.hamb, ingrediente=self.carne, cantidad=1)
+        Receta.objects.create(plato=self.hotdog, ingrediente=self.pan, cantidad=1)
+
+    def _reservar(self, *lineas):
+        return self.api.post(
+            "/api/menu-stock/stock/reservas/",
+            {"lineas": [{"plato_id": p.pk, "cantidad": c} for p, c in lineas]},
+            format="json",
+        )
+
+    def _stock(self):
+        self.pan.refresh_from_db()
+        self.carne.refresh_from_db()
+        return self.pan.cantidad_disponible, self.carne.cantidad_disponible
+
+    def test_reserva_agrega_demanda_y_descuenta(self):
+        r = self._reservar((self.hamb, 2), (self.hotdog, 3))
+        self.assertEqual(r.status_code, 201, r.content)
+        self.assertEqual(self._stock(), (Decimal("5"), Decimal("1")))
+        reserva = Reserva.objects.get(pk=r.json()["reserva_id"])
+        self.assertEqual(reserva.ingredientes.count(), 2)
+
+    def test_todo_o_nada(self):
+        r = self._reservar((self.hotdog, 1), (self.hamb, 4))
+        self.assertEqual(r.status_code, 409)
+        self.assertIn(str(self.carne.pk), r.json()["faltantes"])
+        self.assertEqual(self._stock(), (Decimal("10"), Decimal("3")))
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_plato_inexistente(self):
+        r = self.api.post("/api/menu-stock/stock/reservas/",
+                          {"lineas": [{"plato_id": 999}]}, format="json")
+        self.assertEqual(r.status_code, 404)
+
+    def test_cuerpo_invalido_o_vacio(self):
+        for cuerpo in ([{"plato_id": self.hamb.pk}], {"lineas": []}, {}):
+            r = self.api.post("/api/menu-stock/stock/reservas/", cuerpo, format="json")
+            self.assertEqual(r.status_code, 400, cuerpo)
+        r = self.api.post("/api/menu-stock/stock/liberar", ["x"], format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_liberar_devuelve_stock_una_sola_vez(self):
+        reserva_id = self._reservar((self.hamb, 3)).json()["reserva_id"]
+        for _ in range(2):
+            r = self.api.post("/api/menu-stock/stock/liberar", {"reserva_id": reserva_id}, format="json")
+            self.assertEqual(r.json()["estado"], "LIBERADA")
+        self.assertEqual(self._stock(), (Decimal("10"), Decimal("3")))
+
+    def test_confirmar_es_idempotente_y_no_devuelve_stock(self):
+        reserva_id = self._reservar((self.hamb, 1)).json()["reserva_id"]
+        for _ in range(2):
+            r = self.api.post("/api/menu-stock/stock/confirmar", {"reserva_id": reserva_id}, format="json")
+            self.assertEqual(r.json()["estado"], "CONFIRMADA")
+        self.api.post("/api/menu-stock/stock/liberar", {"reserva_id": reserva_id}, format="json")
+        self.assertEqual(self._stock(), (Decimal("9"), Decimal("2")))
+
+    def test_reserva_inexistente(self):
+        r = self.api.post("/api/menu-stock/stock/liberar", {"reserva_id": "no-es-uuid"}, format="json")
+        self.assertEqual(r.status_code, 404)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PlatoListadoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.cat = CategoriaMenu.objects.create(nombre="Fondos")
+        self.ingredientes = [
+            Ingrediente.objects.create(nombre=f"ing{i}", cantidad_disponible=10, unidad_medida="g")
+            for i in range(4)
+        ]
+
+    def _crear_platos(self, n, desde=0):
+        for i in range(desde, desde + n):
+            plato = Plato.objects.create(nombre=f"Plato {i}", precio=1000, categoria=self.cat)
+            for ing in self.ingredientes[:3]:
+                Receta.objects.create(plato=plato, ingrediente=ing, cantidad=2)
+
+    def test_listado_con_consultas_constantes(self):
+        # si un cambio en los serializers reintroduce N+1, este número crece con N
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_platos(3)
+        with self.assertNumQueries(2):
+            r = self.api.get("/api/menu-stock/platos/")
+        with self.captureOnCommitCallbacks(execute=True):  # invalida el caché
+            self._crear_platos(20, desde=3)
+        with self.assertNumQueries(2):
+            r = self.api.get("/api/menu-stock/platos/")
+        self.assertEqual(len(r.json()), 23)
+        self.assertEqual(r.json()[0]["recetas"][0], {"ingrediente": "ing0", "cantidad": "2.00"})
+        self.assertEqual(r.json()[0]["categoria"]["nombre"], "Fondos")
+
+    def test_resumen_una_consulta_y_se_mantiene(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_platos(5)
+        with self.assertNumQueries(1):
+            r = self.api.get("/api/menu-stock/platos/resumen/")
+        self.assertEqual(len(r.json()), 5)
+        self.assertEqual(len(r.json()[0]["ingredientes"]), 3)
+
+        plato = Plato.objects.get(nombre="Plato 0")
+        with self.captureOnCommitCallbacks(execute=True):
+            Receta.objects.filter(plato=plato).first().delete()
+            self.ingredientes[1].nombre = "harina"
+            self.ingredientes[1].save()
+            self.cat.nombre = "Principales"
+            self.cat.save()
+        resumen = self.api.get("/api/menu-stock/platos/resumen/").json()[0]
+        self.assertEqual([i["nombre"] for i in resumen["ingredientes"]], ["harina", "ing2"])
+        self.assertEqual(resumen["categoria_nombre"], "Principales")
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CacheMenuTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metricas.reiniciar()
+        self.api = APIClient()
+        self.cat = CategoriaMenu.objects.create(nombre="Fondos")
+
+    def test_acierto_sin_consultas_y_304(self):
+        r = self.api.get("/api/menu-stock/categorias/")
+        with self.assertNumQueries(0):
+            r2 = self.api.get("/api/menu-stock/categorias/", HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 304)
+        m = self.api.get("/api/menu-stock/cache/metricas/").json()["categorias"]
+        self.assertEqual((m["aciertos"], m["fallos"], m["no_modificados"]), (1, 1, 1))
+        self.assertEqual(m["hit_rate"], 0.5)
+
+    def test_senal_invalida_al_confirmar(self):
+        etag = self.api.get("/api/menu-stock/categorias/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            CategoriaMenu.objects.create(nombre="Postres")
+        r = self.api.get("/api/menu-stock/categorias/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json()), 2)
+
+    def test_reserva_invalida_ingredientes(self):
+        pan = Ingrediente.objects.create(nombre="pan", cantidad_disponible=5, unidad_medida="u")
+        plato = Plato.objects.create(nombre="Hot Dog", precio=1, categoria=self.cat)
+        Receta.objects.create(plato=plato, ingrediente=pan, cantidad=1)
+        self.api.get("/api/menu-stock/ingredientes/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post("/api/menu-stock/stock/reservas/", {"lineas": [{"plato_id": plato.pk}]}, format="json")
+        r = self.api.get("/api/menu-stock/ingredientes/")
+        self.assertEqual(r.json()[0]["cantidad_disponible"], "4.00")
+
+
+
+class MotorDisponibilidadTest(TestCase):
+    def test_incremental_solo_recalcula_afectados(self):
+        m = MotorDisponibilidad()
+        m.cargar(
+            {"pan": Decimal("10"), "carne": Decimal("3"), "queso": Decimal("1")},
+            [(1, "pan", Decimal("1")), (1, "carne", Decimal("1")), (2, "pan", Decimal("2")), (3, "queso", 2)],
+            [1, 2, 3, 4],
+        )
+        self.assertEqual(m.porciones(), {1: 3, 2: 5, 3: 0, 4: None})
+        self.assertEqual(m.actualizar_stock({"carne": Decimal("0")}), {1: 0})
+        self.assertEqual(m.actualizar_stock({"pan": Decimal("4")}), {2: 2})
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PlatosDisponiblesTest(TestCase):
+    def setUp(self):
+        motor.invalidar()
+        self.addCleanup(motor.invalidar)
+        self.api = APIClient()
+        cat = CategoriaMenu.objects.create(nombre="Fondos")
+        self.pan = Ingrediente.objects.create(nombre="pan", cantidad_disponible=4, unidad_medida="u")
+        self.carne = Ingrediente.objects.create(nombre="carne", cantidad_disponible="1.5", unidad_medida="kg")
+        self.hamb = Plato.objects.create(nombre="Hamburguesa", precio=1, categoria=cat)
+        self.hotdog = Plato.objects.create(nombre="Hot Dog", precio=1, categoria=cat)
+        Receta.objects.create(plato=self.hamb, ingrediente=self.pan, cantidad=1)
+        Receta.objects.create(plato=self.hamb, ingrediente=self.carne, cantidad="0.5")
+        Receta.objects.create(plato=self.hotdog, ingrediente=self.pan, cantidad=2)
+
+    def _porciones(self):
+        r = self.api.get("/api/menu-stock/platos/disponibles/").json()
+        return {p["id"]: p["porciones"] for p in r["platos"]}, r["agotados"]
+
+    def test_porciones_y_actualizacion_por_reserva(self):
+        self.assertEqual(self._porciones(), ({self.hamb.pk: 3, self.hotdog.pk: 2}, []))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post("/api/menu-stock/stock/reservas/",
+                          {"lineas": [{"plato_id": self.hamb.pk, "cantidad": 3}]}, format="json")
+        with self.assertNumQueries(0):  # el motor ya está al día, sin recarga
+            porciones, agotados = self._porciones()
+        self.assertEqual(porciones, {self.hamb.pk: 0, self.hotdog.pk: 0})
+        self.assertEqual(agotados, [self.hamb.pk, self.hotdog.pk])
+
+    def test_cambio_de_ingrediente_y_de_receta(self):
+        self._porciones()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.cantidad_disponible = 10
+            self.pan.save()
+        self.assertEqual(self._porciones()[0][self.hotdog.pk], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Receta.objects.filter(plato=self.hotdog).update(cantidad=5)
+            Receta.objects.filter(plato=self.hotdog).first().save()
+        self.assertEqual(self._porciones()[0][self.hotdog.pk], 2)
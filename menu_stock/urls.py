@@ -1,9 +1,21 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import CategoriaMenuViewSet, IngredienteViewSet, PlatoViewSet
+from .views import (
+    CategoriaMenuViewSet, IngredienteViewSet, PlatoViewSet,
+    cache_metricas, confirmar_reserva, liberar_reserva, reservar_lote,
+)
 
 router = DefaultRouter()
 router.register(r'categorias', CategoriaMenuViewSet)
 router.register(r'ingredientes', IngredienteViewSet)
 router.register(r'platos', PlatoViewSet)
 
-urlpatterns = router.urls
+# Mismo contrato que StockClientM1 (M1_BASE_URL=.../api/menu-stock)
+urlpatterns = [
+    path("stock/reservas/", reservar_lote, name="stock-reservas"),
+    path("stock/liberar", liberar_reserva, name="stock-liberar"),
+    path("stock/confirmar", confirmar_reserva, name="stock-confirmar"),
+    path("cache/metricas/", cache_metricas, name="menu-cache-metricas"),
+]
+
+urlpatterns += router.urls
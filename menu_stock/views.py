@@ -1,15 +1,109 @@
-from rest_framework import viewsets
-from .models import CategoriaMenu, Ingrediente, Plato
-from .serializers import CategoriaMenuSerializer, IngredienteSerializer, PlatoSerializer
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import status, viewsets
+from rest_framework.decorators import action, api_view
+from rest_framework.response import Response
 
-class CategoriaMenuViewSet(viewsets.ModelViewSet):
+from . import lectura, reservas
+from .disponibilidad import porciones_actuales
+from .cache import ListadoCacheadoMixin, metricas as metricas_cache, respuesta_cacheada
+from .models import CategoriaMenu, Ingrediente, PlatoResumen, Reserva
+from .serializers import (
+    CategoriaMenuSerializer, IngredienteSerializer, LineaReservaSerializer,
+    PlatoResumenSerializer, PlatoSerializer,
+)
+
+class CategoriaMenuViewSet(ListadoCacheadoMixin, viewsets.ModelViewSet):
+    cache_clave = "categorias"
     queryset = CategoriaMenu.objects.all()
     serializer_class = CategoriaMenuSerializer
 
-class IngredienteViewSet(viewsets.ModelViewSet):
+class IngredienteViewSet(ListadoCacheadoMixin, viewsets.ModelViewSet):
+    cache_clave = "ingredientes"
     queryset = Ingrediente.objects.all()
     serializer_class = IngredienteSerializer
 
-class PlatoViewSet(viewsets.ModelViewSet):
-    queryset = Plato.objects.all()
+class PlatoViewSet(ListadoCacheadoMixin, viewsets.ModelViewSet):
+    cache_clave = "platos"
+    # categoría y recetas->ingrediente precargadas: el listado usa 2 consultas sin importar N
+    queryset = lectura.platos_con_detalle()
     serializer_class = PlatoSerializer
+
+    @action(detail=False, methods=["get"])
+    def resumen(self, request):
+        """Menú aplanado desde PlatoResumen (una consulta, sin joins)."""
+        qs = PlatoResumen.objects.order_by("plato_id")
+        if request.accepted_renderer.format != "json":
+            return Response(PlatoResumenSerializer(qs, many=True).data)
+        return respuesta_cacheada(
+            request, "platos_resumen", lambda: PlatoResumenSerializer(qs, many=True).data
+        )
+
+    @action(detail=False, methods=["get"])
+    def disponibles(self, request):
+        """
+        Porciones que se pueden preparar ahora de cada plato activo, según el
+        stock de ingredientes y las recetas. porciones=null: plato sin receta.
+        """
+        porciones = porciones_actuales()
+        return Response({
+            "platos": [{"id": pid, "porciones": n} for pid, n in sorted(porciones.items())],
+            "agotados": sorted(pid for pid, n in porciones.items() if n == 0),
+        })
+
+
+@api_view(["GET"])
+def cache_metricas(request):
+    """Aciertos, fallos, 304 y hit rate del caché del menú (por proceso)."""
+    return Response(metricas_cache.snapshot())
+
+
+@api_view(["POST"])
+def reservar_lote(request):
+    """
+    Valida y reserva el stock de muchas líneas en una sola llamada (todo o nada).
+    body: {"lineas": [{"pedido_id": "...", "plato_id": 1, "cantidad": 2}, ...]}
+    """
+    if not isinstance(request.data, dict):
+        return Response({"detail": "Se espera un objeto JSON."}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = LineaReservaSerializer(data=request.data.get("lineas", []), many=True, allow_empty=False)
+    serializer.is_valid(raise_exception=True)
+    try:
+        reserva = reservas.reservar(serializer.validated_data)
+    except reservas.PlatoInexistente as e:
+        return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except reservas.StockInsuficiente as e:
+        return Response(
+            {"ok": False, "detail": str(e), "faltantes": e.faltantes},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(
+        {
+            "ok": True,
+            "reserva_id": str(reserva.id),
+            "demanda": {str(k): str(v) for k, v in reserva.demanda.items()},
+        },
+        status=status.HTTP_201_CREATED,
+    )
+
+
+def _accion_reserva(request, accion):
+    reserva_id = request.data.get("reserva_id") if isinstance(request.data, dict) else None
+    if not reserva_id:
+        return Response({"detail": "reserva_id requerido."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        reserva = accion(reserva_id)
+    except (Reserva.DoesNotExist, DjangoValidationError):
+        return Response({"detail": "Reserva no existe."}, status=status.HTTP_404_NOT_FOUND)
+    return Response({"ok": True, "reserva_id": str(reserva.id), "estado": reserva.estado})
+
+
+@api_view(["POST"])
+def liberar_reserva(request):
+    """Libera una reserva y devuelve su stock. body: {"reserva_id": "..."}"""
+    return _accion_reserva(request, reservas.liberar)
+
+
+@api_view(["POST"])
+def confirmar_reserva(request):
+    """Confirma el descuento de una reserva. body: {"reserva_id": "..."}"""
+    return _accion_reserva(request, reservas.confirmar)
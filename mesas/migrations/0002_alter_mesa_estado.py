@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mesas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mesa',
+            name='estado',
+            field=models.CharField(choices=[('LIBRE', 'Libre'), ('OCUPADA', 'Ocupada'), ('RESERVADA', 'Reservada')], db_index=True, default='LIBRE', max_length=10),
+        ),
+    ]
@@ -1,15 +1,28 @@
 from django.db import models
 
 class Mesa(models.Model):
+    LIBRE = 'LIBRE'
+    OCUPADA = 'OCUPADA'
+    RESERVADA = 'RESERVADA'
     ESTADOS = [
-        ('LIBRE', 'Libre'),
-        ('OCUPADA', 'Ocupada'),
-        ('RESERVADA', 'Reservada'),
+        (LIBRE, 'Libre'),
+        (OCUPADA, 'Ocupada'),
+        (RESERVADA, 'Reservada'),
     ]
 
     numero = models.PositiveIntegerField(unique=True)
     capacidad = models.PositiveIntegerField()
-    estado = models.CharField(max_length=10, choices=ESTADOS, default='LIBRE')
+    # lo mantienen los pedidos (crear -> OCUPADA, cerrar/cancelar -> LIBRE)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=LIBRE, db_index=True)
+
+    @classmethod
+    def ocupar(cls, pk):
+        return cls.objects.filter(pk=pk).update(estado=cls.OCUPADA)
+
+    @classmethod
+    def liberar(cls, pks):
+        # una mesa RESERVADA de nuevo no se toca: sólo se libera la que estaba ocupada
+        return cls.objects.filter(pk__in=list(pks), estado=cls.OCUPADA).update(estado=cls.LIBRE)
 
     def __str__(self):
         return f"Mesa {self.numero} ({self.estado})"
@@ -1,3 +1,24 @@
-from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from pedidos import ocupacion
+from pedidos.models import Pedido
+
+
+class OcupacionApiTest(APITestCase):
+    def setUp(self):
+        ocupacion.indice.invalidar()
+        self.addCleanup(ocupacion.indice.invalidar)
+
+    def test_lista_mesas_ocupadas(self):
+        p = Pedido.objects.create(mesa="3")
+        Pedido.objects.create(mesa="4", estado=Pedido.Estado.CERRADO)
+        r = self.client.get(reverse("mesas-ocupacion"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {"ocupadas": {"3": str(p.id)}})
+
+    def test_una_mesa(self):
+        p = Pedido.objects.create(mesa="3")
+        url = reverse("mesas-ocupacion")
+        self.assertEqual(self.client.get(url, {"mesa": "3"}).json(), {"mesa": "3", "pedido": str(p.id)})
+        self.assertEqual(self.client.get(url, {"mesa": "9"}).json(), {"mesa": "9", "pedido": None})
@@ -1,7 +1,13 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import MesaViewSet
+from .views import MesaViewSet, ocupacion
 
 router = DefaultRouter()
 router.register(r'', MesaViewSet)
 
-urlpatterns = router.urls
+# antes que las rutas del router: "ocupacion/" calzaría como {pk}/
+urlpatterns = [
+    path("ocupacion/", ocupacion, name="mesas-ocupacion"),
+]
+
+urlpatterns += router.urls
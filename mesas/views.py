@@ -1,7 +1,25 @@
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
+
+from pedidos import ocupacion as indice_ocupacion
+
 from .models import Mesa
 from .serializers import MesaSerializer
 
 class MesaViewSet(ModelViewSet):
     queryset = Mesa.objects.all().order_by("numero")
     serializer_class = MesaSerializer
+
+
+@api_view(["GET"])
+def ocupacion(request):
+    """
+    Mesas con un pedido activo, desde el índice de ocupación (sin leer pedidos).
+    GET /api/mesas/ocupacion/          -> {"ocupadas": {"<mesa>": "<pedido_id>", ...}}
+    GET /api/mesas/ocupacion/?mesa=3   -> {"mesa": "3", "pedido": "<pedido_id>" | null}
+    """
+    mesa = request.query_params.get("mesa")
+    if mesa:
+        return Response({"mesa": mesa, "pedido": indice_ocupacion.pedido_activo(mesa)})
+    return Response({"ocupadas": indice_ocupacion.ocupacion_actual()})
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MockConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mock'
+
+    def ready(self):
+        # el catálogo indexado del menú se arma una vez al arrancar
+        from .catalogo import publicar_menu
+        from .views import MENU
+
+        publicar_menu(MENU)
@@ -0,0 +1,70 @@
+"""
+Catálogo indexado e inmutable del menú del mock.
+
+Se construye una vez a partir de la lista MENU:
+- por_id: plato_id -> plato (búsqueda O(1) en vez de recorrer la lista)
+- por_ingrediente: ingrediente -> platos que lo usan (índice inverso)
+- menu_json / etag: la respuesta de GET /mock/menu/ ya serializada
+
+Nadie modifica un catálogo publicado: cuando el menú cambia se arma uno
+nuevo y se reemplaza la referencia de una vez (publicar_menu), así cada
+request ve el catálogo viejo o el nuevo completo, nunca uno a medias.
+"""
+import hashlib
+import json
+import threading
+from types import MappingProxyType
+
+
+class Catalogo:
+    __slots__ = ("por_id", "por_ingrediente", "menu_json", "etag")
+
+    def __init__(self, menu):
+        por_id = {}
+        por_ingrediente = {}
+        for p in menu:
+            plato = MappingProxyType({
+                "id": p["id"],
+                "nombre": p["nombre"],
+                "ingredientes": MappingProxyType(dict(p["ingredientes"])),
+            })
+            por_id[p["id"]] = plato
+            for ing in plato["ingredientes"]:
+                por_ingrediente.setdefault(ing, []).append(p["id"])
+
+        self.por_id = MappingProxyType(por_id)
+        self.por_ingrediente = MappingProxyType(
+            {ing: frozenset(ids) for ing, ids in por_ingrediente.items()}
+        )
+        cuerpo = {"platos": [{"codigo": p["id"], "nombre": p["nombre"]} for p in menu]}
+        self.menu_json = json.dumps(cuerpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"%s"' % hashlib.sha1(self.menu_json).hexdigest()
+
+    def plato(self, plato_id):
+        return self.por_id.get(plato_id)
+
+    def platos_con(self, ingrediente):
+        """Platos que dejan de poder prepararse si se acaba `ingrediente`."""
+        return self.por_ingrediente.get(ingrediente, frozenset())
+
+
+_catalogo = None
+_inicio_lock = threading.Lock()
+
+
+def publicar_menu(menu):
+    """Construye un catálogo nuevo y lo deja visible para los próximos requests."""
+    global _catalogo
+    nuevo = Catalogo(menu)
+    _catalogo = nuevo  # cambio de referencia: atómico para los lectores
+    return nuevo
+
+
+def obtener_catalogo():
+    if _catalogo is None:  # normalmente ya lo publicó MockConfig.ready()
+        from .views import MENU
+
+        with _inicio_lock:
+            if _catalogo is None:
+                publicar_menu(MENU)
+    return _catalogo
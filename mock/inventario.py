@@ -0,0 +1,310 @@
+"""
+Motor de inventario del mock de M1.
+
+Reemplaza las verificaciones "revisar y luego descontar" sobre el dict
+INVENTARIO, que con varios hilos podían dejar el stock en negativo y que
+cada worker tenía por separado.
+
+- InventarioMemoria: un lock protege stock y reservas (un solo proceso).
+- InventarioSQLite: tabla en un archivo SQLite compartido por todos los
+  workers; cada reserva es una transacción BEGIN IMMEDIATE, así que sólo
+  un escritor verifica y descuenta a la vez.
+
+Ambos llevan un libro de reservas con vencimiento: una reserva que no se
+confirma ni se libera antes de `ttl` segundos devuelve su stock sola.
+"""
+import heapq
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+RESERVADA = "RESERVADA"
+CONFIRMADA = "CONFIRMADA"
+LIBERADA = "LIBERADA"
+EXPIRADA = "EXPIRADA"
+
+
+class SinStock(Exception):
+    def __init__(self, faltantes):
+        super().__init__("Stock insuficiente")
+        self.faltantes = faltantes
+
+
+class ReservaInexistente(KeyError):
+    pass
+
+
+def _faltantes(demanda, disponible):
+    return {
+        ing: {"requerido": cant, "disponible": disponible.get(ing, 0)}
+        for ing, cant in demanda.items()
+        if disponible.get(ing, 0) < cant
+    }
+
+
+class InventarioMemoria:
+    def __init__(self, inicial, ttl=300, reloj=time.time):
+        self.ttl = ttl
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._stock = dict(inicial)
+        self._reservas = {}
+        self._vencimientos = []  # heap de (expira_en, reserva_id)
+
+    def reservar(self, demanda, ttl=None):
+        """Descuenta toda la demanda o nada. Devuelve el id de la reserva."""
+        with self._lock:
+            self._expirar()
+            faltantes = _faltantes(demanda, self._stock)
+            if faltantes:
+                raise SinStock(faltantes)
+            for ing, cant in demanda.items():
+                self._stock[ing] -= cant
+            reserva_id = str(uuid.uuid4())
+            expira_en = self._reloj() + (self.ttl if ttl is None else ttl)
+            self._reservas[reserva_id] = {"estado": RESERVADA, "demanda": dict(demanda)}
+            heapq.heappush(self._vencimientos, (expira_en, reserva_id))
+            return reserva_id
+
+    def liberar(self, reserva_id):
+        with self._lock:
+            reserva = self._reserva(reserva_id)
+            if reserva["estado"] == RESERVADA:
+                self._devolver(reserva, LIBERADA)
+            return reserva["estado"]
+
+    def confirmar(self, reserva_id):
+        with self._lock:
+            self._expirar()
+            reserva = self._reserva(reserva_id)
+            if reserva["estado"] == RESERVADA:
+                reserva["estado"] = CONFIRMADA
+            return reserva["estado"]
+
+    def reponer(self, demanda):
+        with self._lock:
+            for ing, cant in demanda.items():
+                self._stock[ing] = self._stock.get(ing, 0) + cant
+
+    def expirar(self):
+        with self._lock:
+            return self._expirar()
+
+    def stock(self):
+        with self._lock:
+            self._expirar()
+            return dict(self._stock)
+
+    def _reserva(self, reserva_id):
+        try:
+            return self._reservas[reserva_id]
+        except KeyError:
+            raise ReservaInexistente(reserva_id) from None
+
+    def _devolver(self, reserva, estado):
+        for ing, cant in reserva["demanda"].items():
+            self._stock[ing] = self._stock.get(ing, 0) + cant
+        reserva["estado"] = estado
+
+    def _expirar(self):
+        ahora = self._reloj()
+        vencidas = 0
+        while self._vencimientos and self._vencimientos[0][0] <= ahora:
+            _, reserva_id = heapq.heappop(self._vencimientos)
+            reserva = self._reservas.get(reserva_id)
+            if reserva and reserva["estado"] == RESERVADA:
+                self._devolver(reserva, EXPIRADA)
+                vencidas += 1
+        return vencidas
+
+
+class InventarioSQLite:
+    ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS stock (
+        ingrediente TEXT PRIMARY KEY,
+        cantidad INTEGER NOT NULL CHECK (cantidad >= 0)
+    );
+    CREATE TABLE IF NOT EXISTS reserva (
+        id TEXT PRIMARY KEY,
+        estado TEXT NOT NULL,
+        demanda TEXT NOT NULL,
+        expira_en REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS reserva_pendiente_idx ON reserva (estado, expira_en);
+    """
+
+    def __init__(self, ruta, inicial, ttl=300, reloj=time.time):
+        self.ruta = ruta
+        self.ttl = ttl
+        self._reloj = reloj
+        self._local = threading.local()
+        con = self._conexion()
+        con.executescript(self.ESQUEMA)
+        # sólo el primer proceso que crea la tabla carga el stock inicial
+        with self._escritura() as con:
+            con.executemany(
+                "INSERT OR IGNORE INTO stock (ingrediente, cantidad) VALUES (?, ?)",
+                inicial.items(),
+            )
+
+    def _conexion(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _escritura(self):
+        return _TransaccionInmediata(self._conexion())
+
+    def reservar(self, demanda, ttl=None):
+        """Descuenta toda la demanda o nada. Devuelve el id de la reserva."""
+        with self._escritura() as con:
+            self._expirar(con)
+            disponible = self._leer(con, demanda)
+            faltantes = _faltantes(demanda, disponible)
+            if faltantes:
+                raise SinStock(faltantes)
+            con.executemany(
+                "UPDATE stock SET cantidad = cantidad - ? WHERE ingrediente = ?",
+                [(cant, ing) for ing, cant in demanda.items()],
+            )
+            reserva_id = str(uuid.uuid4())
+            expira_en = self._reloj() + (self.ttl if ttl is None else ttl)
+            con.execute(
+                "INSERT INTO reserva (id, estado, demanda, expira_en) VALUES (?, ?, ?, ?)",
+                (reserva_id, RESERVADA, json.dumps(demanda), expira_en),
+            )
+            return reserva_id
+
+    def liberar(self, reserva_id):
+        with self._escritura() as con:
+            estado, demanda = self._reserva(con, reserva_id)
+            if estado == RESERVADA:
+                self._devolver(con, reserva_id, demanda, LIBERADA)
+                estado = LIBERADA
+            return estado
+
+    def confirmar(self, reserva_id):
+        with self._escritura() as con:
+            self._expirar(con)
+            estado, _ = self._reserva(con, reserva_id)
+            if estado == RESERVADA:
+                con.execute("UPDATE reserva SET estado = ? WHERE id = ?", (CONFIRMADA, reserva_id))
+                estado = CONFIRMADA
+            return estado
+
+    def reponer(self, demanda):
+        with self._escritura() as con:
+            self._sumar(con, demanda)
+
+    def expirar(self):
+        with self._escritura() as con:
+            return self._expirar(con)
+
+    def stock(self):
+        with self._escritura() as con:
+            self._expirar(con)
+            return dict(con.execute("SELECT ingrediente, cantidad FROM stock"))
+
+    def restablecer(self, inicial):
+        """Vuelve al stock inicial y borra el libro de reservas (tests / demo)."""
+        with self._escritura() as con:
+            con.execute("DELETE FROM reserva")
+            con.execute("DELETE FROM stock")
+            con.executemany("INSERT INTO stock (ingrediente, cantidad) VALUES (?, ?)", inicial.items())
+
+    def cerrar(self):
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+    @staticmethod
+    def _leer(con, demanda):
+        marcas = ",".join("?" * len(demanda))
+        return dict(con.execute(
+            f"SELECT ingrediente, cantidad FROM stock WHERE ingrediente IN ({marcas})",
+            list(demanda),
+        ))
+
+    @staticmethod
+    def _reserva(con, reserva_id):
+        fila = con.execute("SELECT estado, demanda FROM reserva WHERE id = ?", (reserva_id,)).fetchone()
+        if fila is None:
+            raise ReservaInexistente(reserva_id)
+        return fila[0], json.loads(fila[1])
+
+    @staticmethod
+    def _sumar(con, demanda):
+        con.executemany(
+            "INSERT INTO stock (ingrediente, cantidad) VALUES (?, ?) "
+            "ON CONFLICT (ingrediente) DO UPDATE SET cantidad = cantidad + excluded.cantidad",
+            demanda.items(),
+        )
+
+    def _devolver(self, con, reserva_id, demanda, estado):
+        self._sumar(con, demanda)
+        con.execute("UPDATE reserva SET estado = ? WHERE id = ?", (estado, reserva_id))
+
+    def _expirar(self, con):
+        vencidas = con.execute(
+            "SELECT id, demanda FROM reserva WHERE estado = ? AND expira_en <= ?",
+            (RESERVADA, self._reloj()),
+        ).fetchall()
+        for reserva_id, demanda in vencidas:
+            self._devolver(con, reserva_id, json.loads(demanda), EXPIRADA)
+        return len(vencidas)
+
+
+class _TransaccionInmediata:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: toma el lock de escritura al empezar."""
+
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        self.con.execute("BEGIN IMMEDIATE")
+        return self.con
+
+    def __exit__(self, tipo, *exc):
+        if tipo is None:
+            self.con.execute("COMMIT")
+        elif self.con.in_transaction:  # SQLite pudo haber revertido ya por su cuenta
+            self.con.execute("ROLLBACK")
+        return False
+
+
+_inventario = None
+_inventario_lock = threading.Lock()
+
+
+def obtener_inventario():
+    """Inventario del proceso según settings.MOCK_INVENTARIO_BACKEND."""
+    global _inventario
+    with _inventario_lock:
+        if _inventario is None:
+            from django.conf import settings
+
+            from .views import INVENTARIO
+
+            if settings.MOCK_INVENTARIO_BACKEND == "memoria":
+                _inventario = InventarioMemoria(INVENTARIO, ttl=settings.MOCK_RESERVA_TTL)
+            else:
+                _inventario = InventarioSQLite(
+                    settings.MOCK_INVENTARIO_PATH, INVENTARIO, ttl=settings.MOCK_RESERVA_TTL
+                )
+        return _inventario
+
+
+def reiniciar_inventario():
+    """Olvida el inventario actual; el próximo uso lo vuelve a crear (tests / cambio de config)."""
+    global _inventario
+    with _inventario_lock:
+        if isinstance(_inventario, InventarioSQLite):
+            _inventario.cerrar()
+        _inventario = None
@@ -1,3 +1,180 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import catalogo, views
+from .inventario import (
+    CONFIRMADA, EXPIRADA, LIBERADA, InventarioMemoria, InventarioSQLite,
+    SinStock, reiniciar_inventario,
+)
+
+
+class RelojFalso:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+class _InventarioCasos:
+    """Casos comunes a los dos backends; `crear(inicial, reloj)` los instancia."""
+
+    def test_reserva_todo_o_nada(self):
+        inv = self.crear({"pan": 2, "carne": 1})
+        with self.assertRaises(SinStock) as ctx:
+            inv.reservar({"pan": 1, "carne": 2})
+        self.assertEqual(list(ctx.exception.faltantes), ["carne"])
+        self.assertEqual(inv.stock(), {"pan": 2, "carne": 1})
+
+    def test_liberar_y_confirmar_idempotentes(self):
+        inv = self.crear({"pan": 2})
+        a, b = inv.reservar({"pan": 1}), inv.reservar({"pan": 1})
+        self.assertEqual(inv.liberar(a), LIBERADA)
+        self.assertEqual(inv.liberar(a), LIBERADA)
+        self.assertEqual(inv.confirmar(b), CONFIRMADA)
+        self.assertEqual(inv.liberar(b), CONFIRMADA)
+        self.assertEqual(inv.stock(), {"pan": 1})
+
+    def test_reserva_abandonada_vence(self):
+        reloj = RelojFalso()
+        inv = self.crear({"pan": 1}, reloj)
+        reserva_id = inv.reservar({"pan": 1}, ttl=60)
+        self.assertRaises(SinStock, inv.reservar, {"pan": 1})
+        reloj.ahora += 61
+        self.assertEqual(inv.stock(), {"pan": 1})
+        self.assertEqual(inv.confirmar(reserva_id), EXPIRADA)
+
+    def test_sin_sobreventa_con_10k_reservas_concurrentes(self):
+        stock = 1000
+        inv = self.crear({"pan": stock, "carne": stock * 2})
+
+        def intentar(_):
+            try:
+                inv.reservar({"pan": 1, "carne": 2})
+                return True
+            except SinStock:
+                return False
+
+        with ThreadPoolExecutor(max_workers=32) as ex:
+            exitos = sum(ex.map(intentar, range(10_000)))
+        self.assertEqual(exitos, stock)
+        self.assertEqual(inv.stock(), {"pan": 0, "carne": 0})
+
+
+class InventarioMemoriaTest(_InventarioCasos, SimpleTestCase):
+    def crear(self, inicial, reloj=None):
+        return InventarioMemoria(inicial, reloj=reloj or RelojFalso())
+
+
+class InventarioSQLiteTest(_InventarioCasos, SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.ruta = os.path.join(tmp.name, "inventario.sqlite3")
+
+    def crear(self, inicial, reloj=None):
+        return InventarioSQLite(self.ruta, inicial, reloj=reloj or RelojFalso())
+
+    def test_instancias_comparten_stock(self):
+        # dos "workers" abren el mismo archivo: el segundo no recarga el stock inicial
+        a = self.crear({"pan": 1})
+        b = self.crear({"pan": 1})
+        a.reservar({"pan": 1})
+        self.assertRaises(SinStock, b.reservar, {"pan": 1})
+
+
+class MockReservaLoteTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        ajustes = override_settings(
+            MOCK_INVENTARIO_BACKEND="sqlite",
+            MOCK_INVENTARIO_PATH=os.path.join(tmp.name, "inventario.sqlite3"),
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        reiniciar_inventario()
+        self.addCleanup(reiniciar_inventario)
+
+    def _post(self, ruta, data):
+        return self.client.post(f"/mock/{ruta}", json.dumps(data), content_type="application/json")
+
+    def _stock(self):
+        return self.client.get("/mock/stock/estado/").json()["inventario"]
+
+    def test_reserva_lote_descuenta_todo(self):
+        r = self._post("stock/reservas/", {"lineas": [
+            {"plato_id": "HAMB_CARNE", "cantidad": 2}, {"plato_id": "HOTDOG", "cantidad": 1},
+        ]})
+        self.assertEqual(r.status_code, 201)
+        stock = self._stock()
+        self.assertEqual(stock["pan"], views.INVENTARIO["pan"] - 3)
+        self.assertEqual(stock["carne"], views.INVENTARIO["carne"] - 2)
+
+    def test_sin_stock_no_descuenta_nada(self):
+        r = self._post("stock/reservas/", {"lineas": [
+            {"plato_id": "HOTDOG", "cantidad": 1},
+            {"plato_id": "HAMB_CARNE", "cantidad": views.INVENTARIO["carne"] + 1},
+        ]})
+        self.assertEqual(r.status_code, 409)
+        self.assertIn("carne", r.json()["faltantes"])
+        self.assertEqual(self._stock(), views.INVENTARIO)
+
+    def test_rechaza_cantidades_y_lineas_invalidas(self):
+        for cuerpo in (
+            {"lineas": [{"plato_id": "FIDEOS_CARNE", "cantidad": -500}]},
+            {"lineas": [{"plato_id": "FIDEOS_CARNE", "cantidad": 0}]},
+            {"lineas": ["x"]},
+            {"lineas": []},
+        ):
+            self.assertEqual(self._post("stock/reservas/", cuerpo).status_code, 400)
+        for cuerpo in (["x"], {"items": [{"plato_id": "HOTDOG", "cantidad": -1}]}, {"items": ["x"]}):
+            self.assertEqual(self._post("validar-reservar/", cuerpo).status_code, 400)
+        self.assertEqual(self._stock(), views.INVENTARIO)
+
+    def test_liberar_y_confirmar_idempotentes(self):
+        reserva_id = self._post("stock/reservas/", {"lineas": [{"plato_id": "ENSALADA"}]}).json()["reserva_id"]
+        self.assertEqual(self._post("stock/liberar", {"reserva_id": reserva_id}).json()["estado"], "LIBERADA")
+        self._post("stock/liberar", {"reserva_id": reserva_id})
+        self.assertEqual(self._stock()["lechuga"], views.INVENTARIO["lechuga"])
+        self.assertEqual(self._post("stock/confirmar", {"reserva_id": reserva_id}).json()["estado"], "LIBERADA")
+
+    def test_validar_reservar_devuelve_reserva_liberable(self):
+        r = self._post("validar-reservar/", {"plato_id": "HOTDOG"})
+        self.assertEqual(self._stock()["pan"], views.INVENTARIO["pan"] - 1)
+        self._post("liberar/", {"reserva_id": r.json()["reserva_id"]})
+        self.assertEqual(self._stock()["pan"], views.INVENTARIO["pan"])
+
+
+class CatalogoTest(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(catalogo.publicar_menu, views.MENU)
+
+    def test_indices(self):
+        cat = catalogo.Catalogo(views.MENU)
+        self.assertEqual(cat.plato("HOTDOG")["ingredientes"], {"pan": 1})
+        self.assertIsNone(cat.plato("NO_EXISTE"))
+        self.assertEqual(cat.platos_con("carne"), {"HAMB_CARNE", "FIDEOS_CARNE"})
+        with self.assertRaises(TypeError):
+            cat.plato("HOTDOG")["ingredientes"]["pan"] = 5
+
+    def test_menu_etag_y_304(self):
+        r = self.client.get("/mock/menu/")
+        self.assertEqual(len(r.json()["platos"]), len(views.MENU))
+        r2 = self.client.get("/mock/menu/", HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 304)
+
+    def test_publicar_menu_reemplaza_catalogo(self):
+        etag = self.client.get("/mock/menu/")["ETag"]
+        catalogo.publicar_menu(views.MENU + [
+            {"id": "TACO", "nombre": "Taco", "ingredientes": {"carne": 1, "queso": 1}},
+        ])
+        r = self.client.get("/mock/menu/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r["ETag"], etag)
+        afectados = self.client.get("/mock/menu/afectados/", {"ingrediente": "carne"}).json()
+        self.assertEqual(afectados["platos"], ["FIDEOS_CARNE", "HAMB_CARNE", "TACO"])
@@ -6,8 +6,14 @@ app_name = "mock"
 
 urlpatterns = [
     path("menu/",                 views.menu,               name="menu"),
+    path("menu/afectados/",       views.menu_afectados,     name="menu_afectados"),
     path("stock/estado/",         views.stock_estado,       name="stock_estado"),
     path("validar-reservar/",     views.validar_reservar,   name="validar_reservar"),
+    path("stock/validar-reservar", views.validar_reservar,  name="stock_validar_reservar"),
     path("liberar/",              views.liberar,            name="liberar"),
+    path("stock/reservas/",       views.reservar_lote,      name="stock_reservas"),
+    path("stock/liberar",         views.liberar_reserva,    name="stock_liberar"),
+    path("stock/confirmar",       views.confirmar_reserva,  name="stock_confirmar"),
+    path("cocina/pedidos",        views.cocina_recibir_pedido, name="cocina_pedidos"),
     path("cocina/pedido-listo/",  views.cocina_pedido_listo, name="cocina_pedido_listo"),
 ]
@@ -1,10 +1,15 @@
 # mock/views.py
 import json
-import requests
-from django.http import JsonResponse
+import uuid
+from collections import defaultdict
+
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-# --- inventario demo ---
+from .catalogo import obtener_catalogo
+from .inventario import ReservaInexistente, SinStock, obtener_inventario
+
+# --- inventario demo (stock inicial del motor de mock/inventario.py) ---
 INVENTARIO = {
     "pan": 100, "lechuga": 120, "tomate": 120, "cebolla": 100,
     "carne": 80, "pollo": 80, "queso": 90, "papas": 150,
@@ -28,100 +33,200 @@ MENU = [
 ]
 
 def _buscar_plato(pid):
-    for p in MENU:
-        if p["id"] == pid:
-            return p
-    return None
-
-def _api_base(request) -> str:
-    return request.build_absolute_uri("/").rstrip("/")
-
-def _abs(request, path: str) -> str:
-    if not path.startswith("/"):
-        path = "/" + path
-    return f"{_api_base(request)}{path}"
-
-def _ensure_slash(url: str) -> str:
-    return url if url.endswith("/") else url + "/"
+    return obtener_catalogo().plato(pid)
 
 # --------- endpoints demo ----------
 def menu(request):
-    return JsonResponse({"platos": [{"codigo": p["id"], "nombre": p["nombre"]} for p in MENU]})
+    """Respuesta ya serializada del catálogo; 304 si el cliente tiene la misma versión."""
+    catalogo = obtener_catalogo()
+    if request.headers.get("If-None-Match") == catalogo.etag:
+        resp = HttpResponseNotModified()
+    else:
+        resp = HttpResponse(catalogo.menu_json, content_type="application/json")
+    resp["ETag"] = catalogo.etag
+    return resp
+
+def menu_afectados(request):
+    """Platos que no se pueden preparar si se acaba un ingrediente: ?ingrediente=carne"""
+    ingrediente = request.GET.get("ingrediente", "")
+    platos = sorted(obtener_catalogo().platos_con(ingrediente))
+    return JsonResponse({"ingrediente": ingrediente, "platos": platos})
 
 def stock_estado(request):
-    return JsonResponse({"inventario": INVENTARIO})
+    return JsonResponse({"inventario": obtener_inventario().stock()})
+
+def _leer_json(request):
+    """Cuerpo JSON como dict; None si no es JSON o no es un objeto."""
+    try:
+        data = json.loads(request.body.decode("utf-8") or "{}")
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+def _demanda(lineas):
+    """
+    Agrega los ingredientes de todas las líneas: {ingrediente: cantidad}.
+    Lanza ValueError si una línea no es un objeto o su cantidad no es >= 1.
+    """
+    demanda = defaultdict(int)
+    for linea in lineas:
+        if not isinstance(linea, dict):
+            raise ValueError("línea inválida")
+        p = _buscar_plato(linea.get("plato_id"))
+        if not p:
+            raise KeyError(linea.get("plato_id"))
+        cantidad = int(linea.get("cantidad", 1))
+        if cantidad < 1:
+            raise ValueError("cantidad inválida")
+        for ing, cant in p["ingredientes"].items():
+            demanda[ing] += cant * cantidad
+    return dict(demanda)
+
+def _sin_stock(e):
+    ing = next(iter(e.faltantes))
+    return JsonResponse(
+        {"ok": False, "detail": f"Sin stock de {ing}", "faltantes": e.faltantes}, status=409
+    )
 
 @csrf_exempt
 def validar_reservar(request):
+    """
+    Reserva el stock de un plato. Body JSON: {"plato_id": "HAMB_CARNE"}
+    o {"items": [{"plato_id": ..., "cantidad": ...}]} (formato de StockClientM1).
+    """
     if request.method != "POST":
         return JsonResponse({"detail": "Method not allowed"}, status=405)
-    try:
-        data = json.loads(request.body.decode("utf-8"))
-    except Exception:
+    data = _leer_json(request)
+    if data is None:
         return JsonResponse({"detail": "JSON inválido"}, status=400)
 
-    plato_id = data.get("plato_id")
-    p = _buscar_plato(plato_id)
-    if not p:
+    lineas = data.get("items") or [{"plato_id": data.get("plato_id")}]
+    try:
+        demanda = _demanda(lineas)
+    except KeyError:
         return JsonResponse({"detail": "Plato no existe"}, status=404)
+    except (TypeError, ValueError):
+        return JsonResponse({"detail": "línea o cantidad inválida"}, status=400)
 
-    for ing, cant in p["ingredientes"].items():
-        if INVENTARIO.get(ing, 0) < cant:
-            return JsonResponse({"ok": False, "detail": f"Sin stock de {ing}"}, status=409)
-
-    for ing, cant in p["ingredientes"].items():
-        INVENTARIO[ing] -= cant
-
-    return JsonResponse({"ok": True})
+    try:
+        reserva_id = obtener_inventario().reservar(demanda)
+    except SinStock as e:
+        return _sin_stock(e)
+    return JsonResponse({"ok": True, "reserva_id": reserva_id})
 
 @csrf_exempt
 def liberar(request):
+    """
+    Devuelve stock. Body JSON: {"reserva_id": "..."} (idempotente) o, como
+    antes, {"plato_id": "..."} para reponer los ingredientes de un plato.
+    """
     if request.method != "POST":
         return JsonResponse({"detail": "Method not allowed"}, status=405)
-    try:
-        data = json.loads(request.body.decode("utf-8"))
-    except Exception:
+    data = _leer_json(request)
+    if data is None:
         return JsonResponse({"detail": "JSON inválido"}, status=400)
 
-    plato_id = data.get("plato_id")
-    p = _buscar_plato(plato_id)
+    if data.get("reserva_id"):
+        return _accion_reserva(data, "liberar")
+
+    p = _buscar_plato(data.get("plato_id"))
     if not p:
         return JsonResponse({"detail": "Plato no existe"}, status=404)
+    obtener_inventario().reponer(p["ingredientes"])
+    return JsonResponse({"ok": True})
 
-    for ing, cant in p["ingredientes"].items():
-        INVENTARIO[ing] = INVENTARIO.get(ing, 0) + cant
+@csrf_exempt
+def reservar_lote(request):
+    """
+    Reserva todo o nada para muchas líneas en una llamada.
+    Body JSON: {"lineas": [{"pedido_id": "...", "plato_id": "HAMB_CARNE", "cantidad": 2}]}
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    data = _leer_json(request)
+    if data is None or not isinstance(data.get("lineas"), list):
+        return JsonResponse({"detail": "JSON inválido"}, status=400)
+    if not data["lineas"]:
+        return JsonResponse({"detail": "lineas no puede estar vacía"}, status=400)
+    try:
+        demanda = _demanda(data["lineas"])
+    except KeyError as e:
+        return JsonResponse({"detail": f"Plato no existe: {e.args[0]}"}, status=404)
+    except (TypeError, ValueError):
+        return JsonResponse({"detail": "línea o cantidad inválida"}, status=400)
 
-    return JsonResponse({"ok": True})
+    try:
+        reserva_id = obtener_inventario().reservar(demanda)
+    except SinStock as e:
+        return _sin_stock(e)
+    return JsonResponse({"ok": True, "reserva_id": reserva_id, "demanda": demanda}, status=201)
+
+def _accion_reserva(data, accion):
+    try:
+        estado = getattr(obtener_inventario(), accion)(data.get("reserva_id"))
+    except ReservaInexistente:
+        return JsonResponse({"detail": "Reserva no existe"}, status=404)
+    return JsonResponse({"ok": True, "estado": estado})
+
+@csrf_exempt
+def liberar_reserva(request):
+    """Devuelve el stock de una reserva. Body JSON: {"reserva_id": "..."} (idempotente)"""
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    return _accion_reserva(_leer_json(request) or {}, "liberar")
+
+@csrf_exempt
+def confirmar_reserva(request):
+    """
+    Confirma el descuento de una reserva. Body JSON: {"reserva_id": "..."} (idempotente)
+    Si la reserva ya venció (MOCK_RESERVA_TTL) responde con estado EXPIRADA.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    return _accion_reserva(_leer_json(request) or {}, "confirmar")
+
+@csrf_exempt
+def cocina_recibir_pedido(request):
+    """
+    M4 simulado: recibe un ticket de cocina (formato de CocinaClientM4).
+    Body JSON: {"id": "<uuid>", "mesa": "3", "items": [{"plato_id": ..., "cantidad": ...}]}
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    data = _leer_json(request)
+    if data is None or not data.get("id"):
+        return JsonResponse({"detail": "JSON inválido"}, status=400)
+    return JsonResponse({"ok": True, "id": data["id"]}, status=201)
 
 @csrf_exempt
 def cocina_pedido_listo(request):
     """
-    Webhook que marca un pedido como LISTO en la API real.
+    Botón "listo" de la pantalla de cocina de la demo: marca un pedido como
+    LISTO como si llegara un evento pedido.listo de M3, aplicándolo con el
+    mismo receptor (pedidos/webhooks.py), sin firma ni llamada HTTP.
     Se llama desde UI: POST /api/webhooks/cocina/pedido-listo/
     Body JSON: {"pedido_id": "<uuid>"}
     """
+    from pedidos import webhooks
+
     if request.method != "POST":
         return JsonResponse({"detail": "Method not allowed"}, status=405)
 
-    try:
-        data = json.loads(request.body.decode("utf-8") or "{}")
-    except Exception:
+    data = _leer_json(request)
+    if data is None:
         return JsonResponse({"detail": "JSON inválido"}, status=400)
 
     pid = data.get("pedido_id")
     if not pid:
         return JsonResponse({"detail": "pedido_id requerido"}, status=400)
 
-    # Opción A: tu API tiene acción /api/pedidos/<id>/listo/
-    url = _ensure_slash(_abs(request, f"/api/pedidos/{pid}/listo"))
+    evento = {"id": f"demo-{uuid.uuid4().hex}", "tipo": "pedido.listo", "pedido_id": pid}
     try:
-        resp = requests.patch(url, timeout=10)
-        # Si tu API no tiene /listo/, puedes cambiar a:
-        # resp = requests.patch(_ensure_slash(_abs(request, f"/api/pedidos/{pid}")),
-        #                      json={"estado": "LISTO"}, timeout=10)
-    except Exception as e:
-        return JsonResponse({"detail": str(e)}, status=500)
-
-    if resp.status_code in (200, 204):
+        (res,) = webhooks.procesar(webhooks.validar(evento))
+    except webhooks.EventoInvalido as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    if res["resultado"] == "ok":
         return JsonResponse({"ok": True}, status=204)
-    return JsonResponse({"detail": "backend responded", "status": resp.status_code}, status=resp.status_code)
+    codigo = 404 if res.get("detalle") == "Pedido no existe." else 409
+    return JsonResponse({"detail": res.get("detalle")}, status=codigo)
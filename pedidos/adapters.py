@@ -1,42 +1,316 @@
-import hmac, hashlib, requests
+import asyncio, hmac, hashlib, random, threading, time, weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
-class StockClientM1:
-    def __init__(self, base_url=None, timeout=5):
-        self.base_url = base_url or settings.M1_BASE_URL
+
+# ----------------- Infraestructura HTTP compartida -----------------
+class CircuitoAbierto(requests.ConnectionError):
+    """El servicio remoto falló demasiadas veces seguidas: no se intenta la llamada."""
+
+
+class Circuito:
+    """
+    Circuit breaker simple por servicio.
+    CERRADO: pasan todas. Tras `umbral` fallos seguidos queda ABIERTO y falla
+    rápido durante `espera` segundos; luego deja pasar una llamada de prueba
+    (MEDIO_ABIERTO) que lo cierra si sale bien o lo vuelve a abrir.
+    """
+
+    def __init__(self, umbral=5, espera=30.0):
+        self.umbral = umbral
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+
+    @property
+    def estado(self):
+        if self._fallos < self.umbral:
+            return "CERRADO"
+        return "ABIERTO" if time.monotonic() < self._abierto_hasta else "MEDIO_ABIERTO"
+
+    def permitir(self):
+        with self._lock:
+            if self._fallos < self.umbral:
+                return True
+            if time.monotonic() < self._abierto_hasta or self._probando:
+                return False
+            self._probando = True
+            return True
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._probando = False
+            if self._fallos >= self.umbral:
+                self._abierto_hasta = time.monotonic() + self.espera
+
+
+class Metricas:
+    """Contadores por endpoint: llamadas, errores, reintentos y latencia."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = {}
+
+    def registrar(self, endpoint, segundos=None, error=False, reintento=False, rechazada=False):
+        with self._lock:
+            d = self._datos.setdefault(endpoint, {
+                "llamadas": 0, "errores": 0, "reintentos": 0, "rechazadas": 0,
+                "latencia_total_ms": 0.0, "latencia_max_ms": 0.0,
+            })
+            if rechazada:
+                d["rechazadas"] += 1
+                return
+            if reintento:
+                d["reintentos"] += 1
+                return
+            d["llamadas"] += 1
+            if error:
+                d["errores"] += 1
+            if segundos is not None:
+                ms = segundos * 1000
+                d["latencia_total_ms"] += ms
+                d["latencia_max_ms"] = max(d["latencia_max_ms"], ms)
+
+    def snapshot(self):
+        with self._lock:
+            out = {}
+            for endpoint, d in self._datos.items():
+                d = dict(d)
+                d["latencia_media_ms"] = d["latencia_total_ms"] / d["llamadas"] if d["llamadas"] else 0.0
+                out[endpoint] = d
+            return out
+
+    def reiniciar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+metricas = Metricas()
+_sesiones = {}
+_sesiones_async = weakref.WeakKeyDictionary()  # event loop -> {servicio: AsyncClient}
+_circuitos = {}
+_registro_lock = threading.Lock()
+
+
+def _sesion(servicio):
+    """Session con pool keep-alive compartida por todos los clientes de un servicio."""
+    with _registro_lock:
+        s = _sesiones.get(servicio)
+        if s is None:
+            s = requests.Session()
+            pool = settings.INTEGRACIONES_POOL_SIZE
+            adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=0)
+            s.mount("http://", adaptador)
+            s.mount("https://", adaptador)
+            _sesiones[servicio] = s
+        return s
+
+
+def _sesion_async(servicio):
+    """httpx.AsyncClient con pool keep-alive, uno por servicio y por event loop."""
+    loop = asyncio.get_running_loop()
+    with _registro_lock:
+        clientes = _sesiones_async.setdefault(loop, {})
+        c = clientes.get(servicio)
+        if c is None:
+            pool = settings.INTEGRACIONES_POOL_SIZE
+            c = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool)
+            )
+            clientes[servicio] = c
+        return c
+
+
+def _circuito(servicio):
+    with _registro_lock:
+        c = _circuitos.get(servicio)
+        if c is None:
+            c = Circuito(settings.CIRCUITO_UMBRAL, settings.CIRCUITO_ESPERA)
+            _circuitos[servicio] = c
+        return c
+
+
+def estado_circuitos():
+    with _registro_lock:
+        return {servicio: c.estado for servicio, c in _circuitos.items()}
+
+
+def reiniciar_integraciones():
+    """Cierra las sesiones y olvida el estado de los circuitos (tests / recarga de config)."""
+    with _registro_lock:
+        for s in _sesiones.values():
+            s.close()
+        _sesiones.clear()
+        _sesiones_async.clear()
+        _circuitos.clear()
+    metricas.reiniciar()
+
+
+class _ClienteHTTP:
+    servicio = ""
+
+    def __init__(self, timeout=5, reintentos=None, backoff=None):
         self.timeout = timeout
+        self.reintentos = settings.INTEGRACIONES_REINTENTOS if reintentos is None else reintentos
+        self.backoff = settings.INTEGRACIONES_BACKOFF if backoff is None else backoff
+        self.sesion = _sesion(self.servicio)
+        self.circuito = _circuito(self.servicio)
+
+    def _post(self, ruta, payload, idempotente=False):
+        """
+        POST con circuit breaker y reintentos con backoff exponencial con jitter.
+        Las llamadas no idempotentes sólo se reintentan si la conexión no llegó
+        a establecerse (ConnectTimeout), para no duplicar efectos en el remoto.
+        """
+        endpoint = f"{self.servicio} {ruta}"
+        url = f"{self.base_url}{ruta}"
+        intento = 0
+        while True:
+            if not self.circuito.permitir():
+                metricas.registrar(endpoint, rechazada=True)
+                raise CircuitoAbierto(f"{self.servicio} no disponible (circuito abierto).")
+
+            inicio = time.perf_counter()
+            try:
+                r = self.sesion.post(url, json=payload, timeout=self.timeout)
+                if r.status_code >= 500:
+                    r.raise_for_status()
+            except requests.RequestException as e:
+                metricas.registrar(endpoint, time.perf_counter() - inicio, error=True)
+                self.circuito.fallo()
+                reintentable = idempotente or isinstance(e, requests.ConnectTimeout)
+                if not reintentable or intento >= self.reintentos:
+                    raise
+                intento += 1
+                metricas.registrar(endpoint, reintento=True)
+                time.sleep(random.uniform(0, self.backoff * (2 ** intento)))
+                continue
+
+            metricas.registrar(endpoint, time.perf_counter() - inicio, error=r.status_code >= 400)
+            self.circuito.exito()
+            r.raise_for_status()
+            return r.json()
+
+    async def _apost(self, ruta, payload, idempotente=False):
+        """Versión asíncrona de _post (httpx); misma política de reintentos y circuito."""
+        endpoint = f"{self.servicio} {ruta}"
+        url = f"{self.base_url}{ruta}"
+        cliente = _sesion_async(self.servicio)
+        intento = 0
+        while True:
+            if not self.circuito.permitir():
+                metricas.registrar(endpoint, rechazada=True)
+                raise CircuitoAbierto(f"{self.servicio} no disponible (circuito abierto).")
+
+            inicio = time.perf_counter()
+            try:
+                r = await cliente.post(url, json=payload, timeout=self.timeout)
+                if r.status_code >= 500:
+                    r.raise_for_status()
+            except httpx.HTTPError as e:
+                metricas.registrar(endpoint, time.perf_counter() - inicio, error=True)
+                self.circuito.fallo()
+                reintentable = idempotente or isinstance(e, httpx.ConnectTimeout)
+                if not reintentable or intento >= self.reintentos:
+                    raise
+                intento += 1
+                metricas.registrar(endpoint, reintento=True)
+                await asyncio.sleep(random.uniform(0, self.backoff * (2 ** intento)))
+                continue
+
+            metricas.registrar(endpoint, time.perf_counter() - inicio, error=r.status_code >= 400)
+            self.circuito.exito()
+            r.raise_for_status()
+            return r.json()
+
+
+# ----------------- Clientes de los módulos -----------------
+class StockClientM1(_ClienteHTTP):
+    servicio = "M1"
+
+    def __init__(self, base_url=None, timeout=5, **kwargs):
+        self.base_url = base_url or settings.M1_BASE_URL
+        super().__init__(timeout=timeout, **kwargs)
 
     def validar_reservar(self, pedido_id, items):
-        url = f"{self.base_url}/stock/validar-reservar"
         payload = {"pedido_id": str(pedido_id), "items": items}
-        r = requests.post(url, json=payload, timeout=self.timeout)
-        r.raise_for_status()
-        return r.json()
+        return self._post("/stock/validar-reservar", payload)
+
+    def reservar_lote(self, lineas):
+        """
+        Reserva todo o nada para muchas líneas {"pedido_id", "plato_id", "cantidad"}.
+        Devuelve {"reserva_id", "demanda"}; luego liberar_reserva / confirmar_descuento.
+        """
+        return self._post("/stock/reservas/", {"lineas": lineas})
 
     def liberar_reserva(self, reserva_id):
-        url = f"{self.base_url}/stock/liberar"
-        r = requests.post(url, json={"reserva_id": reserva_id}, timeout=self.timeout)
-        r.raise_for_status()
-        return r.json()
+        return self._post("/stock/liberar", {"reserva_id": reserva_id}, idempotente=True)
 
     def confirmar_descuento(self, reserva_id):
-        url = f"{self.base_url}/stock/confirmar"
-        r = requests.post(url, json={"reserva_id": reserva_id}, timeout=self.timeout)
-        r.raise_for_status()
-        return r.json()
+        return self._post("/stock/confirmar", {"reserva_id": reserva_id}, idempotente=True)
+
+    async def avalidar_reservar(self, pedido_id, items):
+        payload = {"pedido_id": str(pedido_id), "items": items}
+        return await self._apost("/stock/validar-reservar", payload)
+
+    async def areservar_lote(self, lineas):
+        return await self._apost("/stock/reservas/", {"lineas": lineas})
+
+    async def aliberar_reserva(self, reserva_id):
+        return await self._apost("/stock/liberar", {"reserva_id": reserva_id}, idempotente=True)
+
+    async def aconfirmar_descuento(self, reserva_id):
+        return await self._apost("/stock/confirmar", {"reserva_id": reserva_id}, idempotente=True)
+
 
+class CocinaClientM4(_ClienteHTTP):
+    servicio = "M4"
 
-class CocinaClientM4:
-    def __init__(self, base_url=None, timeout=5):
+    def __init__(self, base_url=None, timeout=5, **kwargs):
         self.base_url = base_url or settings.M4_BASE_URL
-        self.timeout = timeout
+        super().__init__(timeout=timeout, **kwargs)
+
+    def enviar_pedido(self, pedido, items=None):
+        return self.enviar(self._payload(pedido, items))
+
+    def enviar(self, payload):
+        """Envía un payload ya armado (p.ej. guardado en el outbox)."""
+        return self._post("/cocina/pedidos", payload)
+
+    async def aenviar_pedido(self, pedido, items):
+        # en async las líneas llegan ya leídas: aquí no se puede consultar la base
+        return await self._apost("/cocina/pedidos", self._payload(pedido, items))
+
+    @staticmethod
+    def _payload(pedido, items=None):
+        if items is None:
+            items = items_de_pedido(pedido)
+        return {"id": str(pedido.id), "mesa": pedido.mesa, "items": items}
+
 
-    def enviar_pedido(self, pedido):
-        url = f"{self.base_url}/cocina/pedidos"
-        payload = {"id": str(pedido.id), "mesa": pedido.mesa, "items": pedido.items}
-        r = requests.post(url, json=payload, timeout=self.timeout)
-        r.raise_for_status()
-        return r.json()
+def items_de_pedido(pedido):
+    """
+    Líneas del pedido para M1/M4: sus PedidoItem (prefetch_related("items")
+    evita la consulta) o, en pedidos antiguos, el único `plato`. item_id es
+    el que la cocina usa en sus eventos item.* (webhooks.py).
+    """
+    items = [
+        {"item_id": item.pk, "plato_id": item.plato_id, "cantidad": item.cantidad, "notas": item.notas}
+        for item in pedido.items.all()
+    ]
+    if items or not pedido.plato:
+        return items
+    return [{"plato_id": pedido.plato, "cantidad": 1}]
 
 
 def build_signature(secret: str, body_bytes: bytes) -> str:
@@ -0,0 +1,231 @@
+"""
+Cola de cocina materializada: los tickets CREADO / EN_PREPARACION / LISTO
+en orden de llegada (creado_en, id), mantenida por las transiciones.
+
+Cada cambio recibe una versión correlativa. Un tablero guarda la última
+versión que vio y pide sólo lo que cambió después (?since=): los tickets
+nuevos o modificados y los ids que salieron de la cola. Leer cuesta
+O(tickets activos), nunca O(historial).
+
+Las versiones son "<época>.<n>": la época identifica al proceso, así que
+una versión de otro worker (o de antes de reiniciar) produce una respuesta
+completa en vez de un delta equivocado. Los cambios de otros workers se
+recogen al recargar cada COLA_COCINA_RESYNC segundos; la recarga compara
+con lo que había y publica sólo las diferencias, sin cambiar de época.
+
+La cola alimenta al planificador (planificador.py), que da el orden de
+prioridad de los tickets pendientes en "orden". Un delta sólo lo trae si
+cambió después de `since` (si no, "orden" es null: sigue valiendo el que
+tiene el tablero), así que un sondeo sin cambios no lo recalcula ni lo
+copia.
+
+Cada ticket lleva sus líneas en "items" ({"plato", "cantidad", "notas",
+"estado"}). Los eventos de transición no las traen (no cambian): la cola
+conserva las que ya tenía.
+"""
+import bisect
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from menu_stock.models import Plato
+
+from .models import Pedido, PedidoItem
+from .planificador import Planificador
+
+ESTADOS_COLA = ("CREADO", "EN_PREPARACION", "LISTO")
+CAMPOS = ("id", "mesa", "cliente", "plato", "estado", "creado_en", "actualizado_en")
+
+
+def _clave(ticket):
+    return (ticket["creado_en"] or "", ticket["id"])
+
+
+class ColaCocina:
+    def __init__(self, capacidad=1000, reloj=time.monotonic, planificador=None):
+        self._reloj = reloj
+        self._planificador = planificador
+        self._lock = threading.Lock()
+        self._epoca = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._tickets = {}   # id -> (versión, ticket)
+        self._orden = []     # claves (creado_en, id) ordenadas
+        self._retirados = deque(maxlen=capacidad)  # (versión, id)
+        self._piso = 0       # versión más nueva que ya se descartó de _retirados
+        self._orden_en = 0   # versión en la que cambió el orden del planificador
+        self._cargado_en = None
+
+    # ---------- escritura (con el lock tomado) ----------
+    def _poner(self, ticket):
+        anterior = self._tickets.get(ticket["id"])
+        if anterior is not None and "items" not in ticket and "items" in anterior[1]:
+            ticket = {**ticket, "items": anterior[1]["items"]}
+        if anterior is not None:
+            if anterior[1] == ticket:
+                return
+            if _clave(anterior[1]) != _clave(ticket):
+                self._orden.remove(_clave(anterior[1]))
+                bisect.insort(self._orden, _clave(ticket))
+        else:
+            bisect.insort(self._orden, _clave(ticket))
+        self._version += 1
+        self._tickets[ticket["id"]] = (self._version, ticket)
+        self._planificar("poner", ticket)
+
+    def _quitar(self, pid):
+        anterior = self._tickets.pop(pid, None)
+        if anterior is None:
+            return
+        del self._orden[bisect.bisect_left(self._orden, _clave(anterior[1]))]
+        self._version += 1
+        self._planificar("quitar", pid)
+        if len(self._retirados) == self._retirados.maxlen:
+            self._piso = self._retirados[0][0]
+        self._retirados.append((self._version, pid))
+
+    def _planificar(self, metodo, *args):
+        """Pasa el cambio al planificador y anota la versión si movió el orden."""
+        if self._planificador is None:
+            return False
+        antes = self._planificador.version
+        getattr(self._planificador, metodo)(*args)
+        if self._planificador.version == antes:
+            return False
+        self._orden_en = self._version
+        return True
+
+    # ---------- API ----------
+    def cargar(self, tickets, platos=None):
+        """
+        Reconcilia con la lista completa de tickets (carga inicial o resync).
+        platos: (plato_id, minutos, estación) para el planificador.
+        """
+        nuevos = {t["id"]: t for t in tickets if t["estado"] in ESTADOS_COLA}
+        platos = None if platos is None else list(platos)
+        with self._lock:
+            if platos is not None and self._planificar("cargar_platos", platos):
+                # los tickets no cambian, pero el orden sí: versión propia
+                self._version += 1
+                self._orden_en = self._version
+            for pid in set(self._tickets) - set(nuevos):
+                self._quitar(pid)
+            for ticket in nuevos.values():
+                self._poner(ticket)
+            self._cargado_en = self._reloj()
+
+    def aplicar(self, ticket):
+        """Registra el nuevo estado de un pedido (creado o transición)."""
+        with self._lock:
+            if ticket["estado"] in ESTADOS_COLA:
+                self._poner(ticket)
+            else:
+                self._quitar(ticket["id"])
+
+    def invalidar(self):
+        with self._lock:
+            self._cargado_en = None
+
+    def vigente(self, resync):
+        with self._lock:
+            return self._cargado_en is not None and self._reloj() - self._cargado_en < resync
+
+    def leer(self, since=None):
+        """
+        {"version", "completo", "tickets", "retirados", "orden"}. Con una
+        versión válida de esta cola devuelve sólo los cambios posteriores
+        (en orden FIFO); si no, todos los tickets con completo=True. "orden"
+        es siempre completo (los pendientes por prioridad, con su estación
+        e inicio_limite; vacío sin planificador), pero en un delta llega
+        null si no cambió desde `since`.
+        """
+        with self._lock:
+            desde = self._desde(since)
+            completo = desde is None
+            if completo:
+                desde = 0
+            tickets = []
+            for clave in self._orden:
+                version, ticket = self._tickets[clave[1]]
+                if version > desde:
+                    tickets.append(ticket)
+            retirados = [] if completo else [pid for v, pid in self._retirados if v > desde]
+            orden = None
+            if completo or self._orden_en > desde:
+                orden = self._planificador.orden() if self._planificador is not None else []
+            return {
+                "version": f"{self._epoca}.{self._version}",
+                "completo": completo,
+                "tickets": tickets,
+                "retirados": retirados,
+                "orden": orden,
+            }
+
+    def _desde(self, since):
+        if not since:
+            return None
+        epoca, _, n = str(since).partition(".")
+        if epoca != self._epoca or not n.isdigit():
+            return None
+        n = int(n)
+        if n > self._version or n < self._piso:
+            return None
+        return n
+
+
+cola = ColaCocina(planificador=Planificador(
+    cocineros=settings.COCINA_COCINEROS_POR_ESTACION,
+    objetivo_defecto=settings.COCINA_TIEMPO_OBJETIVO * 60,
+))
+
+
+def ticket_de(pedido):
+    """Ticket a partir de los datos serializados de un pedido (eventos._serializar)."""
+    ticket = {campo: pedido[campo] for campo in CAMPOS}
+    if "items" in pedido:
+        ticket["items"] = pedido["items"]
+    return ticket
+
+
+def cargar_desde_bd(c=None):
+    """
+    Una consulta sobre los pedidos de la cola (índice parcial de activos),
+    otra por sus líneas y otra por los tiempos objetivo y estaciones de los
+    platos.
+    """
+    c = c or cola
+    filas = (
+        Pedido.objects.filter(estado__in=ESTADOS_COLA)
+        .order_by("creado_en", "id")
+        .values(*CAMPOS)
+    )
+    items = {}
+    for pid, plato, cantidad, notas, estado in (
+        PedidoItem.objects.filter(pedido__estado__in=ESTADOS_COLA)
+        .order_by("id")
+        .values_list("pedido_id", "plato_id", "cantidad", "notas", "estado")
+    ):
+        items.setdefault(str(pid), []).append(
+            {"plato": plato, "cantidad": cantidad, "notas": notas, "estado": estado}
+        )
+    c.cargar(
+        (
+            {
+                **fila,
+                "id": str(fila["id"]),
+                "creado_en": fila["creado_en"].isoformat() if fila["creado_en"] else None,
+                "actualizado_en": fila["actualizado_en"].isoformat() if fila["actualizado_en"] else None,
+                "items": items.get(str(fila["id"]), []),
+            }
+            for fila in filas
+        ),
+        platos=Plato.objects.values_list("pk", "tiempo_preparacion", "estacion"),
+    )
+    return c
+
+
+def leer(since=None):
+    if not cola.vigente(settings.COLA_COCINA_RESYNC):
+        cargar_desde_bd()
+    return cola.leer(since)
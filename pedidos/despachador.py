@@ -0,0 +1,296 @@
+"""
+Despachador del outbox (salida.py): envía a M1/M4 los MensajeSalida
+pendientes. Corre en su propio proceso con `manage.py despachar_salida`.
+
+Cada ciclo:
+
+1. Lee los pendientes más antiguos (índice parcial salida_pendientes_idx)
+   y arma, por pedido, la racha de mensajes que ya tocan. Si el más viejo
+   de un pedido espera un reintento, ese pedido no avanza: el orden por
+   pedido se respeta siempre (reservar -> enviar -> descontar/liberar).
+2. Los toma con un UPDATE condicional (tomado_por + arriendo): dos
+   despachadores no envían el mismo mensaje, y si uno muere sus mensajes
+   vuelven a estar disponibles al vencer el arriendo.
+3. Envía hasta `concurrencia` pedidos en paralelo; los mensajes de un
+   mismo pedido, en orden y en el mismo hilo.
+4. Guarda todos los resultados con un solo bulk_update.
+
+Errores de red, timeouts, 5xx y circuito abierto se reintentan con
+backoff exponencial hasta max_intentos; un 4xx es definitivo. Si M1
+rechaza la reserva (4xx, p.ej. 409 por falta de stock) se descarta el
+resto de los mensajes del pedido, que así no llega a cocina, y el pedido
+se cancela. Si la reserva agota los reintentos por un error transitorio
+(M1 caído más que el backoff) queda FALLIDO sin tocar el pedido: lo que
+sigue de ese pedido espera hasta que un operador la reintente
+(`despachar_salida --reintentar-fallidos`), o se descarta si el pedido
+se cancela o cierra antes.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .adapters import CocinaClientM4, StockClientM1
+from .models import ESTADOS_ACTIVOS, MensajeSalida
+
+E = MensajeSalida.Estado
+Op = MensajeSalida.Operacion
+
+
+class MetricasDespacho:
+    """Resultados y latencia por operación, y mensajes enviados por segundo."""
+
+    RESULTADOS = ("enviados", "reintentos", "fallidos", "descartados")
+
+    def __init__(self, reloj=time.monotonic):
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._datos = {}
+        self._inicio = reloj()
+
+    def registrar(self, operacion, resultado, segundos=0.0):
+        with self._lock:
+            d = self._datos.setdefault(operacion, {**dict.fromkeys(self.RESULTADOS, 0), "segundos": 0.0})
+            d[resultado] += 1
+            d["segundos"] += segundos
+
+    def snapshot(self):
+        with self._lock:
+            transcurrido = max(self._reloj() - self._inicio, 1e-9)
+            operaciones, enviados = {}, 0
+            for op, d in self._datos.items():
+                d = dict(d)
+                llamadas = sum(d[r] for r in self.RESULTADOS)
+                d["latencia_media_ms"] = round(d.pop("segundos") / llamadas * 1000, 2) if llamadas else 0.0
+                operaciones[op] = d
+                enviados += d["enviados"]
+            return {
+                "operaciones": operaciones,
+                "enviados": enviados,
+                "enviados_por_s": round(enviados / transcurrido, 2),
+                "segundos": round(transcurrido, 1),
+            }
+
+    def reiniciar(self):
+        with self._lock:
+            self._datos.clear()
+            self._inicio = self._reloj()
+
+
+metricas = MetricasDespacho()
+
+
+class SinReserva(Exception):
+    """liberar/descontar de un pedido cuya reserva en M1 no existe."""
+
+
+def _reintentable(error):
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        codigo = error.response.status_code
+        return codigo >= 500 or codigo in (408, 429)
+    return isinstance(error, requests.RequestException)
+
+
+def _rechazo(error):
+    """True si M1/M4 respondió que no (4xx no reintentable): reintentar no cambia nada."""
+    if not isinstance(error, requests.HTTPError) or error.response is None:
+        return False
+    return 400 <= error.response.status_code < 500 and not _reintentable(error)
+
+
+class Despachador:
+    def __init__(self, lote=None, concurrencia=None, max_intentos=None, backoff=None,
+                 backoff_max=None, arriendo=60, m1=None, m4=None):
+        self.lote = lote or settings.SALIDA_LOTE
+        self.concurrencia = concurrencia or settings.SALIDA_CONCURRENCIA
+        self.max_intentos = max_intentos or settings.SALIDA_MAX_INTENTOS
+        self.backoff = settings.SALIDA_BACKOFF if backoff is None else backoff
+        self.backoff_max = settings.SALIDA_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.arriendo = timedelta(seconds=arriendo)
+        self.m1 = m1 or StockClientM1()
+        self.m4 = m4 or CocinaClientM4()
+        self._hilos = ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix="salida")
+
+    def cerrar(self):
+        self._hilos.shutdown(wait=True)
+
+    # ---------- ciclo ----------
+    def ciclo(self):
+        """Despacha un lote. Devuelve cuántos mensajes procesó (0 = nada pendiente)."""
+        ahora = timezone.now()
+        rachas = self._elegir(ahora)
+        if not rachas:
+            return 0
+        mensajes = self._tomar([pk for pks in rachas.values() for pk in pks], ahora)
+        if not mensajes:
+            return 0
+        por_pedido = {}
+        for m in mensajes:
+            por_pedido.setdefault(m.pedido_id, []).append(m)
+        reservas = self._reservas(por_pedido)
+
+        list(self._hilos.map(
+            lambda p: self._enviar_pedido(por_pedido[p], reservas.get(p)), por_pedido,
+        ))
+
+        MensajeSalida.objects.bulk_update(
+            mensajes,
+            ["estado", "intentos", "proximo_intento", "tomado_por", "respuesta", "error", "enviado_en"],
+        )
+        self._compensar([m for m in mensajes if getattr(m, "rechazada", False)])
+        return len(mensajes)
+
+    def _elegir(self, ahora):
+        """pedido -> [ids] de la racha que ya toca, en orden; a lo sumo `lote` mensajes."""
+        pendientes = (
+            MensajeSalida.objects.filter(estado=E.PENDIENTE)
+            .order_by("id")
+            .values_list("id", "pedido_id", "proximo_intento")[: self.lote * 10]
+        )
+        detenidos = self._sin_reserva({pedido for _, pedido, _ in pendientes})
+        rachas, total = {}, 0
+        for pk, pedido, proximo in pendientes:
+            if pedido in detenidos:
+                continue
+            if proximo > ahora:
+                detenidos.add(pedido)  # lo que sigue de este pedido espera su turno
+                continue
+            rachas.setdefault(pedido, []).append(pk)
+            total += 1
+            if total >= self.lote:
+                break
+        return rachas
+
+    def _sin_reserva(self, pedidos):
+        """
+        Pedidos cuya reserva quedó FALLIDO: si siguen activos esperan a que
+        se reintente; si no, sus pendientes se descartan (no hay nada que
+        enviar a cocina ni reserva que liberar o descontar).
+        """
+        if not pedidos:
+            return set()
+        fallidos = dict(
+            MensajeSalida.objects.filter(pedido_id__in=pedidos, operacion=Op.RESERVAR, estado=E.FALLIDO)
+            .values_list("pedido_id", "pedido__estado")
+        )
+        cerrados = [p for p, estado in fallidos.items() if estado not in ESTADOS_ACTIVOS]
+        if cerrados:
+            MensajeSalida.objects.filter(pedido_id__in=cerrados, estado=E.PENDIENTE).update(
+                estado=E.DESCARTADO, error="Sin reserva en M1.",
+            )
+        return set(fallidos)
+
+    def _tomar(self, ids, ahora):
+        token = uuid.uuid4().hex
+        MensajeSalida.objects.filter(
+            pk__in=ids, estado=E.PENDIENTE, proximo_intento__lte=ahora,
+        ).update(tomado_por=token, proximo_intento=ahora + self.arriendo)
+        return list(MensajeSalida.objects.filter(pk__in=ids, tomado_por=token).order_by("id"))
+
+    def _reservas(self, por_pedido):
+        """reserva_id en M1 de los pedidos que van a liberar o descontar."""
+        pedidos = [
+            p for p, ms in por_pedido.items()
+            if any(m.operacion in (Op.LIBERAR, Op.DESCONTAR) for m in ms)
+        ]
+        if not pedidos:
+            return {}
+        return {
+            pedido: (respuesta or {}).get("reserva_id")
+            for pedido, respuesta in MensajeSalida.objects.filter(
+                pedido_id__in=pedidos, operacion=Op.RESERVAR, estado=E.ENVIADO,
+            ).values_list("pedido_id", "respuesta")
+        }
+
+    # ---------- envío (en los hilos: sin tocar la base) ----------
+    def _enviar_pedido(self, mensajes, reserva_id):
+        contexto = {"reserva_id": reserva_id}
+        for i, m in enumerate(mensajes):
+            if not self._enviar(m, contexto):
+                for resto in mensajes[i + 1:]:
+                    # no se intentaron: quedan disponibles detrás del que falló
+                    resto.tomado_por = ""
+                    resto.proximo_intento = m.proximo_intento
+                return
+
+    def _enviar(self, m, contexto):
+        """
+        Envía un mensaje y anota el resultado en él. False si lo que sigue
+        del pedido debe esperar (reintento pendiente o reserva fallida).
+        """
+        inicio = time.perf_counter()
+        m.tomado_por = ""
+        m.intentos += 1
+        try:
+            m.respuesta = self._llamar(m, contexto)
+        except SinReserva:
+            m.estado, m.error = E.DESCARTADO, "Sin reserva en M1."
+            metricas.registrar(m.operacion, "descartados", time.perf_counter() - inicio)
+            return True
+        except Exception as e:
+            m.error = str(e)[:300]
+            if _reintentable(e) and m.intentos < self.max_intentos:
+                espera = min(self.backoff * (2 ** (m.intentos - 1)), self.backoff_max)
+                m.proximo_intento = timezone.now() + timedelta(seconds=espera)
+                metricas.registrar(m.operacion, "reintentos", time.perf_counter() - inicio)
+                return False
+            m.estado = E.FALLIDO
+            m.rechazada = m.operacion == Op.RESERVAR and _rechazo(e)
+            metricas.registrar(m.operacion, "fallidos", time.perf_counter() - inicio)
+            return m.operacion != Op.RESERVAR
+        m.estado, m.error, m.enviado_en = E.ENVIADO, "", timezone.now()
+        metricas.registrar(m.operacion, "enviados", time.perf_counter() - inicio)
+        return True
+
+    def _llamar(self, m, contexto):
+        if m.operacion == Op.RESERVAR:
+            respuesta = self.m1.validar_reservar(m.pedido_id, m.payload.get("items", []))
+            contexto["reserva_id"] = (respuesta or {}).get("reserva_id")
+            return respuesta
+        if m.operacion == Op.ENVIAR:
+            return self.m4.enviar(m.payload)
+        if not contexto.get("reserva_id"):
+            raise SinReserva()
+        if m.operacion == Op.LIBERAR:
+            return self.m1.liberar_reserva(contexto["reserva_id"])
+        return self.m1.confirmar_descuento(contexto["reserva_id"])
+
+    # ---------- compensación ----------
+    def _compensar(self, rechazadas):
+        """M1 rechazó la reserva (4xx): no enviar a cocina y cancelar el pedido."""
+        if not rechazadas:
+            return
+        from . import services
+
+        pedidos = [m.pedido_id for m in rechazadas]
+        MensajeSalida.objects.filter(pedido_id__in=pedidos, estado=E.PENDIENTE).update(
+            estado=E.DESCARTADO, error="Reserva rechazada por M1.",
+        )
+        for m in rechazadas:
+            try:
+                services.transicionar(m.pedido_id, "cancelar")
+            except ValidationError:
+                pass  # ya finalizado
+
+
+def correr(despachador, intervalo=0.5, detener=None, al_ciclo=None):
+    """
+    Bucle del despachador: ciclos seguidos mientras haya trabajo y una
+    pausa de `intervalo` segundos cuando no. `detener` (threading.Event)
+    lo termina.
+    """
+    detener = detener or threading.Event()
+    while not detener.is_set():
+        close_old_connections()
+        n = despachador.ciclo()
+        if al_ciclo is not None:
+            al_ciclo(n)
+        if n == 0:
+            detener.wait(intervalo)
@@ -0,0 +1,179 @@
+"""
+Difusor en proceso de cambios de pedidos y flujo Server-Sent Events.
+
+Cada transición de Pedido publica un delta (creado, cambio de estado,
+cancelado) con un id correlativo. Los tableros se suscriben por SSE y
+reciben sólo los deltas que les interesan; al reconectar, el navegador
+envía Last-Event-ID y se reenvían los eventos pendientes desde el buffer.
+
+El difusor vive en memoria del proceso: cada worker ASGI tiene el suyo.
+Si el id pedido ya no está en el buffer (o es de otro proceso), se envía
+un evento "resync" para que el tablero recargue la lista una vez.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+
+# tablero -> estados que muestra (None = todos)
+TABLEROS = {
+    "cocina": {"CREADO", "EN_PREPARACION"},
+    "sala": None,
+}
+
+KEEPALIVE_S = 15
+
+
+class Difusor:
+    def __init__(self, capacidad=1000):
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=capacidad)
+        self._ultimo_id = 0
+        self._suscriptores = set()
+
+    @property
+    def ultimo_id(self):
+        return self._ultimo_id
+
+    def publicar(self, tipo, pedido, estado_anterior=None):
+        """Agrega un evento al buffer y despierta a los suscriptores."""
+        with self._lock:
+            self._ultimo_id += 1
+            evento = {
+                "id": self._ultimo_id,
+                "tipo": tipo,
+                "estado_anterior": estado_anterior,
+                "pedido": pedido,
+            }
+            self._buffer.append(evento)
+            suscriptores = list(self._suscriptores)
+        for loop, aviso in suscriptores:
+            try:
+                loop.call_soon_threadsafe(aviso.set)
+            except RuntimeError:  # loop cerrado
+                self.desuscribir((loop, aviso))
+        return evento
+
+    def desde(self, ultimo_id):
+        """
+        Eventos con id > ultimo_id, o None si ya no se pueden reconstruir
+        (el buffer los descartó o el id no corresponde a este proceso).
+        """
+        with self._lock:
+            if ultimo_id > self._ultimo_id:
+                return None
+            if self._buffer and ultimo_id < self._buffer[0]["id"] - 1:
+                return None
+            return [e for e in self._buffer if e["id"] > ultimo_id]
+
+    def suscribir(self):
+        sub = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._suscriptores.add(sub)
+        return sub
+
+    def desuscribir(self, sub):
+        with self._lock:
+            self._suscriptores.discard(sub)
+
+
+difusor = Difusor()
+
+
+def _serializar(pedido):
+    datos = {
+        "id": str(pedido.id),
+        "mesa": pedido.mesa,
+        "cliente": pedido.cliente,
+        "plato": pedido.plato,
+        "estado": pedido.estado,
+        "creado_en": pedido.creado_en.isoformat() if pedido.creado_en else None,
+        "actualizado_en": pedido.actualizado_en.isoformat() if pedido.actualizado_en else None,
+    }
+    items = _items_cargados(pedido)
+    if items is not None:
+        datos["items"] = [
+            {"plato": i.plato_id, "cantidad": i.cantidad, "notas": i.notas, "estado": i.estado}
+            for i in items
+        ]
+    return datos
+
+
+def _items_cargados(pedido):
+    """
+    Las líneas del pedido si ya están en memoria (recién creadas o
+    prefetch_related); None si habría que consultarlas. Una transición no
+    cambia las líneas, así que su evento no las lleva.
+    """
+    items = getattr(pedido, "_items_nuevos", None)
+    if items is None:
+        items = getattr(pedido, "_prefetched_objects_cache", {}).get("items")
+    return items
+
+
+def publicar_cambio(pedido, estado_anterior=None):
+    """
+    Publica el cambio de un pedido y actualiza el índice de ocupación de
+    mesas (ocupacion.py) y la cola de cocina (cola_cocina.py) cuando la
+    transacción actual confirma.
+    """
+    from django.db import transaction
+
+    from .cola_cocina import cola, ticket_de
+    from .ocupacion import indice
+
+    if estado_anterior is None:
+        tipo = "creado"
+    elif pedido.estado == "CANCELADO":
+        tipo = "cancelado"
+    else:
+        tipo = "estado"
+    datos = _serializar(pedido)
+
+    def al_confirmar():
+        indice.aplicar(datos["mesa"], datos["id"], datos["estado"])
+        cola.aplicar(ticket_de(datos))
+        difusor.publicar(tipo, datos, estado_anterior)
+
+    transaction.on_commit(al_confirmar)
+
+
+def es_relevante(evento, tablero):
+    estados = TABLEROS.get(tablero)
+    if estados is None:
+        return True
+    return evento["pedido"]["estado"] in estados or evento["estado_anterior"] in estados
+
+
+def formatear_sse(evento):
+    datos = json.dumps(evento, separators=(",", ":"))
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+async def flujo_sse(tablero, ultimo_id=None, fuente=None, keepalive=KEEPALIVE_S):
+    """Generador asíncrono con el flujo SSE de un tablero."""
+    fuente = fuente or difusor
+    sub = fuente.suscribir()
+    _, aviso = sub
+    try:
+        yield "retry: 3000\n\n"
+        if ultimo_id is None:
+            ultimo_id = fuente.ultimo_id
+            yield f"id: {ultimo_id}\nevent: hola\ndata: {{}}\n\n"
+        while True:
+            aviso.clear()
+            eventos = fuente.desde(ultimo_id)
+            if eventos is None:
+                ultimo_id = fuente.ultimo_id
+                yield f"id: {ultimo_id}\nevent: resync\ndata: {{}}\n\n"
+                continue
+            for evento in eventos:
+                ultimo_id = evento["id"]
+                if es_relevante(evento, tablero):
+                    yield formatear_sse(evento)
+            try:
+                await asyncio.wait_for(aviso.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+    finally:
+        fuente.desuscribir(sub)
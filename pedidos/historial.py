@@ -0,0 +1,341 @@
+"""
+Historial de pedidos: la tabla PedidoEvento, sus archivos compactados y la
+reconstrucción del estado de un pedido en cualquier momento.
+
+Cada creación, modificación y transición agrega un PedidoEvento en la misma
+transacción (models.py, services.transicionar_lote, webhooks.py); nada lo
+actualiza ni lo borra salvo la compactación. `manage.py compactar_historial`
+(p.ej. una vez al día) pasa los días UTC anteriores a
+HISTORIAL_RETENCION_DIAS a un archivo por día en HISTORIAL_DIR y borra esas
+filas: la tabla queda acotada a los últimos días y eventos() / reconstruir()
+siguen viendo la historia completa.
+
+Archivos (eventos-AAAA-MM-DD.col), columnares:
+
+    "PEDHIST1" | largo del encabezado (uint32) | encabezado JSON | columnas
+
+Las filas van ordenadas por (pedido, id). Cada columna es un bloque
+alineado a 8 bytes: id y ocurrido_en (microsegundos UTC) como int64, pedido
+como 16 bytes por fila y las demás codificadas por diccionario (un uint32
+por fila; los valores distintos van en el encabezado). Al leer, el archivo
+se abre con mmap y las filas de un pedido se ubican por búsqueda binaria
+en la columna pedido: sólo se tocan las páginas de esas filas.
+"""
+import datetime
+import json
+import mmap
+import os
+import sys
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Pedido, PedidoEvento
+
+MAGIC = b"PEDHIST1"
+ENTEROS = ("id", "ocurrido_en")
+DICCIONARIO = ("tipo", "estado_anterior", "estado", "mesa", "cliente", "plato", "datos")
+CAMPOS = ("id", "pedido", "ocurrido_en") + DICCIONARIO
+MAX_ABIERTOS = 128  # archivos mapeados a la vez (por proceso)
+LOTE_BORRADO = 900  # ids por DELETE (bajo el límite de parámetros de SQLite)
+
+UTC = datetime.timezone.utc
+EPOCA = datetime.datetime(1970, 1, 1, tzinfo=UTC)
+MICRO = datetime.timedelta(microseconds=1)
+DIA = datetime.timedelta(days=1)
+
+
+def _alinear(n):
+    return (n + 7) & ~7
+
+
+def _ruta(directorio, dia):
+    return Path(directorio) / f"eventos-{dia.isoformat()}.col"
+
+
+def _de_fila(fila):
+    """Fila de PedidoEvento (values()) al formato común de los eventos."""
+    return {**fila, "pedido": str(fila["pedido"]), "ocurrido_en": fila["ocurrido_en"].astimezone(UTC)}
+
+
+# ---------- archivos ----------
+def escribir(ruta, eventos):
+    """Escribe los eventos como archivo columnar; reemplaza `ruta` de una vez."""
+    eventos = sorted(eventos, key=lambda e: (uuid.UUID(e["pedido"]).bytes, e["id"]))
+    bloques, columnas, offset = [], {}, 0
+
+    def agregar(nombre, datos, **extra):
+        nonlocal offset
+        columnas[nombre] = {"offset": offset, "largo": len(datos), **extra}
+        relleno = _alinear(len(datos)) - len(datos)
+        bloques.append(datos + b"\0" * relleno)
+        offset += len(datos) + relleno
+
+    agregar("id", array("q", (e["id"] for e in eventos)).tobytes())
+    agregar("ocurrido_en", array("q", ((e["ocurrido_en"] - EPOCA) // MICRO for e in eventos)).tobytes())
+    agregar("pedido", b"".join(uuid.UUID(e["pedido"]).bytes for e in eventos))
+    for nombre in DICCIONARIO:
+        valores, codigos = {}, array("I")
+        for e in eventos:
+            valor = e[nombre]
+            if nombre == "datos" and valor is not None:
+                valor = json.dumps(valor, separators=(",", ":"), sort_keys=True)
+            codigos.append(valores.setdefault(valor, len(valores)))
+        agregar(nombre, codigos.tobytes(), valores=list(valores))
+
+    encabezado = json.dumps({
+        "version": 1, "filas": len(eventos), "orden": sys.byteorder, "columnas": columnas,
+    }, separators=(",", ":")).encode()
+    inicio = MAGIC + len(encabezado).to_bytes(4, "little") + encabezado
+    inicio += b"\0" * (_alinear(len(inicio)) - len(inicio))
+
+    ruta = Path(ruta)
+    temporal = ruta.with_suffix(".tmp")
+    with open(temporal, "wb") as f:
+        f.write(inicio)
+        for bloque in bloques:
+            f.write(bloque)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+class Archivo:
+    """Un archivo de historial abierto con mmap (sólo lectura)."""
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self._f = open(self.ruta, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC:
+            self.cerrar()
+            raise ValueError(f"{self.ruta} no es un archivo de historial.")
+        largo = int.from_bytes(self._mm[8:12], "little")
+        encabezado = json.loads(self._mm[12:12 + largo])
+        if encabezado["orden"] != sys.byteorder:
+            self.cerrar()
+            raise ValueError(f"{self.ruta} fue escrito con otro orden de bytes.")
+        self.filas = encabezado["filas"]
+        base = _alinear(12 + largo)
+        self._vista = memoryview(self._mm)
+        self._columnas, self._valores = {}, {}
+        for nombre, c in encabezado["columnas"].items():
+            bloque = self._vista[base + c["offset"]: base + c["offset"] + c["largo"]]
+            if nombre in ENTEROS:
+                bloque = bloque.cast("q")
+            elif nombre in DICCIONARIO:
+                bloque = bloque.cast("I")
+                self._valores[nombre] = c["valores"]
+            self._columnas[nombre] = bloque
+
+    def _pedido(self, i):
+        return bytes(self._columnas["pedido"][i * 16:(i + 1) * 16])
+
+    def _buscar(self, clave, derecha=False):
+        bajo, alto = 0, self.filas
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            valor = self._pedido(medio)
+            if valor < clave or (derecha and valor == clave):
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
+
+    def fila(self, i):
+        evento = {
+            "id": self._columnas["id"][i],
+            "pedido": str(uuid.UUID(bytes=self._pedido(i))),
+            "ocurrido_en": EPOCA + self._columnas["ocurrido_en"][i] * MICRO,
+        }
+        for nombre in DICCIONARIO:
+            evento[nombre] = self._valores[nombre][self._columnas[nombre][i]]
+        if evento["datos"] is not None:
+            evento["datos"] = json.loads(evento["datos"])
+        return evento
+
+    def del_pedido(self, pedido):
+        """Eventos de un pedido (uuid.UUID), en orden de id."""
+        clave = pedido.bytes
+        desde = self._buscar(clave)
+        return [self.fila(i) for i in range(desde, self._buscar(clave, derecha=True))]
+
+    def columna(self, nombre):
+        """Todos los valores de una columna, decodificados (para análisis)."""
+        if nombre in DICCIONARIO:
+            valores = self._valores[nombre]
+            return [valores[c] for c in self._columnas[nombre]]
+        if nombre == "pedido":
+            return [str(uuid.UUID(bytes=self._pedido(i))) for i in range(self.filas)]
+        return list(self._columnas[nombre])
+
+    def todos(self):
+        return [self.fila(i) for i in range(self.filas)]
+
+    def cerrar(self):
+        for bloque in getattr(self, "_columnas", {}).values():
+            bloque.release()
+        if getattr(self, "_vista", None) is not None:
+            self._vista.release()
+        self._mm.close()
+        self._f.close()
+
+
+class Abiertos:
+    """Archivos ya mapeados (LRU); se reabren si otro proceso los reescribió."""
+
+    def __init__(self, capacidad=MAX_ABIERTOS):
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()  # ruta -> (mtime_ns, Archivo)
+
+    def obtener(self, ruta):
+        mtime = os.stat(ruta).st_mtime_ns
+        with self._lock:
+            entrada = self._datos.get(ruta)
+            if entrada is not None and entrada[0] == mtime:
+                self._datos.move_to_end(ruta)
+                return entrada[1]
+            archivo = Archivo(ruta)
+            # los anteriores se liberan con su última referencia (una lectura
+            # en curso en otro hilo puede seguir usándolos)
+            self._datos[ruta] = (mtime, archivo)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+            return archivo
+
+    def olvidar(self, ruta):
+        with self._lock:
+            self._datos.pop(ruta, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+abiertos = Abiertos()
+
+
+def dias(directorio=None):
+    """[(día, ruta)] de los archivos compactados, en orden."""
+    directorio = Path(directorio or settings.HISTORIAL_DIR)
+    if not directorio.is_dir():
+        return []
+    resultado = []
+    for ruta in directorio.glob("eventos-*.col"):
+        try:
+            resultado.append((datetime.date.fromisoformat(ruta.stem.removeprefix("eventos-")), ruta))
+        except ValueError:
+            continue
+    return sorted(resultado)
+
+
+# ---------- consulta ----------
+def eventos(pedido_id, hasta=None, directorio=None):
+    """
+    Eventos del pedido (archivos y tabla), en orden, con ocurrido_en <=
+    `hasta` si se indica. Lanza ValueError si el id no es un uuid.
+    """
+    pid = uuid.UUID(str(pedido_id))
+    creado = Pedido.objects.filter(pk=pid).values_list("creado_en", flat=True).first()
+    desde_dia = creado.astimezone(UTC).date() if creado else None
+    hasta_dia = hasta.astimezone(UTC).date() if hasta else None
+
+    resultado = []
+    for dia, ruta in dias(directorio):
+        if (desde_dia and dia < desde_dia) or (hasta_dia and dia > hasta_dia):
+            continue
+        resultado.extend(abiertos.obtener(ruta).del_pedido(pid))
+    qs = PedidoEvento.objects.filter(pedido=pid)
+    if hasta:
+        qs = qs.filter(ocurrido_en__lte=hasta)
+    # mientras se compacta un día sus filas están a la vez en el archivo y la tabla
+    vistos = {e["id"] for e in resultado}
+    resultado.extend(e for e in map(_de_fila, qs.values(*CAMPOS)) if e["id"] not in vistos)
+    if hasta:
+        resultado = [e for e in resultado if e["ocurrido_en"] <= hasta]
+    resultado.sort(key=lambda e: e["id"])
+    return resultado
+
+
+def reconstruir(pedido_id, en=None, directorio=None):
+    """
+    Estado del pedido en el momento `en` (ahora si no se indica), a partir
+    de su historial; None si todavía no existía.
+    """
+    return plegar(eventos(pedido_id, hasta=en, directorio=directorio))
+
+
+def plegar(historia):
+    """Aplica en orden los eventos (de eventos()) de un pedido; None si no hay."""
+    if not historia:
+        return None
+    estado = {"id": historia[0]["pedido"], "creado_en": None, "entregado_en": None}
+    lineas = {}
+    for e in historia:
+        estado.update(mesa=e["mesa"], cliente=e["cliente"], plato=e["plato"], estado=e["estado"])
+        if e["tipo"] != PedidoEvento.Tipo.LINEAS:
+            estado["actualizado_en"] = e["ocurrido_en"]
+        if e["tipo"] == PedidoEvento.Tipo.CREADO:
+            estado["creado_en"] = e["ocurrido_en"]
+        if e["estado"] == Pedido.Estado.ENTREGADO and estado["entregado_en"] is None:
+            estado["entregado_en"] = e["ocurrido_en"]
+        for linea in e["datos"] or ():
+            lineas.setdefault(linea["id"], {}).update(linea)
+    estado["items"] = [lineas[pk] for pk in sorted(lineas)]
+    estado["eventos"] = len(historia)
+    return estado
+
+
+# ---------- compactación ----------
+def compactar(retencion_dias=None, directorio=None, ahora=None):
+    """
+    Pasa a archivos los días UTC completos anteriores a la retención y borra
+    esas filas de la tabla. Un día que ya tenía archivo (eventos atrasados,
+    o una compactación interrumpida antes del DELETE) se reescribe con la
+    unión de ambos. Devuelve [(día, eventos que salieron de la tabla)].
+    """
+    if retencion_dias is None:
+        retencion_dias = settings.HISTORIAL_RETENCION_DIAS
+    directorio = Path(directorio or settings.HISTORIAL_DIR)
+    ahora = (ahora or timezone.now()).astimezone(UTC)
+    corte = datetime.datetime.combine((ahora - datetime.timedelta(days=retencion_dias)).date(),
+                                      datetime.time.min, tzinfo=UTC)
+    hechos = []
+    desde = None
+    while True:
+        pendientes = PedidoEvento.objects.filter(ocurrido_en__lt=corte)
+        if desde is not None:
+            pendientes = pendientes.filter(ocurrido_en__gte=desde)
+        primero = pendientes.aggregate(m=Min("ocurrido_en"))["m"]
+        if primero is None:
+            return hechos
+        dia = primero.astimezone(UTC).date()
+        desde = datetime.datetime.combine(dia, datetime.time.min, tzinfo=UTC)
+        del_dia = PedidoEvento.objects.filter(ocurrido_en__gte=desde, ocurrido_en__lt=desde + DIA)
+        filas = [_de_fila(f) for f in del_dia.order_by("id").values(*CAMPOS)]
+
+        directorio.mkdir(parents=True, exist_ok=True)
+        ruta = _ruta(directorio, dia)
+        todos = {e["id"]: e for e in filas}
+        if ruta.exists():
+            abiertos.olvidar(ruta)
+            previo = Archivo(ruta)
+            try:
+                todos = {**{e["id"]: e for e in previo.todos()}, **todos}
+            finally:
+                previo.cerrar()
+        escribir(ruta, todos.values())
+        # exactamente las filas escritas: en PostgreSQL una fila con id menor
+        # puede confirmarse después del SELECT y no está en el archivo
+        ids = [e["id"] for e in filas]
+        for i in range(0, len(ids), LOTE_BORRADO):
+            PedidoEvento.objects.filter(id__in=ids[i:i + LOTE_BORRADO]).delete()
+        hechos.append((dia, len(filas)))
+        desde += DIA
@@ -0,0 +1,246 @@
+"""
+Idempotency-Key para crear pedidos y aplicar transiciones.
+
+Una tablet que reintenta POST /api/pedidos/ o /confirmar/ con la misma
+clave recibe la respuesta original (header Idempotent-Replayed: true), sin
+volver a tocar el pedido ni a llamar a M1/M4.
+
+- Antes de ejecutar se inserta la clave "en curso". La PK resuelve la
+  carrera entre dos reintentos simultáneos: el segundo recibe 409.
+- El reclamo dura IDEMPOTENCIA_LEASE segundos: si el worker muere a mitad
+  de la petición (OOM, SIGKILL, deploy), un reintento posterior lo toma en
+  vez de recibir 409 hasta que venza la clave. Guardar y soltar sólo
+  tocan la fila si el reclamo sigue siendo el propio.
+- Al terminar se guardan el status y el cuerpo JSON. Las respuestas 5xx
+  (p.ej. M1 no respondió) y las excepciones liberan la clave para que el
+  reintento vuelva a ejecutarse.
+- La clave queda atada a la huella de la petición (método, ruta y
+  cuerpo): reusarla con otra petición es 422.
+
+Delante de la tabla hay un LRU en memoria del proceso con las respuestas
+terminadas: un reintento que llega al mismo worker no consulta la base.
+Las filas duran IDEMPOTENCIA_TTL segundos; cada IDEMPOTENCIA_PURGA
+segundos un guardado borra las vencidas (por el índice de creado_en).
+"""
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import RespuestaIdempotente
+
+HEADER = "Idempotency-Key"
+MAX_CLAVE = 64
+
+
+class RespuestasRecientes:
+    """LRU clave -> (huella, status, cuerpo) de las respuestas terminadas."""
+
+    def __init__(self, capacidad=2048, reloj=time.monotonic):
+        self.capacidad = capacidad
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()  # clave -> (vence, huella, status, cuerpo)
+        self._purgado_en = None
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= self._reloj():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return entrada[1:]
+
+    def poner(self, clave, huella, status, cuerpo, ttl):
+        with self._lock:
+            self._datos[clave] = (self._reloj() + ttl, huella, status, cuerpo)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def toca_purgar(self, cada):
+        """True una vez cada `cada` segundos (por proceso)."""
+        with self._lock:
+            ahora = self._reloj()
+            if self._purgado_en is not None and ahora - self._purgado_en < cada:
+                return False
+            self._purgado_en = ahora
+            return True
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._purgado_en = None
+
+
+recientes = RespuestasRecientes(capacidad=settings.IDEMPOTENCIA_LRU)
+
+
+def huella(request):
+    """sha256 de método, ruta y cuerpo. Leer request.body antes de request.data."""
+    h = hashlib.sha256()
+    for parte in (request.method.encode(), request.path.encode(), request.body):
+        h.update(len(parte).to_bytes(8, "big"))
+        h.update(parte)
+    return h.digest()
+
+
+def _repetida(status, cuerpo):
+    resp = HttpResponse(cuerpo, status=status, content_type="application/json")
+    resp["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def _error(status, detalle):
+    return JsonResponse({"detail": detalle}, status=status)
+
+
+def _en_memoria(clave, h):
+    guardada = recientes.obtener(clave)
+    if guardada is None:
+        return None
+    huella_guardada, status, cuerpo = guardada
+    if huella_guardada != h:
+        return _error(422, f"{HEADER} ya usada con otra petición.")
+    return _repetida(status, cuerpo)
+
+
+def _reclamar(clave, h):
+    """
+    Inserta la clave "en curso". Devuelve (respuesta, None) con la respuesta
+    a enviar (repetida, 409 o 422), o (None, reclamo) si esta petición debe
+    ejecutarse; `reclamo` (su creado_en) identifica la fila al guardar.
+    Un "en curso" más viejo que IDEMPOTENCIA_LEASE se toma con un UPDATE
+    condicional: sólo un reintento gana.
+    """
+    ahora = timezone.now()
+    vence = ahora - datetime.timedelta(seconds=settings.IDEMPOTENCIA_TTL)
+    abandonada = ahora - datetime.timedelta(seconds=settings.IDEMPOTENCIA_LEASE)
+    for _ in range(2):
+        # primero leer: un reintento (el caso a optimizar) cuesta un SELECT
+        fila = RespuestaIdempotente.objects.filter(clave=clave).first()
+        if fila is not None and fila.creado_en < vence:
+            RespuestaIdempotente.objects.filter(clave=clave, creado_en__lt=vence).delete()
+            fila = None
+        if fila is None:
+            try:
+                with transaction.atomic():
+                    RespuestaIdempotente.objects.create(clave=clave, huella=h, creado_en=ahora)
+                return None, ahora
+            except IntegrityError:
+                continue  # otro reintento la tomó entre el SELECT y el INSERT
+        if bytes(fila.huella) != h:
+            return _error(422, f"{HEADER} ya usada con otra petición."), None
+        if fila.status == RespuestaIdempotente.EN_CURSO:
+            if fila.creado_en >= abandonada:
+                return _error(409, f"Hay una petición en curso con esta {HEADER}."), None
+            tomada = RespuestaIdempotente.objects.filter(
+                clave=clave, status=RespuestaIdempotente.EN_CURSO, creado_en=fila.creado_en,
+            ).update(creado_en=ahora)
+            if tomada:
+                return None, ahora
+            continue  # otro reintento la tomó o la original terminó
+        restante = (fila.creado_en - vence).total_seconds()
+        recientes.poner(clave, h, fila.status, bytes(fila.cuerpo), restante)
+        return _repetida(fila.status, bytes(fila.cuerpo)), None
+    return _error(409, f"Hay una petición en curso con esta {HEADER}."), None
+
+
+def _cuerpo(respuesta):
+    # Response de DRF todavía sin renderizar, o una respuesta Django ya armada
+    if isinstance(respuesta, Response) and not respuesta.is_rendered:
+        return JSONRenderer().render(respuesta.data)
+    return respuesta.content
+
+
+def _soltar(clave, reclamo):
+    RespuestaIdempotente.objects.filter(
+        clave=clave, status=RespuestaIdempotente.EN_CURSO, creado_en=reclamo,
+    ).delete()
+
+
+def _guardar(clave, h, reclamo, respuesta):
+    if respuesta.status_code >= 500:
+        _soltar(clave, reclamo)
+        return
+    cuerpo = _cuerpo(respuesta)
+    guardada = RespuestaIdempotente.objects.filter(clave=clave, creado_en=reclamo).update(
+        status=respuesta.status_code, cuerpo=cuerpo,
+    )
+    if guardada:  # si no, un reintento tomó el reclamo vencido: vale su respuesta
+        recientes.poner(clave, h, respuesta.status_code, cuerpo, settings.IDEMPOTENCIA_TTL)
+    if recientes.toca_purgar(settings.IDEMPOTENCIA_PURGA):
+        purgar()
+
+
+def purgar():
+    """Borra las claves vencidas. Devuelve cuántas."""
+    vence = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCIA_TTL)
+    borradas, _ = RespuestaIdempotente.objects.filter(creado_en__lt=vence).delete()
+    return borradas
+
+
+def _clave(request):
+    clave = request.headers.get(HEADER)
+    if clave is not None and not 0 < len(clave) <= MAX_CLAVE:
+        return None, _error(400, f"{HEADER} inválida (1 a {MAX_CLAVE} caracteres).")
+    return clave, None
+
+
+def responder(request, vista):
+    """
+    Ejecuta vista() (sin argumentos, devuelve la respuesta) respetando el
+    Idempotency-Key de la petición; sin header la ejecuta tal cual.
+    """
+    clave, invalida = _clave(request)
+    if invalida is not None:
+        return invalida
+    if clave is None:
+        return vista()
+    h = huella(request)
+    previa, reclamo = _en_memoria(clave, h), None
+    if previa is None:
+        previa, reclamo = _reclamar(clave, h)
+    if previa is not None:
+        return previa
+    try:
+        respuesta = vista()
+    except BaseException:
+        _soltar(clave, reclamo)
+        raise
+    _guardar(clave, h, reclamo, respuesta)
+    return respuesta
+
+
+async def aresponder(request, vista):
+    """Versión para vistas async: vista() devuelve una corrutina."""
+    clave, invalida = _clave(request)
+    if invalida is not None:
+        return invalida
+    if clave is None:
+        return await vista()
+    h = huella(request)
+    previa, reclamo = _en_memoria(clave, h), None
+    if previa is None:
+        previa, reclamo = await sync_to_async(_reclamar)(clave, h)
+    if previa is not None:
+        return previa
+    try:
+        respuesta = await vista()
+    except BaseException:
+        await sync_to_async(_soltar)(clave, reclamo)
+        raise
+    await sync_to_async(_guardar)(clave, h, reclamo, respuesta)
+    return respuesta
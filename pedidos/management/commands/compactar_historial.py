@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pedidos import historial
+from pedidos.models import PedidoEvento
+
+
+class Command(BaseCommand):
+    help = "Pasa los días viejos del historial de pedidos a archivos columnares (uno por día)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retencion", type=int, help="días que quedan en la tabla (HISTORIAL_RETENCION_DIAS)",
+        )
+        parser.add_argument("--directorio", help="carpeta de los archivos (HISTORIAL_DIR)")
+
+    def handle(self, *args, **opts):
+        directorio = opts["directorio"] or settings.HISTORIAL_DIR
+        hechos = historial.compactar(opts["retencion"], directorio)
+        for dia, n in hechos:
+            self.stdout.write(f"{dia}: {n} eventos")
+        self.stdout.write(
+            f"Compactados {sum(n for _, n in hechos)} eventos en {len(hechos)} días "
+            f"({directorio}); quedan {PedidoEvento.objects.count()} en la tabla."
+        )
@@ -0,0 +1,61 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from pedidos import salida
+from pedidos.despachador import Despachador, correr, metricas
+
+
+class Command(BaseCommand):
+    help = "Envía a M1/M4 las llamadas pendientes del outbox de pedidos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, help="mensajes por ciclo (SALIDA_LOTE)")
+        parser.add_argument("--concurrencia", type=int, help="pedidos en paralelo (SALIDA_CONCURRENCIA)")
+        parser.add_argument("--intervalo", type=float, default=0.5, help="pausa sin trabajo, en segundos")
+        parser.add_argument("--reporte", type=float, default=30, help="segundos entre líneas de métricas")
+        parser.add_argument("--una-vez", action="store_true", help="vaciar lo pendiente y salir")
+        parser.add_argument(
+            "--reintentar-fallidos", action="store_true",
+            help="volver a PENDIENTE los mensajes FALLIDO de pedidos activos antes de despachar",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["reintentar_fallidos"]:
+            self.stdout.write(f"Reintentando {salida.reintentar_fallidos()} mensajes fallidos")
+        despachador = Despachador(lote=opts["lote"], concurrencia=opts["concurrencia"])
+        detener = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: detener.set())
+        ultimo = [time.monotonic()]
+
+        def al_ciclo(n):
+            if opts["una_vez"] and n == 0:
+                detener.set()
+            if time.monotonic() - ultimo[0] >= opts["reporte"] or detener.is_set():
+                ultimo[0] = time.monotonic()
+                self._reportar()
+
+        self.stdout.write(
+            f"Despachando outbox: lote={despachador.lote} concurrencia={despachador.concurrencia}"
+        )
+        try:
+            correr(despachador, opts["intervalo"], detener, al_ciclo)
+        except KeyboardInterrupt:
+            self._reportar()
+        finally:
+            despachador.cerrar()
+
+    def _reportar(self):
+        m = metricas.snapshot()
+        pendientes = salida.resumen()
+        por_op = " ".join(
+            f"{op}={d['enviados']}/{d['reintentos']}/{d['fallidos']} ({d['latencia_media_ms']}ms)"
+            for op, d in sorted(m["operaciones"].items())
+        )
+        self.stdout.write(
+            f"enviados={m['enviados']} ({m['enviados_por_s']}/s) "
+            f"pendientes={pendientes['por_estado']['PENDIENTE']} retraso={pendientes['retraso_s']}s "
+            f"[enviados/reintentos/fallidos] {por_op}"
+        )
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+ACTIVOS = ['CREADO', 'EN_PREPARACION', 'LISTO', 'ENTREGADO']
+
+
+def cancelar_duplicados(apps, schema_editor):
+    """
+    Antes la regla sólo se validaba en la UI, así que pueden existir mesas
+    con más de un pedido activo. Se deja activo el más reciente y se
+    cancelan los anteriores para poder crear el índice único.
+    """
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    vistos = set()
+    activos = Pedido.objects.filter(estado__in=ACTIVOS, mesa__isnull=False).order_by('mesa', '-creado_en')
+    for pk, mesa in activos.values_list('pk', 'mesa'):
+        if mesa in vistos:
+            Pedido.objects.filter(pk=pk).update(estado='CANCELADO')
+        vistos.add(mesa)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0002_alter_pedido_options_pedido_entregado_en_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'creado_en'], name='pedido_estado_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['mesa', 'estado'], name='pedido_mesa_estado_idx'),
+        ),
+        migrations.RunPython(cancelar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pedido',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['CREADO', 'EN_PREPARACION', 'LISTO', 'ENTREGADO'])), fields=('mesa',), name='pedido_mesa_activa_unica', violation_error_message='La mesa ya tiene un pedido activo.'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_pedido_mesa_activa_indices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-creado_en', '-id'], name='pedido_creado_id_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ACTIVOS = ['CREADO', 'EN_PREPARACION', 'LISTO', 'ENTREGADO']
+
+
+def enlazar_mesas(apps, schema_editor):
+    """
+    Enlaza los pedidos cuyo texto `mesa` es el número de una mesa local y
+    deja Mesa.estado coherente: OCUPADA si tiene un pedido activo, LIBRE
+    si figuraba OCUPADA sin ninguno (hasta ahora nadie lo mantenía).
+    """
+    Mesa = apps.get_model('mesas', 'Mesa')
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    for pk, numero in Mesa.objects.values_list('pk', 'numero'):
+        Pedido.objects.filter(mesa=str(numero)).update(mesa_ref=pk)
+    ocupadas = Pedido.objects.filter(estado__in=ACTIVOS, mesa_ref__isnull=False).values('mesa_ref')
+    Mesa.objects.filter(pk__in=ocupadas).update(estado='OCUPADA')
+    Mesa.objects.filter(estado='OCUPADA').exclude(pk__in=ocupadas).update(estado='LIBRE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mesas', '0002_alter_mesa_estado'),
+        ('pedidos', '0004_pedido_creado_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='mesa_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos', to='mesas.mesa'),
+        ),
+        migrations.RunPython(enlazar_mesas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mesas', '0002_alter_mesa_estado'),
+        ('pedidos', '0005_pedido_mesa_ref'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('estado__in', ['CREADO', 'EN_PREPARACION', 'LISTO', 'ENTREGADO'])), fields=['creado_en'], include=('id', 'mesa', 'mesa_ref', 'cliente', 'plato', 'estado', 'actualizado_en', 'entregado_en'), name='pedido_activos_cola_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu_stock', '0004_plato_planificacion'),
+        ('pedidos', '0006_pedido_activos_cola_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('notas', models.CharField(blank=True, default='', max_length=200)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PREPARACION', 'En preparación'), ('LISTO', 'Listo')], default='PENDIENTE', max_length=20)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='pedidos.pedido')),
+                ('plato', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='menu_stock.plato')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0007_pedido_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaIdempotente',
+            fields=[
+                ('clave', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('huella', models.BinaryField(max_length=32)),
+                ('status', models.PositiveSmallIntegerField(default=0)),
+                ('cuerpo', models.BinaryField(default=b'')),
+                ('creado_en', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
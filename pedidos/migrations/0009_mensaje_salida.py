@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0008_respuesta_idempotente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeSalida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operacion', models.CharField(choices=[('reservar', 'Reservar stock (M1)'), ('enviar', 'Enviar a cocina (M4)'), ('liberar', 'Liberar reserva (M1)'), ('descontar', 'Confirmar descuento (M1)')], max_length=12)),
+                ('payload', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIADO', 'Enviado'), ('FALLIDO', 'Fallido'), ('DESCARTADO', 'Descartado')], default='PENDIENTE', max_length=12)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tomado_por', models.CharField(blank=True, default='', max_length=32)),
+                ('respuesta', models.JSONField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, default='', max_length=300)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='salida', to='pedidos.pedido')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['id'], name='salida_pendientes_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0009_mensaje_salida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoCocina',
+            fields=[
+                ('id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('recibido_en', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
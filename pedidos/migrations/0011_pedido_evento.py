@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0010_evento_cocina'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoEvento',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('pedido', models.UUIDField()),
+                ('ocurrido_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tipo', models.CharField(choices=[('creado', 'Creado'), ('modificado', 'Modificado'), ('estado', 'Cambio de estado'), ('lineas', 'Cambio en las líneas')], max_length=12)),
+                ('estado_anterior', models.CharField(blank=True, default='', max_length=20)),
+                ('estado', models.CharField(max_length=20)),
+                ('mesa', models.CharField(blank=True, max_length=20, null=True)),
+                ('cliente', models.CharField(blank=True, max_length=100, null=True)),
+                ('plato', models.CharField(blank=True, default='', max_length=60)),
+                ('datos', models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['pedido', 'id'], name='evento_pedido_idx'), models.Index(fields=['ocurrido_en'], name='evento_ocurrido_idx')],
+            },
+        ),
+    ]
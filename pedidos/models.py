@@ -1,8 +1,18 @@
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from mesas.models import Mesa
+
+from .eventos import publicar_cambio
+
+ESTADOS_ACTIVOS = ["CREADO", "EN_PREPARACION", "LISTO", "ENTREGADO"]
+MESA_ACTIVA_CONSTRAINT = "pedido_mesa_activa_unica"
+MESA_ACTIVA_MENSAJE = "La mesa ya tiene un pedido activo."
+
 
 class Pedido(models.Model):
     class Estado(models.TextChoices):
@@ -17,6 +27,10 @@ class Pedido(models.Model):
 
     # Datos visibles para el mesero
     mesa = models.CharField(max_length=20, null=True, blank=True)
+    # mesa local (mesas.Mesa), si existe; `mesa` queda como texto visible
+    mesa_ref = models.ForeignKey(
+        Mesa, null=True, blank=True, on_delete=models.SET_NULL, related_name="pedidos",
+    )
     cliente = models.CharField(max_length=100, null=True, blank=True)
     plato = models.CharField(max_length=60, blank=True, default="")  # <— NUEVO
 
@@ -28,84 +42,311 @@ class Pedido(models.Model):
     actualizado_en = models.DateTimeField(auto_now=True)
     entregado_en = models.DateTimeField(null=True, blank=True)  # <— NUEVO
 
+    # accion -> (estados de origen, estado destino, mensaje si no aplica)
+    TRANSICIONES = {
+        "confirmar": (
+            [Estado.CREADO], Estado.EN_PREPARACION,
+            "Solo se puede confirmar un pedido en estado CREADO.",
+        ),
+        "listo": (
+            [Estado.EN_PREPARACION], Estado.LISTO,
+            "Solo se puede marcar LISTO desde EN_PREPARACION.",
+        ),
+        "entregar": (
+            [Estado.LISTO], Estado.ENTREGADO,
+            "Solo se puede ENTREGAR un pedido LISTO.",
+        ),
+        "cerrar": (
+            [Estado.ENTREGADO], Estado.CERRADO,
+            "Solo se puede CERRAR un pedido ENTREGADO.",
+        ),
+        "cancelar": (
+            [Estado.CREADO, Estado.EN_PREPARACION, Estado.LISTO, Estado.ENTREGADO],
+            Estado.CANCELADO,
+            "El pedido ya está finalizado.",
+        ),
+    }
+
     # ----------------- Reglas de negocio -----------------
     def puede_modificarse(self):
         return self.estado == Pedido.Estado.CREADO
 
-    def clean(self):
-        """
-        Regla: una mesa no puede tener dos pedidos activos a la vez.
-        Consideramos activos a todos excepto CERRADO y CANCELADO.
-        (Se valida a nivel de aplicación para SQLite.)
-        """
-        if self.mesa:
-            activos = Pedido.objects.exclude(estado__in=[self.Estado.CERRADO, self.Estado.CANCELADO])
-            if self.pk:
-                activos = activos.exclude(pk=self.pk)
-            if activos.filter(mesa=self.mesa).exists():
-                raise ValidationError("La mesa ya tiene un pedido activo.")
-
     def save(self, *args, **kwargs):
         # set entregado_en cuando pasa a ENTREGADO
-        if self.pk:
-            prev = Pedido.objects.filter(pk=self.pk).values_list("estado", flat=True).first()
-        else:
-            prev = None
-
-        super_set_entregado = False
+        creando = self._state.adding
         if self.estado == self.Estado.ENTREGADO and self.entregado_en is None:
             self.entregado_en = timezone.now()
-            super_set_entregado = True
 
-        super().save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if creando and self.mesa_ref_id and self.estado in ESTADOS_ACTIVOS:
+                    Mesa.ocupar(self.mesa_ref_id)
+                # con líneas nuevas (services.crear_pedido) el evento se escribe
+                # después de insertarlas, para que lleve sus ids
+                if not (creando and getattr(self, "_items_nuevos", None) is not None):
+                    if creando:
+                        PedidoEvento.de(self, PedidoEvento.Tipo.CREADO, ocurrido_en=self.creado_en).save()
+                    else:
+                        PedidoEvento.de(self, PedidoEvento.Tipo.MODIFICADO, ocurrido_en=self.actualizado_en).save()
+        except IntegrityError as e:
+            if _viola_mesa_activa(e):
+                raise ValidationError(MESA_ACTIVA_MENSAJE, code="mesa_activa")
+            raise
+
+        if creando:
+            publicar_cambio(self)
+
+    # ----------------- Transiciones -----------------
+    def _transicionar(self, desde, hacia, mensaje):
+        """
+        Cambia de estado con un único UPDATE condicional:
+
+            UPDATE pedido SET estado=<hacia>, actualizado_en=<ahora>[, entregado_en=...]
+            WHERE id=<id> AND estado IN (<desde>)
+
+        Si no se afecta ninguna fila, otro proceso cambió el pedido antes
+        (conflicto) y se lanza ValidationError con code="conflicto".
+        Cerrar o cancelar libera la mesa local en la misma transacción, y
+        el PedidoEvento de la transición también se escribe en ella.
+        No hace falta full_clean(): una transición no cambia la mesa ni
+        puede crear un segundo pedido activo.
+        """
+        if self.estado not in desde:
+            raise ValidationError(mensaje)
+
+        ahora = timezone.now()
+        cambios = {"estado": hacia, "actualizado_en": ahora}
+        if hacia == self.Estado.ENTREGADO:
+            cambios["entregado_en"] = Coalesce("entregado_en", Value(ahora))
 
-        # si se volvió a un estado anterior, deja entregado_en tal cual;
-        # si quieres limpiarlo en retrocesos, descomenta esta parte:
-        # if prev == self.Estado.ENTREGADO and self.estado != self.Estado.ENTREGADO and super_set_entregado:
-        #     self.entregado_en = None
-        #     super().save(update_fields=["entregado_en"])
+        anterior = self.estado
+        # sin savepoint: un conflicto no escribe nada y se informa fuera del bloque
+        with transaction.atomic(savepoint=False):
+            filas = Pedido.objects.filter(pk=self.pk, estado__in=desde).update(**cambios)
+            if filas:
+                if self.mesa_ref_id and hacia not in ESTADOS_ACTIVOS:
+                    Mesa.liberar([self.mesa_ref_id])
+                self.estado = hacia
+                self.actualizado_en = ahora
+                if hacia == self.Estado.ENTREGADO and self.entregado_en is None:
+                    self.entregado_en = ahora
+                PedidoEvento.de(self, PedidoEvento.Tipo.ESTADO, anterior, ahora).save()
+        if filas == 0:
+            raise ValidationError(mensaje, code="conflicto")
+        publicar_cambio(self, anterior)
 
-    # Helpers de transición (opcionales, por claridad en vistas)
     def confirmar(self):
         """Confirma pedido (reserva stock) -> EN_PREPARACION."""
-        if self.estado != self.Estado.CREADO:
-            raise ValidationError("Solo se puede confirmar un pedido en estado CREADO.")
-        self.estado = self.Estado.EN_PREPARACION
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar(*self.TRANSICIONES["confirmar"])
 
     def marcar_listo(self):
-        if self.estado not in [self.Estado.EN_PREPARACION]:
-            raise ValidationError("Solo se puede marcar LISTO desde EN_PREPARACION.")
-        self.estado = self.Estado.LISTO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar(*self.TRANSICIONES["listo"])
 
     def entregar(self):
-        if self.estado != self.Estado.LISTO:
-            raise ValidationError("Solo se puede ENTREGAR un pedido LISTO.")
-        self.estado = self.Estado.ENTREGADO
-        # entregado_en se setea en save()
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en", "entregado_en"])
+        self._transicionar(*self.TRANSICIONES["entregar"])
 
     def cerrar(self):
-        if self.estado != self.Estado.ENTREGADO:
-            raise ValidationError("Solo se puede CERRAR un pedido ENTREGADO.")
-        self.estado = self.Estado.CERRADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar(*self.TRANSICIONES["cerrar"])
 
     def cancelar(self):
-        if self.estado in [self.Estado.CERRADO, self.Estado.CANCELADO]:
-            raise ValidationError("El pedido ya está finalizado.")
-        self.estado = self.Estado.CANCELADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar(*self.TRANSICIONES["cancelar"])
 
     # -----------------------------------------------------
     class Meta:
         ordering = ["-creado_en"]
+        constraints = [
+            # Regla: una mesa no puede tener dos pedidos activos a la vez
+            # (activos = todos excepto CERRADO y CANCELADO). Índice único
+            # parcial: funciona en SQLite y PostgreSQL y no tiene carreras
+            # entre workers.
+            models.UniqueConstraint(
+                fields=["mesa"],
+                condition=Q(estado__in=ESTADOS_ACTIVOS),
+                name=MESA_ACTIVA_CONSTRAINT,
+                violation_error_message=MESA_ACTIVA_MENSAJE,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["estado", "creado_en"], name="pedido_estado_creado_idx"),
+            models.Index(fields=["mesa", "estado"], name="pedido_mesa_estado_idx"),
+            # paginación por cursor de /api/pedidos/ (ORDER BY creado_en DESC, id DESC)
+            models.Index(fields=["-creado_en", "-id"], name="pedido_creado_id_idx"),
+            # cola de cocina (services.listar_activos): índice parcial sobre los
+            # activos que en PostgreSQL cubre todas las columnas (index-only scan)
+            models.Index(
+                fields=["creado_en"],
+                condition=Q(estado__in=ESTADOS_ACTIVOS),
+                include=[
+                    "id", "mesa", "mesa_ref", "cliente", "plato", "estado",
+                    "actualizado_en", "entregado_en",
+                ],
+                name="pedido_activos_cola_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Pedido {self.id} (mesa={self.mesa or '-'}, estado={self.estado})"
+
+
+class PedidoItem(models.Model):
+    """Línea de un pedido: un plato del menú con su cantidad y notas para cocina."""
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        EN_PREPARACION = "EN_PREPARACION", "En preparación"
+        LISTO = "LISTO", "Listo"
+
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="items")
+    plato = models.ForeignKey("menu_stock.Plato", on_delete=models.PROTECT, related_name="+")
+    cantidad = models.PositiveIntegerField(default=1)
+    notas = models.CharField(max_length=200, blank=True, default="")
+    # estado en cocina de esta línea (el pedido sigue su propio ciclo)
+    estado = models.CharField(max_length=20, choices=Estado.choices, default=Estado.PENDIENTE)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.cantidad} x plato {self.plato_id} (pedido {self.pedido_id})"
+
+
+class RespuestaIdempotente(models.Model):
+    """Respuesta guardada de una petición con Idempotency-Key (idempotencia.py)."""
+
+    EN_CURSO = 0  # status mientras la petición original no termina
+
+    clave = models.CharField(max_length=64, primary_key=True)
+    huella = models.BinaryField(max_length=32)  # sha256 de método, ruta y cuerpo
+    status = models.PositiveSmallIntegerField(default=EN_CURSO)
+    cuerpo = models.BinaryField(default=b"")  # JSON ya renderizado
+    creado_en = models.DateTimeField(default=timezone.now, db_index=True)  # vencimiento (TTL)
+
+    def __str__(self):
+        return f"Idempotency-Key {self.clave} ({self.status or 'en curso'})"
+
+
+class MensajeSalida(models.Model):
+    """
+    Llamada a M1/M4 pendiente, escrita en la misma transacción que la
+    transición del pedido (outbox). La envía el despachador (despachador.py).
+    """
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        ENVIADO = "ENVIADO", "Enviado"
+        FALLIDO = "FALLIDO", "Fallido"
+        DESCARTADO = "DESCARTADO", "Descartado"
+
+    class Operacion(models.TextChoices):
+        RESERVAR = "reservar", "Reservar stock (M1)"
+        ENVIAR = "enviar", "Enviar a cocina (M4)"
+        LIBERAR = "liberar", "Liberar reserva (M1)"
+        DESCONTAR = "descontar", "Confirmar descuento (M1)"
+
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="salida")
+    operacion = models.CharField(max_length=12, choices=Operacion.choices)
+    payload = models.JSONField(default=dict)
+    estado = models.CharField(max_length=12, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    tomado_por = models.CharField(max_length=32, blank=True, default="")  # lote del despachador
+    respuesta = models.JSONField(null=True, blank=True)
+    error = models.CharField(max_length=300, blank=True, default="")
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            # el despachador sólo recorre los pendientes, en orden de llegada
+            models.Index(
+                fields=["id"], condition=Q(estado="PENDIENTE"), name="salida_pendientes_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.operacion} pedido {self.pedido_id} ({self.estado})"
+
+
+class EventoCocina(models.Model):
+    """Id de un evento del webhook de cocina ya aplicado (webhooks.py): no se repite."""
+
+    id = models.CharField(max_length=64, primary_key=True)
+    recibido_en = models.DateTimeField(default=timezone.now, db_index=True)  # vencimiento (TTL)
+
+    def __str__(self):
+        return f"Evento de cocina {self.id}"
+
+
+class PedidoEvento(models.Model):
+    """
+    Historial append-only de los pedidos: una fila por creación,
+    modificación o transición, con los datos del pedido en ese momento.
+    Los días viejos se compactan a archivos (historial.py).
+    """
+
+    class Tipo(models.TextChoices):
+        CREADO = "creado", "Creado"
+        MODIFICADO = "modificado", "Modificado"
+        ESTADO = "estado", "Cambio de estado"
+        LINEAS = "lineas", "Cambio en las líneas"
+
+    id = models.BigAutoField(primary_key=True)
+    pedido = models.UUIDField()  # sin FK: el historial sobrevive al pedido
+    ocurrido_en = models.DateTimeField(default=timezone.now)
+    tipo = models.CharField(max_length=12, choices=Tipo.choices)
+    estado_anterior = models.CharField(max_length=20, blank=True, default="")
+    estado = models.CharField(max_length=20)
+    mesa = models.CharField(max_length=20, null=True, blank=True)
+    cliente = models.CharField(max_length=100, null=True, blank=True)
+    plato = models.CharField(max_length=60, blank=True, default="")
+    # líneas nuevas o cambiadas: [{"id", "estado"[, "plato", "cantidad", "notas"]}]
+    datos = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["pedido", "id"], name="evento_pedido_idx"),
+            # la compactación recorre la tabla por día
+            models.Index(fields=["ocurrido_en"], name="evento_ocurrido_idx"),
+        ]
+
+    @classmethod
+    def de(cls, pedido, tipo, estado_anterior="", ocurrido_en=None, datos=None):
+        """El evento (sin guardar) con los datos actuales de `pedido`."""
+        return cls(
+            pedido=pedido.pk,
+            ocurrido_en=ocurrido_en or timezone.now(),
+            tipo=tipo,
+            estado_anterior=estado_anterior or "",
+            estado=pedido.estado,
+            mesa=pedido.mesa,
+            cliente=pedido.cliente,
+            plato=pedido.plato or "",
+            datos=datos,
+        )
+
+    @staticmethod
+    def lineas(items, completas=False):
+        """`datos` para las líneas dadas (PedidoItem)."""
+        if completas:
+            return [
+                {"id": i.pk, "estado": i.estado, "plato": i.plato_id, "cantidad": i.cantidad, "notas": i.notas}
+                for i in items
+            ]
+        return [{"id": i.pk, "estado": i.estado} for i in items]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("El historial de pedidos no se modifica.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.tipo} pedido {self.pedido} -> {self.estado} ({self.ocurrido_en:%Y-%m-%d %H:%M:%S})"
+
+
+def _viola_mesa_activa(error):
+    # PostgreSQL nombra el constraint; SQLite informa la columna del índice.
+    texto = str(error)
+    return MESA_ACTIVA_CONSTRAINT in texto or "pedidos_pedido.mesa" in texto
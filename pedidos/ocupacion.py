@@ -0,0 +1,123 @@
+"""
+Índice de ocupación de mesas: mesa -> id del pedido activo.
+
+Reemplaza el cruce pedidos × mesas en Python. La carga completa es una
+consulta (sólo pedidos activos, con values_list); después cada transición
+lo actualiza al confirmar su transacción (eventos.publicar_cambio), así
+que consultar una mesa es una búsqueda en un dict, sin leer pedidos.
+
+Cada proceso tiene su índice. Los cambios de este proceso se aplican al
+instante; los de otros workers se recogen al recargar cada
+OCUPACION_RESYNC segundos. El índice único parcial de Pedido sigue siendo
+la regla: un índice desactualizado a lo sumo deja pasar un intento que el
+INSERT rechaza.
+
+La carga completa lee la base fuera del lock. Cada aplicar() recibe una
+generación correlativa y queda en un registro corto; al reemplazar el
+índice, la carga vuelve a aplicar los cambios posteriores a la generación
+que tenía al empezar a leer, así que una transición confirmada mientras
+tanto no se pierde hasta el próximo resync. Si el registro ya no los tiene
+todos, el índice queda para recargar en la próxima lectura.
+"""
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .models import ESTADOS_ACTIVOS, Pedido
+
+
+class IndiceOcupacion:
+    def __init__(self, capacidad=1000, reloj=time.monotonic):
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._mesas = {}  # mesa -> id del pedido activo
+        self._generacion = 0
+        self._cambios = deque(maxlen=capacidad)  # (generación, mesa, pedido_id, estado)
+        self._cargado_en = None
+
+    # ---------- escritura (con el lock tomado) ----------
+    def _aplicar(self, mesas, mesa, pedido_id, estado):
+        if estado in ESTADOS_ACTIVOS:
+            mesas[mesa] = pedido_id
+        elif mesas.get(mesa) == pedido_id:
+            del mesas[mesa]
+
+    # ---------- API ----------
+    @property
+    def generacion(self):
+        """Se toma antes de leer la base y se pasa a cargar(desde=...)."""
+        with self._lock:
+            return self._generacion
+
+    def cargar(self, activos, desde=None):
+        """
+        Reconstruye todo. activos: iterable de (mesa, pedido_id). desde: la
+        generación de antes de la consulta; los cambios posteriores se
+        vuelven a aplicar sobre el resultado.
+        """
+        mesas = {str(mesa): str(pid) for mesa, pid in activos if mesa not in (None, "")}
+        with self._lock:
+            completo = True
+            if desde is not None and desde < self._generacion:
+                completo = bool(self._cambios) and self._cambios[0][0] <= desde + 1
+                for generacion, *cambio in self._cambios:
+                    if generacion > desde:
+                        self._aplicar(mesas, *cambio)
+            self._mesas = mesas
+            self._cargado_en = self._reloj() if completo else None
+
+    def aplicar(self, mesa, pedido_id, estado):
+        """Registra el nuevo estado de un pedido (creado o transición)."""
+        if mesa in (None, ""):
+            return
+        mesa, pedido_id = str(mesa), str(pedido_id)
+        with self._lock:
+            self._generacion += 1
+            self._cambios.append((self._generacion, mesa, pedido_id, estado))
+            self._aplicar(self._mesas, mesa, pedido_id, estado)
+
+    def invalidar(self):
+        """Recargar todo en la próxima lectura."""
+        with self._lock:
+            self._cargado_en = None
+
+    def vigente(self, resync):
+        with self._lock:
+            return self._cargado_en is not None and self._reloj() - self._cargado_en < resync
+
+    def pedido_de(self, mesa):
+        with self._lock:
+            return self._mesas.get(str(mesa))
+
+    def ocupacion(self):
+        with self._lock:
+            return dict(self._mesas)
+
+
+indice = IndiceOcupacion()
+
+
+def cargar_desde_bd(i=None):
+    """Carga completa: una consulta sobre los pedidos activos (no el historial)."""
+    i = i or indice
+    desde = i.generacion
+    i.cargar(Pedido.objects.filter(estado__in=ESTADOS_ACTIVOS).values_list("mesa", "id"), desde=desde)
+    return i
+
+
+def _al_dia():
+    if not indice.vigente(settings.OCUPACION_RESYNC):
+        cargar_desde_bd()
+    return indice
+
+
+def ocupacion_actual():
+    """{mesa: pedido_id} de las mesas con un pedido activo."""
+    return _al_dia().ocupacion()
+
+
+def pedido_activo(mesa):
+    """Id del pedido activo de la mesa, o None si está libre."""
+    return _al_dia().pedido_de(mesa)
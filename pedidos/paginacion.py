@@ -0,0 +1,80 @@
+"""
+Paginación por cursor (keyset) sobre (creado_en, id), más recientes primero.
+
+El cursor codifica el último (creado_en, id) entregado; la página siguiente
+es WHERE creado_en < c OR (creado_en = c AND id < i), que usa el índice
+pedido_creado_id_idx y cuesta lo mismo en la página 1 que en la 1000
+(a diferencia de OFFSET).
+"""
+import base64
+import json
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+ORDEN = ("-creado_en", "-id")
+
+
+def _codificar(pedido):
+    crudo = json.dumps([pedido.creado_en.isoformat(), str(pedido.pk)])
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def _decodificar(cursor):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        creado, pk = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        creado, pk = parse_datetime(creado), uuid.UUID(pk)
+    except (ValueError, TypeError, AttributeError):
+        creado = None
+    if creado is None:
+        raise NotFound("Cursor inválido.")
+    return creado, pk
+
+
+class PedidoCursorPagination(BasePagination):
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = "limite"
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limite = self._limite(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            creado, pk = _decodificar(cursor)
+            queryset = queryset.filter(Q(creado_en__lt=creado) | Q(creado_en=creado, id__lt=pk))
+        filas = list(queryset.order_by(*ORDEN)[: limite + 1])
+        self.siguiente = _codificar(filas[limite - 1]) if len(filas) > limite else None
+        return filas[:limite]
+
+    def _limite(self, request):
+        try:
+            limite = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(limite, self.max_page_size))
+
+    def get_next_link(self):
+        if self.siguiente is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.siguiente)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,154 @@
+"""
+Planificador de cocina: ordena los tickets pendientes (CREADO,
+EN_PREPARACION) por prioridad en vez de por llegada.
+
+Para cada ticket (un pedido; si tiene varias líneas cuenta la más lenta,
+y su estación):
+
+    vence   = creado_en + tiempo objetivo del plato (menu_stock.Plato)
+    sirve   = max(vence) de los tickets activos de su mesa
+    limite  = sirve - tiempo objetivo   (a más tardar empezar aquí)
+    clave   = limite - carga de su estación / cocineros por estación
+
+`limite` hace que los platos de una mesa salgan juntos (cuando puede
+estar listo el más lento): el más largo empieza antes y los cortos esperan
+su turno. La carga de la estación
+(segundos de trabajo pendiente) adelanta los tickets de las estaciones
+atrasadas. Ninguna parte depende del reloj, así que el orden sólo cambia
+cuando cambia un ticket.
+
+Cada estación tiene una lista ordenada de (limite, id), mantenida con
+bisect: un cambio saca la entrada vieja e inserta la nueva, y sólo se
+recalculan los tickets de la mesa afectada. La carga se aplica al mezclar
+las estaciones, porque desplaza por igual a todos los tickets de una.
+`version` aumenta con cada cambio que puede mover el orden; orden() se
+calcula una vez por versión (una mezcla de las listas, sin ordenar).
+
+No es seguro entre hilos por sí solo: ColaCocina lo usa con su lock.
+"""
+import bisect
+import datetime
+import heapq
+
+PLANIFICABLES = ("CREADO", "EN_PREPARACION")
+
+
+def _segundos(iso):
+    return datetime.datetime.fromisoformat(iso).timestamp()
+
+
+def _iso(segundos):
+    return datetime.datetime.fromtimestamp(segundos, tz=datetime.timezone.utc).isoformat()
+
+
+class Planificador:
+    def __init__(self, cocineros=2, objetivo_defecto=15 * 60, estacion_defecto="cocina"):
+        self.cocineros = max(1, cocineros)
+        self.objetivo_defecto = objetivo_defecto
+        self.estacion_defecto = estacion_defecto
+        self._platos = {}     # plato -> (objetivo en segundos, estación)
+        self._tickets = {}    # id -> datos de planificación
+        self._mesas = {}      # mesa -> {ids}
+        self._listas = {}     # estación -> [(limite, id)] ordenada
+        self._carga = {}      # estación -> segundos de trabajo pendiente
+        self.version = 0
+        self._orden = (None, [])  # (versión, orden()) ya calculado
+
+    def cargar_platos(self, platos):
+        """platos: iterable de (plato_id, minutos, estación). Recalcula si cambió algo."""
+        nuevos = {str(pk): (minutos * 60, estacion) for pk, minutos, estacion in platos}
+        if nuevos == self._platos:
+            return
+        self._platos = nuevos
+        self.version += 1
+        tickets = [t["ticket"] for t in self._tickets.values()]
+        self._tickets, self._mesas, self._listas, self._carga = {}, {}, {}, {}
+        for ticket in tickets:
+            self.poner(ticket)
+
+    def poner(self, ticket):
+        """Agrega o actualiza un ticket (dict de cola_cocina)."""
+        pid = ticket["id"]
+        if ticket["estado"] not in PLANIFICABLES:
+            self.quitar(pid)
+            return
+        objetivo, estacion = self._plato_de(ticket)
+        mesa = ticket["mesa"] or pid  # sin mesa: grupo propio
+        vence = _segundos(ticket["creado_en"]) + objetivo
+        previo = self._tickets.get(pid)
+        if previo is not None:
+            if (previo["mesa"], previo["estacion"], previo["vence"]) == (mesa, estacion, vence):
+                previo["ticket"] = ticket  # p.ej. CREADO -> EN_PREPARACION: misma clave
+                return
+            self.quitar(pid)
+        self._tickets[pid] = {
+            "ticket": ticket, "mesa": mesa, "estacion": estacion,
+            "objetivo": objetivo, "vence": vence, "limite": None,
+        }
+        self._mesas.setdefault(mesa, set()).add(pid)
+        self._carga[estacion] = self._carga.get(estacion, 0) + objetivo
+        self.version += 1
+        self._reordenar_mesa(mesa)
+
+    def _plato_de(self, ticket):
+        """(objetivo, estación) del ticket: el de su línea más lenta, o de `plato`."""
+        defecto = (self.objetivo_defecto, self.estacion_defecto)
+        platos = [i["plato"] for i in ticket.get("items") or ()] or [ticket["plato"]]
+        return max(self._platos.get(str(p), defecto) for p in platos)
+
+    def quitar(self, pid):
+        t = self._tickets.pop(pid, None)
+        if t is None:
+            return
+        self._sacar(t, pid)
+        self._carga[t["estacion"]] -= t["objetivo"]
+        self.version += 1
+        grupo = self._mesas[t["mesa"]]
+        grupo.discard(pid)
+        if grupo:
+            self._reordenar_mesa(t["mesa"])
+        else:
+            del self._mesas[t["mesa"]]
+
+    def _reordenar_mesa(self, mesa):
+        ids = self._mesas[mesa]
+        sirve = max(self._tickets[pid]["vence"] for pid in ids)
+        for pid in ids:
+            t = self._tickets[pid]
+            limite = sirve - t["objetivo"]
+            if limite == t["limite"]:
+                continue
+            self._sacar(t, pid)
+            t["limite"], t["inicio_limite"] = limite, _iso(limite)
+            bisect.insort(self._listas.setdefault(t["estacion"], []), (limite, pid))
+
+    def _sacar(self, t, pid):
+        if t["limite"] is None:
+            return
+        lista = self._listas[t["estacion"]]
+        del lista[bisect.bisect_left(lista, (t["limite"], pid))]
+
+    def siguiente(self, estacion):
+        """Id del ticket más urgente de la estación (o None), sin sacarlo."""
+        lista = self._listas.get(estacion)
+        return lista[0][1] if lista else None
+
+    def orden(self):
+        """
+        [{"id", "estacion", "inicio_limite"}] de mayor a menor prioridad:
+        cada estación en orden de `limite`, mezcladas según su carga.
+        Devuelve la misma lista mientras no cambie `version` (no modificarla).
+        """
+        version, orden = self._orden
+        if version == self.version:
+            return orden
+        por_estacion = []
+        for estacion, lista in self._listas.items():
+            demora = self._carga.get(estacion, 0) / self.cocineros
+            por_estacion.append([(limite - demora, pid, estacion) for limite, pid in lista])
+        orden = [
+            {"id": pid, "estacion": estacion, "inicio_limite": self._tickets[pid]["inicio_limite"]}
+            for _, pid, estacion in heapq.merge(*por_estacion)
+        ]
+        self._orden = (self.version, orden)
+        return orden
@@ -0,0 +1,76 @@
+"""
+Outbox de integraciones: las llamadas a M1 (stock) y M4 (cocina) que
+provoca una transición se guardan como MensajeSalida en la misma
+transacción que el UPDATE del pedido. La petición sólo hace trabajo local;
+el despachador (despachador.py, `manage.py despachar_salida`) las envía
+después, en orden por pedido y con reintentos.
+
+    confirmar -> reservar (M1), enviar (M4)
+    entregar  -> descontar (M1: confirma la reserva)
+    cancelar  -> liberar (M1), si el pedido ya estaba confirmado
+
+Si la transacción se revierte, los mensajes también: nunca se reserva
+stock para una transición que no ocurrió.
+"""
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .adapters import CocinaClientM4, items_de_pedido
+from .models import ESTADOS_ACTIVOS, MensajeSalida
+
+Op = MensajeSalida.Operacion
+
+
+def mensajes_de(pedido, accion, estado_anterior):
+    """Los MensajeSalida (sin guardar) que corresponden a la transición."""
+    if accion == "confirmar":
+        items = items_de_pedido(pedido)
+        return [
+            MensajeSalida(pedido=pedido, operacion=Op.RESERVAR, payload={"items": items}),
+            MensajeSalida(pedido=pedido, operacion=Op.ENVIAR, payload=CocinaClientM4._payload(pedido, items)),
+        ]
+    if accion == "entregar":
+        return [MensajeSalida(pedido=pedido, operacion=Op.DESCONTAR)]
+    if accion == "cancelar" and estado_anterior != "CREADO":
+        return [MensajeSalida(pedido=pedido, operacion=Op.LIBERAR)]
+    return []
+
+
+def encolar(transiciones):
+    """
+    transiciones: iterable de (pedido, accion, estado_anterior). Un solo
+    INSERT para todas; llamar dentro de la transacción de la transición.
+    """
+    mensajes = [m for t in transiciones for m in mensajes_de(*t)]
+    if mensajes:
+        MensajeSalida.objects.bulk_create(mensajes)
+    return mensajes
+
+
+def reintentar_fallidos():
+    """
+    Vuelve a PENDIENTE los mensajes FALLIDO de pedidos todavía activos
+    (p.ej. una reserva que agotó los reintentos con M1 caído), y lo que
+    esperaba detrás de ellos queda para ya. Devuelve cuántos.
+    """
+    E = MensajeSalida.Estado
+    ahora = timezone.now()
+    fallidos = MensajeSalida.objects.filter(estado=E.FALLIDO, pedido__estado__in=ESTADOS_ACTIVOS)
+    pedidos = list(fallidos.values_list("pedido_id", flat=True).distinct())
+    n = fallidos.update(estado=E.PENDIENTE, intentos=0, proximo_intento=ahora, error="")
+    MensajeSalida.objects.filter(pedido_id__in=pedidos, estado=E.PENDIENTE).update(proximo_intento=ahora)
+    return n
+
+
+def resumen():
+    """Mensajes por estado y antigüedad (segundos) del pendiente más viejo."""
+    por_estado = dict(
+        MensajeSalida.objects.values_list("estado").annotate(n=Count("id")).order_by()
+    )
+    mas_viejo = MensajeSalida.objects.filter(estado=MensajeSalida.Estado.PENDIENTE).aggregate(
+        m=Min("creado_en")
+    )["m"]
+    return {
+        "por_estado": {e: por_estado.get(e, 0) for e in MensajeSalida.Estado.values},
+        "retraso_s": round((timezone.now() - mas_viejo).total_seconds(), 3) if mas_viejo else 0.0,
+    }
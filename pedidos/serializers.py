@@ -1,11 +1,63 @@
 from rest_framework import serializers
-from .models import Pedido
+from menu_stock.models import Plato
+
+from .models import Pedido, PedidoItem
+
+
+class PedidoItemSerializer(serializers.ModelSerializer):
+    # id del plato sin PrimaryKeyRelatedField: PedidoSerializer valida todos
+    # los platos de la mesa con una sola consulta
+    plato = serializers.IntegerField(source="plato_id", min_value=1)
+
+    class Meta:
+        model = PedidoItem
+        fields = ["id", "plato", "cantidad", "notas", "estado"]
+        read_only_fields = ["id", "estado"]
+        extra_kwargs = {"cantidad": {"min_value": 1}}
+
 
 class PedidoSerializer(serializers.ModelSerializer):
+    """`campos` limita la respuesta a esos campos (parámetro ?fields= de la API)."""
+
+    items = PedidoItemSerializer(many=True, required=False)
+
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+    def validate_items(self, items):
+        if not items:
+            return items
+        ids = {item["plato_id"] for item in items}
+        existentes = set(Plato.objects.filter(pk__in=ids, activo=True).values_list("pk", flat=True))
+        faltan = sorted(ids - existentes)
+        if faltan:
+            raise serializers.ValidationError(
+                f"Platos inexistentes o inactivos: {', '.join(map(str, faltan))}."
+            )
+        return items
+
+    def update(self, instance, validated_data):
+        # las líneas se crean con el pedido (services.crear_pedido)
+        if validated_data.pop("items", None):
+            raise serializers.ValidationError({"items": "Las líneas de un pedido no se modifican."})
+        return super().update(instance, validated_data)
+
     class Meta:
         model = Pedido
         fields = [
-            "id", "mesa", "cliente", "plato",
+            "id", "mesa", "mesa_ref", "cliente", "plato", "items",
             "estado",
             "creado_en", "actualizado_en", "entregado_en",
         ]
+        # el estado sólo cambia por las transiciones (services), que liberan
+        # la mesa y publican a los tableros, la ocupación y la cola de cocina
+        read_only_fields = ["estado", "creado_en", "actualizado_en", "entregado_en"]
+
+
+class TransicionSerializer(serializers.Serializer):
+    """Item de POST /api/pedidos/transiciones/."""
+    id = serializers.UUIDField()
+    accion = serializers.ChoiceField(choices=list(Pedido.TRANSICIONES))
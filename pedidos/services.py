@@ -0,0 +1,365 @@
+"""
+Capa de servicios de pedidos.
+
+La API (PedidoViewSet) y la interfaz web (ui) llaman a estas funciones
+directamente, en el mismo proceso, en vez de hacer peticiones HTTP a
+/api/pedidos/ contra el propio servidor.
+"""
+import asyncio
+from collections import defaultdict
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Value, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from mesas.models import Mesa
+
+from . import ocupacion, salida
+from .adapters import CocinaClientM4, StockClientM1, items_de_pedido
+from .eventos import publicar_cambio
+from .models import ESTADOS_ACTIVOS, Pedido, PedidoEvento, PedidoItem
+
+ESTADOS_FINALES = [Pedido.Estado.CERRADO, Pedido.Estado.CANCELADO]
+
+# accion -> nombre del método de transición del modelo
+ACCIONES = {
+    "confirmar": "confirmar",
+    "listo": "marcar_listo",
+    "entregar": "entregar",
+    "cerrar": "cerrar",
+    "cancelar": "cancelar",
+}
+
+
+class IntegracionFallida(Exception):
+    """M1 o M4 rechazó o no respondió; `status` es el código HTTP sugerido."""
+
+    def __init__(self, detalle, status=502):
+        super().__init__(detalle)
+        self.status = status
+
+
+def _mesa_local(mesa):
+    if mesa is None or not str(mesa).isdigit():
+        return None
+    return Mesa.objects.filter(numero=int(mesa)).first()
+
+
+def crear_pedido(mesa=None, cliente=None, plato="", mesa_ref=None, items=None):
+    """
+    Crea un pedido. La regla de una mesa con un solo pedido activo la
+    aplica el índice único parcial al insertar (sin consulta previa);
+    save() la traduce a ValidationError.
+
+    Si `mesa` es el número de una mesa local (o se pasa `mesa_ref`), el
+    pedido queda enlazado a ella y save() la marca OCUPADA en la misma
+    transacción.
+
+    `items` son las líneas [{"plato_id", "cantidad", "notas"}] de toda la
+    mesa: se insertan con un solo bulk_create en la transacción del pedido,
+    sin importar cuántos platos lleve.
+    """
+    if mesa_ref is None:
+        mesa_ref = _mesa_local(mesa)
+    elif mesa in (None, ""):
+        mesa = str(mesa_ref.numero)
+    pedido = Pedido(mesa=mesa, cliente=cliente, plato=plato or "", mesa_ref=mesa_ref)
+    pedido.full_clean(validate_unique=False, validate_constraints=False)
+    if not items:
+        pedido.save()
+        return pedido
+
+    lineas = [
+        PedidoItem(
+            pedido=pedido,
+            plato_id=item["plato_id"],
+            cantidad=item.get("cantidad", 1),
+            notas=item.get("notas", ""),
+        )
+        for item in items
+    ]
+    # el evento de creación (publicar_cambio) ya lleva las líneas
+    pedido._items_nuevos = lineas
+    with transaction.atomic():
+        pedido.save()
+        PedidoItem.objects.bulk_create(lineas)
+        PedidoEvento.de(
+            pedido, PedidoEvento.Tipo.CREADO, ocurrido_en=pedido.creado_en,
+            datos=PedidoEvento.lineas(lineas, completas=True),
+        ).save()
+    return pedido
+
+
+def obtener_pedido(pedido_id):
+    return Pedido.objects.prefetch_related("items").get(pk=pedido_id)
+
+
+def transicionar(pedido, accion):
+    """
+    Aplica una acción de transición ("confirmar", "listo", "entregar",
+    "cerrar", "cancelar") a un pedido o a un id de pedido.
+    Lanza Pedido.DoesNotExist o ValidationError.
+
+    Con INTEGRACIONES_OUTBOX las llamadas a M1/M4 que correspondan quedan
+    escritas en la misma transacción (salida.py); no se hacen aquí.
+    """
+    metodo = ACCIONES.get(accion)
+    if metodo is None:
+        raise ValidationError(f"Acción inválida: {accion}.")
+    if not isinstance(pedido, Pedido):
+        pedido = obtener_pedido(pedido)
+    anterior = pedido.estado
+    if not settings.INTEGRACIONES_OUTBOX:
+        getattr(pedido, metodo)()
+        return pedido
+    with transaction.atomic():
+        getattr(pedido, metodo)()
+        salida.encolar([(pedido, accion, anterior)])
+    return pedido
+
+
+def transicionar_lote(items, esperar=False):
+    """
+    Aplica una lista de {"id", "accion"} en una sola transacción.
+
+    Lee los pedidos con un SELECT, simula las acciones en orden (un mismo
+    pedido puede aparecer varias veces, p.ej. "entregar" y luego "cerrar")
+    y escribe con un UPDATE por grupo (estado inicial -> estado final).
+    Devuelve un resultado por item: {"resultado": "ok", "estado": ...} o
+    {"resultado": "conflicto", "detalle": ...}.
+
+    En PostgreSQL el SELECT bloquea las filas (FOR UPDATE SKIP LOCKED): los
+    pedidos que otro lote tiene tomados se informan como conflicto en vez
+    de esperar a que termine. SQLite serializa las escrituras y lo ignora.
+    Con `esperar` (webhook de cocina: el resultado debe ser definitivo) se
+    espera a esas filas, tomadas en orden de id para no cruzarse con otro
+    lote.
+
+    Las llamadas a M1/M4 de todo el lote van al outbox con un solo INSERT,
+    y los PedidoEvento del historial (uno por acción aplicada) con otro.
+    """
+    E = Pedido.Estado
+    ids = {str(item["id"]) for item in items}
+    resultados = []
+    with transaction.atomic():
+        filas = Pedido.objects.select_for_update(skip_locked=not esperar).filter(pk__in=ids).only(
+            "id", "mesa", "mesa_ref", "cliente", "plato", "estado", "creado_en", "entregado_en"
+        )
+        if esperar:
+            filas = filas.order_by("pk")
+        pedidos = {str(p.pk): p for p in filas}
+        bloqueados = set()
+        if (
+            not esperar and len(pedidos) < len(ids)
+            and connection.features.has_select_for_update_skip_locked
+        ):
+            # los que faltan pueden no existir o estar bloqueados por otra transacción
+            bloqueados = {
+                str(pk) for pk in
+                Pedido.objects.filter(pk__in=ids - pedidos.keys()).values_list("pk", flat=True)
+            }
+        iniciales = {pid: p.estado for pid, p in pedidos.items()}
+        actuales = dict(iniciales)
+        entregados = set()
+        hechas = []  # (id, accion, estado anterior) para el historial y el outbox
+
+        for item in items:
+            pid, accion = str(item["id"]), item["accion"]
+            res = {"id": pid, "accion": accion}
+            resultados.append(res)
+            if pid in bloqueados:
+                res.update(resultado="conflicto", detalle="El pedido está siendo modificado por otra operación.")
+                continue
+            if pid not in actuales:
+                res.update(resultado="conflicto", detalle="Pedido no existe.")
+                continue
+            desde, hacia, mensaje = Pedido.TRANSICIONES[accion]
+            if actuales[pid] not in desde:
+                res.update(resultado="conflicto", detalle=mensaje)
+                continue
+            hechas.append((pid, accion, actuales[pid]))
+            actuales[pid] = hacia
+            if hacia == E.ENTREGADO:
+                entregados.add(pid)
+            res.update(resultado="ok", estado=hacia)
+
+        grupos = defaultdict(list)
+        for pid, final in actuales.items():
+            if final != iniciales[pid]:
+                grupos[(iniciales[pid], final, pid in entregados)].append(pid)
+
+        ahora = timezone.now()
+        fallidos = set()
+        mesas_libres = set()
+        for (inicial, final, entregado), pids in grupos.items():
+            cambios = {"estado": final, "actualizado_en": ahora}
+            if entregado:
+                cambios["entregado_en"] = Coalesce("entregado_en", Value(ahora))
+            filas = Pedido.objects.filter(pk__in=pids, estado=inicial).update(**cambios)
+            if filas != len(pids):
+                # otro proceso alcanzó a cambiar alguno entre el SELECT y el UPDATE
+                cambiados = set(
+                    str(pk) for pk in
+                    Pedido.objects.filter(pk__in=pids, estado=final).values_list("pk", flat=True)
+                )
+                fallidos.update(set(pids) - cambiados)
+
+            for pid in pids:
+                if pid in fallidos:
+                    continue
+                p = pedidos[pid]
+                p.estado = final
+                p.actualizado_en = ahora
+                if entregado and p.entregado_en is None:
+                    p.entregado_en = ahora
+                if p.mesa_ref_id and final in ESTADOS_FINALES:
+                    mesas_libres.add(p.mesa_ref_id)
+                publicar_cambio(p, inicial)
+
+        if mesas_libres:
+            Mesa.liberar(mesas_libres)
+        # un evento por acción aplicada (p.ej. entregar y cerrar: dos)
+        historial = []
+        for pid, accion, antes in hechas:
+            if pid not in fallidos:
+                evento = PedidoEvento.de(pedidos[pid], PedidoEvento.Tipo.ESTADO, antes, ahora)
+                evento.estado = Pedido.TRANSICIONES[accion][1]
+                historial.append(evento)
+        if historial:
+            PedidoEvento.objects.bulk_create(historial)
+
+        if settings.INTEGRACIONES_OUTBOX:
+            hechas = [(pedidos[pid], accion, antes) for pid, accion, antes in hechas if pid not in fallidos]
+            confirmados = [p for p, accion, _ in hechas if accion == "confirmar"]
+            if confirmados:
+                prefetch_related_objects(confirmados, "items")
+            salida.encolar(hechas)
+
+    for res in resultados:
+        if res["id"] in fallidos and res["resultado"] == "ok":
+            res.pop("estado")
+            res.update(resultado="conflicto", detalle="El pedido fue modificado por otra operación.")
+    return resultados
+
+
+async def aconfirmar(pedido):
+    """
+    Confirma un pedido reservando stock (M1) y enviándolo a cocina (M4) en
+    paralelo, sin bloquear el worker mientras responden. Sólo si ambas
+    llamadas salen bien pasa a EN_PREPARACION; si cocina falla se libera la
+    reserva. Si falta stock la cocina ya recibió el ticket, pero el pedido
+    sigue CREADO y su LISTO será rechazado.
+
+    El estado se toma al final con el UPDATE condicional: si otra
+    confirmación (u otra acción) ganó mientras M1/M4 respondían, se libera
+    la reserva de ésta antes de informar el conflicto. El ticket repetido
+    lleva el mismo id de pedido que el del ganador.
+    """
+    desde, _, mensaje = Pedido.TRANSICIONES["confirmar"]
+    if pedido.estado not in desde:
+        raise ValidationError(mensaje)
+
+    m1, m4 = StockClientM1(), CocinaClientM4()
+    items = await sync_to_async(items_de_pedido)(pedido)
+    reserva, envio = await asyncio.gather(
+        m1.avalidar_reservar(pedido.id, items),
+        m4.aenviar_pedido(pedido, items),
+        return_exceptions=True,
+    )
+    if isinstance(reserva, BaseException):
+        status = 502
+        if isinstance(reserva, httpx.HTTPStatusError) and reserva.response.status_code == 409:
+            status = 409
+        raise IntegracionFallida(f"Stock (M1): {reserva}", status)
+    if isinstance(envio, BaseException):
+        await _aliberar(m1, reserva)
+        raise IntegracionFallida(f"Cocina (M4): {envio}")
+
+    try:
+        await sync_to_async(pedido.confirmar)()
+    except ValidationError:
+        await _aliberar(m1, reserva)
+        raise
+    return pedido
+
+
+async def _aliberar(m1, reserva):
+    """Libera (sin propagar errores) la reserva devuelta por M1, si la hay."""
+    reserva_id = reserva.get("reserva_id") if isinstance(reserva, dict) else None
+    if reserva_id:
+        try:
+            await m1.aliberar_reserva(reserva_id)
+        except Exception:
+            pass
+
+
+async def atransicionar(pedido_id, accion):
+    """
+    Versión asíncrona de transicionar(). Sin outbox, "confirmar" pasa por
+    aconfirmar() (M1 y M4 dentro de la petición).
+    """
+    if accion not in ACCIONES:
+        raise ValidationError(f"Acción inválida: {accion}.")
+    pedido = await Pedido.objects.prefetch_related("items").aget(pk=pedido_id)
+    if accion == "confirmar" and not settings.INTEGRACIONES_OUTBOX:
+        return await aconfirmar(pedido)
+    await sync_to_async(transicionar)(pedido, accion)
+    return pedido
+
+
+def es_conflicto(error):
+    """True si la transición falló porque otro proceso cambió el pedido antes."""
+    return any(e.code == "conflicto" for e in getattr(error, "error_list", []))
+
+
+def listar_pedidos():
+    """Todos los pedidos, más recientes primero (con sus líneas: una consulta más)."""
+    return Pedido.objects.prefetch_related("items")
+
+
+def listar_activos():
+    """
+    Pedidos no finalizados, en orden de llegada. Filtra por los estados
+    activos (no exclude de los finales) para que coincida con la condición
+    del índice parcial pedido_activos_cola_idx.
+    """
+    return Pedido.objects.filter(estado__in=ESTADOS_ACTIVOS).order_by("creado_en")
+
+
+def filtrar_pedidos(estados=None, mesa=None, desde=None, hasta=None, campos=None):
+    """
+    Pedidos filtrados en la base (no en Python). `campos` limita las
+    columnas leídas; id y creado_en se leen siempre (cursor de paginación).
+    Las líneas (items) se traen con una sola consulta extra por página, y
+    sólo si se piden.
+    """
+    qs = Pedido.objects.all()
+    if not campos or "items" in campos:
+        qs = qs.prefetch_related("items")
+    if estados:
+        qs = qs.filter(estado__in=estados)
+    if mesa not in (None, ""):
+        qs = qs.filter(mesa=str(mesa))
+    if desde:
+        qs = qs.filter(creado_en__gte=desde)
+    if hasta:
+        qs = qs.filter(creado_en__lt=hasta)
+    if campos:
+        qs = qs.only("id", "creado_en", *(c for c in campos if c != "items"))
+    return qs
+
+
+def listar_por_mesa(mesa, solo_activos=True):
+    qs = Pedido.objects.filter(mesa=str(mesa))
+    if solo_activos:
+        qs = qs.exclude(estado__in=ESTADOS_FINALES)
+    return qs
+
+
+def mesa_ocupada(mesa):
+    """Consulta el índice de ocupación (ocupacion.py): sin leer pedidos."""
+    return ocupacion.pedido_activo(mesa) is not None
@@ -1,3 +1,1207 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+
+from menu_stock.models import CategoriaMenu, Plato
+from mesas.models import Mesa
+from pedidos import (
+    adapters, cola_cocina, despachador, eventos, historial, idempotencia, ocupacion, salida, services,
+)
+from pedidos.models import (
+    EventoCocina, MensajeSalida, Pedido, PedidoEvento, PedidoItem, RespuestaIdempotente,
+)
+from pedidos.planificador import Planificador
+
+
+class ServiciosPedidoTest(TestCase):
+    def setUp(self):
+        ocupacion.indice.invalidar()
+        self.addCleanup(ocupacion.indice.invalidar)
+
+    def test_crear_y_transicionar(self):
+        p = services.crear_pedido(mesa="5", cliente="Ana", plato="1")
+        for accion, estado in [
+            ("confirmar", Pedido.Estado.EN_PREPARACION),
+            ("listo", Pedido.Estado.LISTO),
+            ("entregar", Pedido.Estado.ENTREGADO),
+            ("cerrar", Pedido.Estado.CERRADO),
+        ]:
+            services.transicionar(p.id, accion)
+            p.refresh_from_db()
+            self.assertEqual(p.estado, estado)
+        self.assertIsNotNone(p.entregado_en)
+
+    def test_mesa_con_pedido_activo(self):
+        services.crear_pedido(mesa="5", cliente="Ana")
+        self.assertTrue(services.mesa_ocupada("5"))
+        with self.assertRaises(ValidationError):
+            services.crear_pedido(mesa="5", cliente="Beto")
+
+    def test_listar_activos_y_por_mesa(self):
+        a = services.crear_pedido(mesa="1", cliente="A")
+        b = services.crear_pedido(mesa="2", cliente="B")
+        services.transicionar(b, "cancelar")
+        self.assertEqual(list(services.listar_activos()), [a])
+        self.assertEqual(list(services.listar_por_mesa("2", solo_activos=False)), [b])
+
+    def test_accion_invalida(self):
+        p = services.crear_pedido(mesa="1")
+        with self.assertRaises(ValidationError):
+            services.transicionar(p, "volar")
+
+
+class OcupacionMesasTest(TestCase):
+    def setUp(self):
+        ocupacion.indice.invalidar()
+        self.addCleanup(ocupacion.indice.invalidar)
+
+    def test_carga_solo_pedidos_activos(self):
+        a = Pedido.objects.create(mesa="1")
+        Pedido.objects.create(mesa="2", estado=Pedido.Estado.CERRADO)
+        Pedido.objects.create(mesa="3", estado=Pedido.Estado.CANCELADO)
+        self.assertEqual(ocupacion.ocupacion_actual(), {"1": str(a.id)})
+
+    def test_transiciones_actualizan_el_indice_sin_consultas(self):
+        ocupacion.cargar_desde_bd()
+        with self.captureOnCommitCallbacks(execute=True):
+            p = services.crear_pedido(mesa="4")
+        with self.assertNumQueries(0):
+            self.assertTrue(services.mesa_ocupada("4"))
+        with self.captureOnCommitCallbacks(execute=True):
+            services.transicionar_lote([{"id": p.id, "accion": "cancelar"}])
+        with self.assertNumQueries(0):
+            self.assertFalse(services.mesa_ocupada("4"))
+
+    def test_sin_commit_no_cambia(self):
+        ocupacion.cargar_desde_bd()
+        services.crear_pedido(mesa="5")  # la transacción del test nunca confirma
+        self.assertFalse(services.mesa_ocupada("5"))
+
+    def test_cierre_de_pedido_viejo_no_libera_la_mesa(self):
+        indice = ocupacion.IndiceOcupacion()
+        indice.cargar([("6", "nuevo")])
+        indice.aplicar("6", "viejo", "CERRADO")
+        self.assertEqual(indice.pedido_de("6"), "nuevo")
+
+    def test_cambios_durante_la_carga_no_se_pierden(self):
+        indice = ocupacion.IndiceOcupacion()
+        indice.cargar([("7", "a")])
+
+        def consulta():  # la lectura ve la base de antes de estas transiciones
+            indice.aplicar("7", "a", "CERRADO")
+            indice.aplicar("8", "b", "CREADO")
+            yield ("7", "a")
+
+        indice.cargar(consulta(), desde=indice.generacion)
+        self.assertEqual(indice.ocupacion(), {"8": "b"})
+        self.assertTrue(indice.vigente(30))
+
+    def test_registro_desbordado_durante_la_carga_obliga_a_recargar(self):
+        indice = ocupacion.IndiceOcupacion(capacidad=1)
+        desde = indice.generacion
+        indice.aplicar("7", "a", "CREADO")
+        indice.aplicar("8", "b", "CREADO")
+        indice.cargar([], desde=desde)
+        self.assertEqual(indice.ocupacion(), {"8": "b"})
+        self.assertFalse(indice.vigente(30))
+
+    def test_resync(self):
+        reloj = mock.Mock(return_value=0.0)
+        indice = ocupacion.IndiceOcupacion(reloj=reloj)
+        indice.cargar([])
+        self.assertTrue(indice.vigente(30))
+        reloj.return_value = 31.0
+        self.assertFalse(indice.vigente(30))
+
+
+class TransicionCondicionalTest(TestCase):
+    def test_una_sola_consulta(self):
+        p = Pedido.objects.create(mesa="1")
+        with self.assertNumQueries(2):  # UPDATE condicional + INSERT en el historial
+            p.confirmar()
+        p.refresh_from_db()
+        self.assertEqual(p.estado, Pedido.Estado.EN_PREPARACION)
+
+    def test_entregar_fija_entregado_en(self):
+        p = Pedido.objects.create(mesa="1", estado=Pedido.Estado.LISTO)
+        p.entregar()
+        self.assertIsNotNone(p.entregado_en)
+        p.refresh_from_db()
+        self.assertIsNotNone(p.entregado_en)
+
+    def test_conflicto_con_instancia_desactualizada(self):
+        p = Pedido.objects.create(mesa="1")
+        otra = Pedido.objects.get(pk=p.pk)
+        p.confirmar()
+        with self.assertRaises(ValidationError) as ctx:
+            otra.confirmar()
+        self.assertTrue(services.es_conflicto(ctx.exception))
+        self.assertEqual(ctx.exception.messages, ["Solo se puede confirmar un pedido en estado CREADO."])
+
+
+class MesaActivaUnicaTest(TestCase):
+    def test_indice_parcial_rechaza_segundo_activo(self):
+        Pedido.objects.create(mesa="4")
+        with self.assertRaises(ValidationError) as ctx:
+            Pedido.objects.create(mesa="4")
+        self.assertEqual(ctx.exception.messages, ["La mesa ya tiene un pedido activo."])
+
+    def test_mesa_libre_tras_cancelar(self):
+        p = Pedido.objects.create(mesa="4")
+        p.cancelar()
+        Pedido.objects.create(mesa="4")
+        self.assertEqual(Pedido.objects.filter(mesa="4").count(), 2)
+
+    def test_crear_sin_consulta_previa(self):
+        with self.assertNumQueries(5):  # mesa local, SAVEPOINT, INSERT, INSERT historial, RELEASE
+            services.crear_pedido(mesa="9")
+
+
+class MesaEstadoTest(APITestCase):
+    def setUp(self):
+        self.mesa = Mesa.objects.create(numero=5, capacidad=4)
+
+    def _estado(self):
+        self.mesa.refresh_from_db()
+        return self.mesa.estado
+
+    def test_crear_ocupa_y_cerrar_libera(self):
+        p = services.crear_pedido(mesa="5", cliente="Ana")
+        self.assertEqual(p.mesa_ref, self.mesa)
+        self.assertEqual(self._estado(), Mesa.OCUPADA)
+        for accion in ("confirmar", "listo", "entregar"):
+            services.transicionar(p, accion)
+            self.assertEqual(self._estado(), Mesa.OCUPADA)
+        services.transicionar(p, "cerrar")
+        self.assertEqual(self._estado(), Mesa.LIBRE)
+
+    def test_cancelar_en_lote_libera(self):
+        p = services.crear_pedido(mesa_ref=self.mesa, cliente="Ana")
+        self.assertEqual(p.mesa, "5")
+        services.transicionar_lote([{"id": p.id, "accion": "cancelar"}])
+        self.assertEqual(self._estado(), Mesa.LIBRE)
+
+    def test_mesa_rechazada_no_queda_ocupada(self):
+        Pedido.objects.create(mesa="5")  # activo sin enlazar: el índice único igual aplica
+        with self.assertRaises(ValidationError):
+            services.crear_pedido(mesa="5")
+        self.assertEqual(self._estado(), Mesa.LIBRE)
+
+    def test_patch_no_cambia_estado(self):
+        p = services.crear_pedido(mesa="5", cliente="Ana")
+        r = self.client.patch(
+            reverse("pedido-detail", args=[p.id]), {"estado": "CERRADO", "cliente": "Beto"}, format="json",
+        )
+        self.assertEqual(r.status_code, 200)
+        p.refresh_from_db()
+        self.assertEqual((p.estado, p.cliente), (Pedido.Estado.CREADO, "Beto"))
+        self.assertEqual(self._estado(), Mesa.OCUPADA)
+
+    def test_mesa_externa_sin_enlace(self):
+        p = services.crear_pedido(mesa="A3")
+        self.assertIsNone(p.mesa_ref)
+
+
+class PedidoApiTest(APITestCase):
+    def test_crear_rechaza_mesa_ocupada(self):
+        url = reverse("pedido-list")
+        r1 = self.client.post(url, {"mesa": "7", "cliente": "Ana"}, format="json")
+        self.assertEqual(r1.status_code, 201)
+        r2 = self.client.post(url, {"mesa": "7", "cliente": "Beto"}, format="json")
+        self.assertEqual(r2.status_code, 400)
+
+    def test_crear_ignora_estado(self):
+        r = self.client.post(reverse("pedido-list"), {"mesa": "7", "estado": "CREADO"}, format="json")
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.data["estado"], Pedido.Estado.CREADO)
+
+    def test_transicion_invalida(self):
+        p = Pedido.objects.create(mesa="8")
+        r = self.client.patch(reverse("pedido-cerrar", args=[p.id]))
+        self.assertEqual(r.status_code, 400)
+
+
+class PedidoItemsTest(APITestCase):
+    def setUp(self):
+        for estructura in (ocupacion.indice, cola_cocina.cola):
+            estructura.invalidar()
+            self.addCleanup(estructura.invalidar)
+        cat = CategoriaMenu.objects.create(nombre="Fondos")
+        self.lomo = Plato.objects.create(nombre="Lomo", precio=9000, categoria=cat, tiempo_preparacion=25)
+        self.ensalada = Plato.objects.create(nombre="Ensalada", precio=4000, categoria=cat, tiempo_preparacion=5)
+
+    def _items(self, n):
+        return [{"plato_id": self.lomo.pk if i % 2 else self.ensalada.pk, "cantidad": 1} for i in range(n)]
+
+    def test_crear_con_items_en_consultas_constantes(self):
+        # mesa local, SAVEPOINT x2, INSERT pedido, RELEASE, INSERT líneas,
+        # INSERT historial, RELEASE
+        for mesa, n in (("1", 1), ("2", 6)):
+            with self.assertNumQueries(8):
+                p = services.crear_pedido(mesa=mesa, items=self._items(n))
+            self.assertEqual(p.items.count(), n)
+
+    def test_api_crea_mesa_completa(self):
+        body = {"mesa": "4", "cliente": "Ana", "items": [
+            {"plato": self.lomo.pk, "cantidad": 2, "notas": "a punto"},
+            {"plato": self.ensalada.pk},
+        ]}
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post(reverse("pedido-list"), body, format="json")
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(
+            [(i["plato"], i["cantidad"], i["notas"], i["estado"]) for i in r.data["items"]],
+            [(self.lomo.pk, 2, "a punto", "PENDIENTE"), (self.ensalada.pk, 1, "", "PENDIENTE")],
+        )
+        # la cola de cocina recibe las líneas con el evento de creación
+        ticket = next(t for t in cola_cocina.cola.leer()["tickets"] if t["id"] == r.data["id"])
+        self.assertEqual([i["plato"] for i in ticket["items"]], [self.lomo.pk, self.ensalada.pk])
+
+    def test_api_rechaza_plato_inexistente(self):
+        body = {"mesa": "4", "items": [{"plato": self.lomo.pk}, {"plato": 999}]}
+        r = self.client.post(reverse("pedido-list"), body, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("999", str(r.data["items"]))
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_payload_de_cocina_desde_items(self):
+        p = services.crear_pedido(mesa="5", items=[{"plato_id": self.lomo.pk, "cantidad": 3, "notas": "sin sal"}])
+        p = services.obtener_pedido(p.pk)
+        with self.assertNumQueries(0):
+            payload = adapters.CocinaClientM4._payload(p)
+        item = p.items.get()
+        self.assertEqual(
+            payload["items"], [{"item_id": item.pk, "plato_id": self.lomo.pk, "cantidad": 3, "notas": "sin sal"}]
+        )
+        antiguo = Pedido.objects.create(mesa="6", plato="7")
+        self.assertEqual(adapters.items_de_pedido(antiguo), [{"plato_id": "7", "cantidad": 1}])
+
+
+class IdempotenciaTest(APITestCase):
+    def setUp(self):
+        idempotencia.recientes.limpiar()
+        self.addCleanup(idempotencia.recientes.limpiar)
+
+    def _crear(self, clave, mesa="7"):
+        return self.client.post(
+            reverse("pedido-list"), {"mesa": mesa}, format="json", HTTP_IDEMPOTENCY_KEY=clave,
+        )
+
+    def test_reintento_de_crear_repite_la_respuesta(self):
+        r1 = self._crear("k1")
+        self.assertEqual(r1.status_code, 201)
+        with self.assertNumQueries(0):  # LRU en memoria
+            r2 = self._crear("k1")
+        self.assertEqual((r2.status_code, r2.json()["id"]), (201, r1.data["id"]))
+        self.assertEqual(r2["Idempotent-Replayed"], "true")
+        # otro worker (sin la respuesta en memoria) la lee de la tabla
+        idempotencia.recientes.limpiar()
+        with self.assertNumQueries(1):
+            r3 = self._crear("k1")
+        self.assertEqual(r3.json()["id"], r1.data["id"])
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_reintento_de_confirmar_no_reaplica(self):
+        p = Pedido.objects.create(mesa="1")
+        url = reverse("pedido-confirmar", args=[p.id])
+        r1 = self.client.post(url, HTTP_IDEMPOTENCY_KEY="c1")
+        r2 = self.client.post(url, HTTP_IDEMPOTENCY_KEY="c1")
+        self.assertEqual((r1.status_code, r2.status_code), (200, 200))
+        self.assertEqual(r2.json()["estado"], "EN_PREPARACION")
+        # sin clave el reintento es un conflicto de estado
+        self.assertEqual(self.client.post(url).status_code, 400)
+
+    def test_clave_reusada_en_curso_o_invalida(self):
+        self._crear("k2", mesa="1")
+        self.assertEqual(self._crear("k2", mesa="2").status_code, 422)
+        # la original sigue en curso (p.ej. en otro worker)
+        RespuestaIdempotente.objects.filter(clave="k2").update(status=RespuestaIdempotente.EN_CURSO)
+        idempotencia.recientes.limpiar()
+        self.assertEqual(self._crear("k2", mesa="1").status_code, 409)
+        self.assertEqual(self._crear("x" * 65).status_code, 400)
+
+    def test_reintento_toma_reclamo_abandonado(self):
+        # el worker de la original murió sin guardar ni soltar la clave
+        self._crear("k3", mesa="1")
+        Pedido.objects.all().delete()
+        RespuestaIdempotente.objects.filter(clave="k3").update(
+            status=RespuestaIdempotente.EN_CURSO, cuerpo=b"",
+            creado_en=timezone.now() - timedelta(seconds=120),
+        )
+        idempotencia.recientes.limpiar()
+        with override_settings(IDEMPOTENCIA_LEASE=60):
+            r = self._crear("k3", mesa="1")
+        self.assertEqual(r.status_code, 201)
+        fila = RespuestaIdempotente.objects.get(clave="k3")
+        self.assertEqual(fila.status, 201)
+        idempotencia.recientes.limpiar()
+        self.assertEqual(self._crear("k3", mesa="1").json()["id"], r.data["id"])
+
+    def test_original_tardia_no_pisa_al_reintento(self):
+        antes = timezone.now() - timedelta(seconds=120)
+        RespuestaIdempotente.objects.create(clave="k4", huella=b"h", creado_en=antes)
+        RespuestaIdempotente.objects.filter(clave="k4").update(creado_en=timezone.now())  # lo tomó otro
+        idempotencia._guardar("k4", b"h", antes, Response({"tarde": True}, status=201))
+        self.assertEqual(RespuestaIdempotente.objects.get(clave="k4").status, RespuestaIdempotente.EN_CURSO)
+
+    def test_purga_las_vencidas(self):
+        self._crear("vieja", mesa="1")
+        RespuestaIdempotente.objects.filter(clave="vieja").update(
+            creado_en=timezone.now() - timedelta(days=2)
+        )
+        self.assertEqual(idempotencia.purgar(), 1)
+        idempotencia.recientes.limpiar()
+        # vencida: la misma clave vuelve a ejecutarse
+        self.assertEqual(self._crear("vieja", mesa="2").status_code, 201)
+
+
+class EventosPedidoTest(TestCase):
+    def test_transiciones_publican_deltas(self):
+        inicio = eventos.difusor.ultimo_id
+        with self.captureOnCommitCallbacks(execute=True):
+            p = services.crear_pedido(mesa="1")
+        with self.captureOnCommitCallbacks(execute=True):
+            services.transicionar(p, "confirmar")
+            services.transicionar(p, "cancelar")
+        publicados = eventos.difusor.desde(inicio)
+        self.assertEqual([e["tipo"] for e in publicados], ["creado", "estado", "cancelado"])
+        self.assertEqual(publicados[-1]["estado_anterior"], "EN_PREPARACION")
+
+    def test_flujo_filtra_por_tablero_y_reanuda(self):
+        d = eventos.Difusor()
+        d.publicar("creado", {"estado": "CREADO"})
+        d.publicar("estado", {"estado": "ENTREGADO"}, "LISTO")
+
+        async def leer():
+            flujo = eventos.flujo_sse("cocina", ultimo_id=0, fuente=d, keepalive=0.01)
+            partes = [await flujo.__anext__() for _ in range(3)]
+            await flujo.aclose()
+            return partes
+
+        partes = asyncio.run(leer())
+        self.assertTrue(partes[1].startswith("id: 1\nevent: creado"))
+        self.assertEqual(partes[2], ": ping\n\n")
+
+    def test_id_fuera_del_buffer_pide_resync(self):
+        d = eventos.Difusor(capacidad=2)
+        for _ in range(4):
+            d.publicar("creado", {"estado": "CREADO"})
+        self.assertIsNone(d.desde(0))
+        self.assertIsNone(d.desde(99))
+        self.assertEqual([e["id"] for e in d.desde(2)], [3, 4])
+
+
+class PedidoListadoTest(APITestCase):
+    def setUp(self):
+        ahora = timezone.now()
+        self.pedidos = Pedido.objects.bulk_create(
+            Pedido(mesa=str(i % 4), estado=Pedido.Estado.CERRADO) for i in range(9)
+        )
+        for i, p in enumerate(self.pedidos):
+            # de a pares con el mismo creado_en: desempata el id
+            Pedido.objects.filter(pk=p.pk).update(creado_en=ahora - timedelta(minutes=i // 2))
+        Pedido.objects.filter(pk=self.pedidos[0].pk).update(estado=Pedido.Estado.LISTO)
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        vistos, url = [], reverse("pedido-list") + "?limite=2"
+        while url:
+            with self.assertNumQueries(2):  # la página y sus líneas (prefetch)
+                r = self.client.get(url)
+            vistos += [p["id"] for p in r.data["results"]]
+            url = r.data["next"]
+        esperado = [str(p.pk) for p in Pedido.objects.order_by("-creado_en", "-id")]
+        self.assertEqual(vistos, esperado)
+
+    def test_filtros_y_campos(self):
+        r = self.client.get(reverse("pedido-list"), {
+            "estado": "LISTO,CREADO", "mesa": "0", "fields": "id,estado",
+            "creado_desde": (timezone.now() - timedelta(hours=1)).isoformat(),
+        })
+        self.assertEqual(r.data["results"], [{"id": str(self.pedidos[0].pk), "estado": "LISTO"}])
+        hasta = self.client.get(reverse("pedido-list"), {"creado_hasta": "2000-01-01"})
+        self.assertEqual(hasta.data["results"], [])
+
+    def test_parametros_invalidos(self):
+        for params in ({"estado": "VOLANDO"}, {"fields": "id,secreto"}, {"creado_desde": "ayer"}):
+            self.assertEqual(self.client.get(reverse("pedido-list"), params).status_code, 400)
+        self.assertEqual(self.client.get(reverse("pedido-list"), {"cursor": "xx"}).status_code, 404)
+        for ultimo in (["2026-01-01T00:00:00+00:00", "nope"], ["2026-01-01T00:00:00+00:00", 5]):
+            cursor = base64.urlsafe_b64encode(json.dumps(ultimo).encode()).decode()
+            self.assertEqual(self.client.get(reverse("pedido-list"), {"cursor": cursor}).status_code, 404)
+
+
+class TransicionesLoteTest(APITestCase):
+    def test_lote_con_conflictos(self):
+        a = Pedido.objects.create(mesa="1", estado=Pedido.Estado.EN_PREPARACION)
+        b = Pedido.objects.create(mesa="2", estado=Pedido.Estado.LISTO)
+        c = Pedido.objects.create(mesa="3", estado=Pedido.Estado.CERRADO)
+        body = [
+            {"id": str(a.id), "accion": "listo"},
+            {"id": str(b.id), "accion": "entregar"},
+            {"id": str(b.id), "accion": "cerrar"},
+            {"id": str(c.id), "accion": "cancelar"},
+            {"id": "00000000-0000-0000-0000-000000000000", "accion": "listo"},
+        ]
+        # SAVEPOINT, SELECT, 2 UPDATE agrupados, INSERT en el historial,
+        # INSERT en el outbox, RELEASE (+1 en PostgreSQL: ¿el id que falta no
+        # existe o lo bloquea otra transacción?)
+        consultas = 7 + connection.features.has_select_for_update_skip_locked
+        with self.assertNumQueries(consultas):
+            r = self.client.post(reverse("pedido-transiciones"), body, format="json")
+        self.assertEqual(r.status_code, 200)
+        resultados = [x["resultado"] for x in r.data["resultados"]]
+        self.assertEqual(resultados, ["ok", "ok", "ok", "conflicto", "conflicto"])
+        self.assertEqual(r.data["resultados"][3]["detalle"], "El pedido ya está finalizado.")
+        b.refresh_from_db()
+        self.assertEqual(b.estado, Pedido.Estado.CERRADO)
+        self.assertIsNotNone(b.entregado_en)
+        a.refresh_from_db()
+        self.assertEqual(a.estado, Pedido.Estado.LISTO)
+
+    def test_accion_invalida_es_400(self):
+        r = self.client.post(
+            reverse("pedido-transiciones"),
+            [{"id": "00000000-0000-0000-0000-000000000000", "accion": "volar"}],
+            format="json",
+        )
+        self.assertEqual(r.status_code, 400)
+
+
+class ColaCocinaTest(TestCase):
+    def test_listar_activos_no_recorre_la_tabla(self):
+        if connection.vendor != "postgresql":
+            self.assertNotIn("SCAN pedidos_pedido", services.listar_activos().explain())
+            return
+        with connection.cursor() as cur:  # la tabla del test es mínima
+            cur.execute("SET LOCAL enable_seqscan = off")
+            cur.execute("SET LOCAL enable_bitmapscan = off")
+        plan = services.listar_activos().explain()
+        self.assertIn("Index Only Scan using pedido_activos_cola_idx", plan)
+
+
+def _ticket(pid, creado, estado="CREADO"):
+    return {"id": pid, "mesa": "1", "cliente": None, "plato": "", "estado": estado,
+            "creado_en": creado, "actualizado_en": creado}
+
+
+class ColaCocinaMaterializadaTest(SimpleTestCase):
+    def test_fifo_y_lectura_incremental(self):
+        c = cola_cocina.ColaCocina()
+        c.cargar([_ticket("b", "2026-01-01T10:05"), _ticket("a", "2026-01-01T10:00")])
+        todo = c.leer()
+        self.assertTrue(todo["completo"])
+        self.assertEqual([t["id"] for t in todo["tickets"]], ["a", "b"])
+
+        c.aplicar(_ticket("b", "2026-01-01T10:05", "LISTO"))
+        c.aplicar(_ticket("a", "2026-01-01T10:00", "CANCELADO"))
+        c.aplicar(_ticket("z", "2026-01-01T09:59"))  # llegó tarde: igual va primero
+        delta = c.leer(todo["version"])
+        self.assertFalse(delta["completo"])
+        self.assertEqual([(t["id"], t["estado"]) for t in delta["tickets"]], [("z", "CREADO"), ("b", "LISTO")])
+        self.assertEqual(delta["retirados"], ["a"])
+        self.assertEqual(c.leer(delta["version"])["tickets"], [])
+
+    def test_version_ajena_o_vieja_devuelve_todo(self):
+        c = cola_cocina.ColaCocina(capacidad=2)
+        c.cargar([_ticket(str(i), f"2026-01-01T10:0{i}") for i in range(4)])
+        v = c.leer()["version"]
+        self.assertTrue(c.leer("otraepoca.1")["completo"])
+        for i in range(3):  # 3 retiros con capacidad 2: se pierde el primero
+            c.aplicar(_ticket(str(i), f"2026-01-01T10:0{i}", "CERRADO"))
+        self.assertTrue(c.leer(v)["completo"])
+
+    def test_delta_trae_orden_solo_si_cambio(self):
+        plan = Planificador(objetivo_defecto=600)
+        c = cola_cocina.ColaCocina(planificador=plan)
+        c.cargar([_ticket("a", "2026-01-01T10:00:00+00:00")])
+        v = c.leer()["version"]
+        with mock.patch.object(plan, "orden", wraps=plan.orden) as orden:
+            self.assertIsNone(c.leer(v)["orden"])
+            orden.assert_not_called()
+        c.aplicar(_ticket("b", "2026-01-01T10:01:00+00:00"))
+        self.assertEqual([o["id"] for o in c.leer(v)["orden"]], ["a", "b"])
+        c.cargar([_ticket("a", "2026-01-01T10:00:00+00:00"), _ticket("b", "2026-01-01T10:01:00+00:00")],
+                 platos=[])
+        v = c.leer()["version"]
+        c.cargar([_ticket("a", "2026-01-01T10:00:00+00:00"), _ticket("b", "2026-01-01T10:01:00+00:00")],
+                 platos=[("9", 5, "cocina")])  # cambian los platos, no los tickets
+        self.assertIsNotNone(c.leer(v)["orden"])
+
+    def test_resync_publica_solo_diferencias(self):
+        c = cola_cocina.ColaCocina()
+        c.cargar([_ticket("a", "t1"), _ticket("b", "t2")])
+        v = c.leer()["version"]
+        c.cargar([_ticket("a", "t1"), _ticket("c", "t3")])
+        delta = c.leer(v)
+        self.assertEqual([t["id"] for t in delta["tickets"]], ["c"])
+        self.assertEqual(delta["retirados"], ["b"])
+
+
+class PlanificadorTest(SimpleTestCase):
+    def _plan(self, *tickets, platos=(), cocineros=1):
+        plan = Planificador(cocineros=cocineros, objetivo_defecto=600)
+        plan.cargar_platos(platos)
+        for t in tickets:
+            plan.poner(t)
+        return plan
+
+    def _t(self, pid, mesa, plato, minuto, estado="EN_PREPARACION"):
+        return {"id": pid, "mesa": mesa, "plato": plato, "estado": estado,
+                "creado_en": f"2026-01-01T12:{minuto:02d}:00+00:00"}
+
+    def test_platos_de_una_mesa_salen_juntos(self):
+        platos = [(1, 30, "cocina"), (2, 5, "cocina"), (3, 10, "cocina")]
+        plan = self._plan(
+            self._t("m1-corto", "1", 2, 0),
+            self._t("m2", "2", 3, 1),
+            self._t("m1-largo", "1", 1, 0),
+            platos=platos,
+        )
+        orden = plan.orden()
+        # el largo de la mesa 1 empieza ya; el corto espera para salir con él
+        self.assertEqual([o["id"] for o in orden], ["m1-largo", "m2", "m1-corto"])
+        self.assertEqual(orden[0]["inicio_limite"], "2026-01-01T12:00:00+00:00")
+        self.assertEqual(orden[2]["inicio_limite"], "2026-01-01T12:25:00+00:00")
+
+    def test_reordena_al_salir_un_ticket(self):
+        platos = [(1, 30, "cocina"), (2, 5, "cocina"), (3, 10, "cocina")]
+        plan = self._plan(
+            self._t("m1-corto", "1", 2, 0), self._t("m1-largo", "1", 1, 0),
+            self._t("m2", "2", 3, 1), platos=platos,
+        )
+        plan.poner(self._t("m1-largo", "1", 1, 0, estado="LISTO"))
+        self.assertEqual([o["id"] for o in plan.orden()], ["m1-corto", "m2"])
+        self.assertEqual(plan.siguiente("cocina"), "m1-corto")
+
+    def test_estacion_cargada_se_adelanta(self):
+        platos = [(1, 10, "parrilla"), (2, 10, "frio")]
+        plan = self._plan(
+            self._t("frio", "1", 2, 0),
+            *[self._t(f"parrilla{i}", str(10 + i), 1, 5) for i in range(3)],
+            platos=platos,
+        )
+        self.assertEqual(plan.orden()[0]["id"], "parrilla0")
+        self.assertEqual(plan.siguiente("frio"), "frio")
+
+    def test_pedido_con_items_usa_la_linea_mas_lenta(self):
+        platos = [(1, 30, "parrilla"), (2, 5, "frio")]
+        t = dict(self._t("a", "1", "", 0), items=[{"plato": 2}, {"plato": 1}])
+        plan = self._plan(t, platos=platos)
+        self.assertEqual(plan.orden()[0]["estacion"], "parrilla")
+        self.assertEqual(plan.siguiente("parrilla"), "a")
+
+    def test_cambio_de_estado_no_reordena(self):
+        plan = self._plan(self._t("a", "1", 9, 0, estado="CREADO"))
+        antes = plan.orden()
+        plan.poner(self._t("a", "1", 9, 0))
+        self.assertIs(plan.orden(), antes)  # misma versión: no se recalcula
+
+    def test_orden_se_recalcula_al_cambiar(self):
+        plan = self._plan(self._t("a", "1", 9, 0), self._t("b", "2", 9, 1))
+        antes = plan.orden()
+        plan.quitar("a")
+        self.assertEqual([o["id"] for o in plan.orden()], ["b"])
+        self.assertEqual([o["id"] for o in antes], ["a", "b"])
+
+
+class CocinaListaTest(APITestCase):
+    def setUp(self):
+        cola_cocina.cola.invalidar()
+        self.addCleanup(cola_cocina.cola.invalidar)
+
+    def test_since_devuelve_solo_cambios(self):
+        url = reverse("cocina-lista")
+        a = Pedido.objects.create(mesa="1")
+        Pedido.objects.create(mesa="2", estado=Pedido.Estado.ENTREGADO)
+        inicial = self.client.get(url).json()
+        self.assertEqual([t["id"] for t in inicial["tickets"]], [str(a.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            b = services.crear_pedido(mesa="3")
+            services.transicionar(a, "cancelar")
+        with self.assertNumQueries(0):
+            delta = self.client.get(url, {"since": inicial["version"]}).json()
+        self.assertEqual([t["id"] for t in delta["tickets"]], [str(b.id)])
+        self.assertEqual(delta["retirados"], [str(a.id)])
+        self.assertEqual([o["id"] for o in delta["orden"]], [str(b.id)])
+
+
+@override_settings(M3_WEBHOOK_SECRET="secreto-test")
+class WebhookCocinaTest(TestCase):
+    def setUp(self):
+        for estructura in (ocupacion.indice, cola_cocina.cola):
+            estructura.invalidar()
+            self.addCleanup(estructura.invalidar)
+        cat = CategoriaMenu.objects.create(nombre="Fondos")
+        self.lomo = Plato.objects.create(nombre="Lomo", precio=9000, categoria=cat)
+        self.url = reverse("webhook-cocina-eventos")
+
+    def _post(self, eventos, firma=None):
+        cuerpo = json.dumps(eventos).encode()
+        if firma is None:
+            firma = "sha256=" + adapters.build_signature("secreto-test", cuerpo)
+        return self.client.post(
+            self.url, cuerpo, content_type="application/json", HTTP_X_SIGNATURE=firma,
+        )
+
+    def _pedido(self, lineas=2):
+        p = services.crear_pedido(mesa=None, items=[{"plato_id": self.lomo.pk}] * lineas)
+        Pedido.objects.filter(pk=p.pk).update(estado=Pedido.Estado.EN_PREPARACION)
+        return str(p.pk), list(p.items.values_list("pk", flat=True))
+
+    def test_rechaza_firma_invalida(self):
+        pid, _ = self._pedido()
+        evento = {"id": "e1", "tipo": "pedido.listo", "pedido_id": pid}
+        for firma in ("", "sha256=" + "0" * 64, "sha256=ñ"):
+            self.assertEqual(self._post(evento, firma=firma).status_code, 401)
+        self.assertFalse(EventoCocina.objects.exists())
+        self.assertEqual(Pedido.objects.get(pk=pid).estado, Pedido.Estado.EN_PREPARACION)
+
+    def test_rechaza_lote_mal_formado(self):
+        r = self._post([{"id": "e1", "tipo": "item.listo", "pedido_id": "no-es-uuid", "item_id": 1}])
+        self.assertEqual(r.status_code, 400)
+        r = self._post([{"id": "e1", "tipo": "item.listo", "pedido_id": self._pedido()[0]}])
+        self.assertIn("item_id", r.json()["detail"])
+
+    def test_lineas_listas_pasan_el_pedido_a_listo(self):
+        pid, (a, b) = self._pedido()
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self._post([
+                {"id": "e1", "tipo": "item.en_preparacion", "pedido_id": pid, "item_id": a},
+                {"id": "e2", "tipo": "item.listo", "pedido_id": pid, "item_id": a},
+                {"id": "e3", "tipo": "item.listo", "pedido_id": pid, "item_id": b},
+            ])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([x["resultado"] for x in r.json()["resultados"]], ["ok"] * 3)
+        self.assertEqual(Pedido.objects.get(pk=pid).estado, Pedido.Estado.LISTO)
+        self.assertEqual(set(PedidoItem.objects.values_list("estado", flat=True)), {"LISTO"})
+        # la cola de cocina ve el pedido listo con sus líneas
+        ticket = next(t for t in cola_cocina.cola.leer()["tickets"] if t["id"] == pid)
+        self.assertEqual((ticket["estado"], [i["estado"] for i in ticket["items"]]), ("LISTO", ["LISTO"] * 2))
+
+    def test_duplicados_y_conflictos(self):
+        pid, (a, _) = self._pedido()
+        otro, _ = self._pedido()
+        primero = [
+            {"id": "e1", "tipo": "item.listo", "pedido_id": pid, "item_id": a},
+            {"id": "e1", "tipo": "item.listo", "pedido_id": pid, "item_id": a},
+            {"id": "e2", "tipo": "item.listo", "pedido_id": otro, "item_id": a},
+            {"id": "e3", "tipo": "pedido.cancelado", "pedido_id": otro},
+        ]
+        r = self._post(primero)
+        self.assertEqual(
+            [(x["id"], x["resultado"]) for x in r.json()["resultados"]],
+            [("e1", "ok"), ("e1", "duplicado"), ("e2", "conflicto"), ("e3", "ok")],
+        )
+        # la cocina reenvía el lote: nada se aplica dos veces
+        r = self._post(primero + [{"id": "e4", "tipo": "pedido.listo", "pedido_id": otro}])
+        self.assertEqual(
+            [x["resultado"] for x in r.json()["resultados"]], ["duplicado"] * 4 + ["conflicto"],
+        )
+        self.assertEqual(EventoCocina.objects.count(), 4)
+        self.assertEqual(Pedido.objects.get(pk=otro).estado, Pedido.Estado.CANCELADO)
+
+    def test_item_tardio_de_pedido_finalizado_es_conflicto(self):
+        for estado in (Pedido.Estado.CANCELADO, Pedido.Estado.ENTREGADO, Pedido.Estado.CERRADO):
+            pid, (a, _) = self._pedido()
+            Pedido.objects.filter(pk=pid).update(estado=estado)
+            eventos_antes = PedidoEvento.objects.filter(pedido=pid).count()
+            r = self._post({"id": f"e-{estado}", "tipo": "item.listo", "pedido_id": pid, "item_id": a})
+            (res,) = r.json()["resultados"]
+            self.assertEqual((res["resultado"], res["detalle"]), ("conflicto", f"El pedido ya está {estado}."))
+            self.assertEqual(PedidoItem.objects.get(pk=a).estado, PedidoItem.Estado.PENDIENTE)
+            self.assertEqual(PedidoEvento.objects.filter(pedido=pid).count(), eventos_antes)
+
+    def test_consultas_constantes_por_lote(self):
+        pedidos = [self._pedido() for _ in range(20)]
+        lote = [
+            {"id": f"e{pid}-{item}", "tipo": "item.listo", "pedido_id": pid, "item_id": item}
+            for pid, items in pedidos for item in items
+        ]
+        # SAVEPOINT, SELECT ids, INSERT ids, SELECT líneas, UPDATE líneas, SELECT pedidos
+        # + líneas, INSERT historial, transicionar_lote (SAVEPOINT, SELECT, UPDATE,
+        # INSERT historial, RELEASE), RELEASE
+        with self.assertNumQueries(14):
+            r = self._post(lote)
+        self.assertEqual(len(r.json()["resultados"]), 40)
+        self.assertEqual(Pedido.objects.filter(estado=Pedido.Estado.LISTO).count(), 20)
+
+    def test_boton_listo_de_la_demo_usa_el_receptor(self):
+        pid, _ = self._pedido()
+        r = self.client.post(
+            "/api/webhooks/cocina/pedido-listo/", {"pedido_id": pid}, content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(Pedido.objects.get(pk=pid).estado, Pedido.Estado.LISTO)
+        r = self.client.post(
+            "/api/webhooks/cocina/pedido-listo/", {"pedido_id": pid}, content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 409)
+
+
+class HistorialPedidoTest(APITestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajuste = self.settings(HISTORIAL_DIR=self.directorio)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.addCleanup(historial.abiertos.limpiar)
+        cat = CategoriaMenu.objects.create(nombre="Fondos")
+        self.lomo = Plato.objects.create(nombre="Lomo", precio=9000, categoria=cat)
+
+    def _recorrer(self, mesa="3"):
+        p = services.crear_pedido(mesa=mesa, cliente="Ana", items=[{"plato_id": self.lomo.pk, "cantidad": 2}])
+        for accion in ("confirmar", "listo"):
+            services.transicionar(p.pk, accion)
+        services.transicionar_lote([{"id": p.pk, "accion": "entregar"}, {"id": p.pk, "accion": "cerrar"}])
+        return Pedido.objects.get(pk=p.pk)
+
+    def _envejecer(self, pedido, dias):
+        antes = timezone.now() - timedelta(days=dias)
+        PedidoEvento.objects.filter(pedido=pedido.pk).update(ocurrido_en=antes)
+        Pedido.objects.filter(pk=pedido.pk).update(creado_en=antes)
+
+    def test_cada_transicion_queda_en_el_historial(self):
+        p = self._recorrer()
+        historia = historial.eventos(p.pk)
+        self.assertEqual(
+            [(e["tipo"], e["estado_anterior"], e["estado"]) for e in historia],
+            [("creado", "", "CREADO"), ("estado", "CREADO", "EN_PREPARACION"),
+             ("estado", "EN_PREPARACION", "LISTO"), ("estado", "LISTO", "ENTREGADO"),
+             ("estado", "ENTREGADO", "CERRADO")],
+        )
+        estado = historial.reconstruir(p.pk)
+        for campo in ("mesa", "cliente", "estado", "creado_en", "actualizado_en", "entregado_en"):
+            self.assertEqual(estado[campo], getattr(p, campo), campo)
+        self.assertEqual(
+            [(i["plato"], i["cantidad"], i["estado"]) for i in estado["items"]], [(self.lomo.pk, 2, "PENDIENTE")],
+        )
+        with self.assertRaises(ValidationError):
+            PedidoEvento.objects.first().save()
+
+    def test_estado_en_un_momento_dado(self):
+        p = self._recorrer()
+        historia = historial.eventos(p.pk)
+        en = historia[1]["ocurrido_en"]
+        self.assertEqual(historial.reconstruir(p.pk, en=en)["estado"], "EN_PREPARACION")
+        self.assertIsNone(historial.reconstruir(p.pk, en=historia[0]["ocurrido_en"] - timedelta(seconds=1)))
+        r = self.client.get(reverse("pedido-historial", args=[p.pk]), {"en": en.isoformat()})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.data["estado"]["estado"], len(r.data["eventos"])), ("EN_PREPARACION", 2))
+        r = self.client.get(reverse("pedido-historial", args=["00000000-0000-0000-0000-000000000000"]))
+        self.assertEqual(r.status_code, 404)
+
+    def test_compactar_acota_la_tabla_y_el_historial_sigue_completo(self):
+        viejo, reciente = self._recorrer("1"), self._recorrer("2")
+        self._envejecer(viejo, 40)
+        antes = historial.reconstruir(viejo.pk)
+
+        hechos = historial.compactar(retencion_dias=30)
+        self.assertEqual([n for _, n in hechos], [5])
+        self.assertFalse(PedidoEvento.objects.filter(pedido=viejo.pk).exists())
+        self.assertEqual(PedidoEvento.objects.filter(pedido=reciente.pk).count(), 5)
+        self.assertEqual(historial.reconstruir(viejo.pk), antes)
+
+        (_, ruta), = historial.dias()
+        archivo = historial.Archivo(ruta)
+        self.addCleanup(archivo.cerrar)
+        self.assertEqual(archivo.columna("estado"), ["CREADO", "EN_PREPARACION", "LISTO", "ENTREGADO", "CERRADO"])
+
+        # un evento atrasado del mismo día se une al archivo existente
+        tarde = PedidoEvento.de(viejo, PedidoEvento.Tipo.MODIFICADO, ocurrido_en=antes["actualizado_en"])
+        tarde.save()
+        self.assertEqual([n for _, n in historial.compactar(30)], [1])
+        self.assertEqual(len(historial.eventos(viejo.pk)), 6)
+
+    def test_compactar_no_borra_filas_que_no_escribio(self):
+        # una fila con id menor que aparece en el día después del SELECT
+        # (en PostgreSQL: confirmada tarde) sigue en la tabla
+        tardio, viejo = self._recorrer("1"), self._recorrer("2")
+        self._envejecer(viejo, 40)
+        escribir = historial.escribir
+
+        def escribir_y_confirmar_tarde(ruta, filas):
+            escribir(ruta, filas)
+            dia = PedidoEvento.objects.filter(pedido=viejo.pk).values_list("ocurrido_en", flat=True)[0]
+            PedidoEvento.objects.filter(pedido=tardio.pk).update(ocurrido_en=dia)
+            Pedido.objects.filter(pk=tardio.pk).update(creado_en=dia)
+
+        with mock.patch.object(historial, "escribir", escribir_y_confirmar_tarde):
+            self.assertEqual([n for _, n in historial.compactar(30)], [5])
+        self.assertEqual(PedidoEvento.objects.filter(pedido=tardio.pk).count(), 5)
+        self.assertFalse(PedidoEvento.objects.filter(pedido=viejo.pk).exists())
+        self.assertEqual([n for _, n in historial.compactar(30)], [5])
+        self.assertEqual(len(historial.eventos(tardio.pk)), 5)
+
+    def test_comando(self):
+        self._envejecer(self._recorrer(), 40)
+        salida = io.StringIO()
+        call_command("compactar_historial", stdout=salida)
+        self.assertIn("Compactados 5 eventos en 1 días", salida.getvalue())
+        self.assertFalse(PedidoEvento.objects.exists())
+
+
+class RemotoFalso:
+    """M1 y M4 en memoria para el despachador: registra las llamadas y falla a pedido."""
+
+    def __init__(self):
+        self.llamadas = []
+        self.errores = []  # excepciones a lanzar en las próximas llamadas
+
+    def _llamar(self, *args):
+        self.llamadas.append(args)
+        if self.errores:
+            raise self.errores.pop(0)
+
+    def validar_reservar(self, pedido_id, items):
+        self._llamar("reservar", str(pedido_id))
+        return {"ok": True, "reserva_id": f"r-{pedido_id}"}
+
+    def enviar(self, payload):
+        self._llamar("enviar", payload["id"])
+        return {"ok": True}
+
+    def liberar_reserva(self, reserva_id):
+        self._llamar("liberar", reserva_id)
+        return {"ok": True}
+
+    def confirmar_descuento(self, reserva_id):
+        self._llamar("descontar", reserva_id)
+        return {"ok": True}
+
+
+def _http_error(status):
+    r = requests.Response()
+    r.status_code = status
+    return requests.HTTPError(f"{status}", response=r)
+
+
+class SalidaDespachadorTest(TestCase):
+    def setUp(self):
+        despachador.metricas.reiniciar()
+        self.remoto = RemotoFalso()
+        self.d = despachador.Despachador(
+            lote=10, concurrencia=4, max_intentos=3, backoff=0, m1=self.remoto, m4=self.remoto,
+        )
+        self.addCleanup(self.d.cerrar)
+
+    def _ops(self, pedido):
+        return list(MensajeSalida.objects.filter(pedido=pedido).values_list("operacion", "estado"))
+
+    def test_confirmar_sólo_escribe_el_outbox(self):
+        p = Pedido.objects.create(mesa="1", plato="7")
+        services.transicionar(p, "confirmar")
+        self.assertEqual(self._ops(p), [("reservar", "PENDIENTE"), ("enviar", "PENDIENTE")])
+        self.assertEqual(self.remoto.llamadas, [])
+        # si la transición se revierte, los mensajes también
+        q = Pedido.objects.create(mesa="2")
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            services.transicionar(q, "confirmar")
+            raise RuntimeError
+        self.assertEqual(self._ops(q), [])
+
+    def test_envia_en_orden_por_pedido(self):
+        p = Pedido.objects.create(mesa="1", plato="7")
+        services.transicionar(p, "confirmar")
+        self.assertEqual(self.d.ciclo(), 2)
+        self.assertEqual(self.remoto.llamadas, [("reservar", str(p.id)), ("enviar", str(p.id))])
+        services.transicionar(p, "listo")
+        services.transicionar(p, "entregar")
+        self.d.ciclo()
+        self.assertEqual(self.remoto.llamadas[-1], ("descontar", f"r-{p.id}"))
+        self.assertTrue(all(e == "ENVIADO" for _, e in self._ops(p)))
+        self.assertEqual(despachador.metricas.snapshot()["enviados"], 3)
+
+    def test_reintento_bloquea_lo_que_sigue_del_pedido(self):
+        p = Pedido.objects.create(mesa="1", plato="7")
+        services.transicionar(p, "confirmar")
+        self.remoto.errores = [requests.ConnectionError("caído")]
+        self.d.ciclo()
+        self.assertEqual(self.remoto.llamadas, [("reservar", str(p.id))])
+        self.assertEqual(self._ops(p), [("reservar", "PENDIENTE"), ("enviar", "PENDIENTE")])
+        self.d.ciclo()
+        self.assertEqual([c[0] for c in self.remoto.llamadas], ["reservar", "reservar", "enviar"])
+        self.assertEqual(MensajeSalida.objects.get(pedido=p, operacion="reservar").intentos, 2)
+
+    def test_sin_stock_cancela_y_no_envia_a_cocina(self):
+        p = Pedido.objects.create(mesa="1", plato="7")
+        services.transicionar(p, "confirmar")
+        self.remoto.errores = [_http_error(409)]
+        self.d.ciclo()
+        p.refresh_from_db()
+        self.assertEqual(p.estado, Pedido.Estado.CANCELADO)
+        self.assertEqual(self._ops(p)[:2], [("reservar", "FALLIDO"), ("enviar", "DESCARTADO")])
+        # la cancelación no tiene reserva que liberar
+        self.d.ciclo()
+        self.assertEqual(self._ops(p)[2], ("liberar", "DESCARTADO"))
+        self.assertEqual(len(self.remoto.llamadas), 1)
+
+    def test_m1_caido_no_cancela_y_se_reintenta(self):
+        p = Pedido.objects.create(mesa="1", plato="7")
+        services.transicionar(p, "confirmar")
+        self.remoto.errores = [requests.ConnectionError("caído"), _http_error(503), requests.Timeout()]
+        for _ in range(4):
+            self.d.ciclo()
+        p.refresh_from_db()
+        self.assertEqual(p.estado, Pedido.Estado.EN_PREPARACION)
+        self.assertEqual(self._ops(p), [("reservar", "FALLIDO"), ("enviar", "PENDIENTE")])
+        self.assertEqual([c[0] for c in self.remoto.llamadas], ["reservar"] * 3)  # sin ticket a cocina
+        self.assertEqual(salida.reintentar_fallidos(), 1)
+        self.d.ciclo()
+        self.assertEqual(self._ops(p), [("reservar", "ENVIADO"), ("enviar", "ENVIADO")])
+
+    def test_reserva_fallida_y_pedido_cancelado_descarta_lo_pendiente(self):
+        p = Pedido.objects.create(mesa="1", plato="7")
+        services.transicionar(p, "confirmar")
+        self.remoto.errores = [requests.ConnectionError("caído")] * 3
+        for _ in range(3):
+            self.d.ciclo()
+        services.transicionar(p, "cancelar")
+        self.d.ciclo()
+        self.assertEqual(
+            self._ops(p), [("reservar", "FALLIDO"), ("enviar", "DESCARTADO"), ("liberar", "DESCARTADO")],
+        )
+        self.assertEqual(salida.reintentar_fallidos(), 0)
+
+    def test_comando_una_vez(self):
+        salida = io.StringIO()
+        # close_old_connections cerraría la conexión de la transacción del test
+        with mock.patch("pedidos.despachador.close_old_connections"):
+            call_command("despachar_salida", "--una-vez", stdout=salida)
+        self.assertIn("enviados=0", salida.getvalue())
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class LoteFilasBloqueadasTest(TransactionTestCase):
+    def test_pedido_bloqueado_es_conflicto_sin_esperar(self):
+        a = Pedido.objects.create(mesa="1")
+        b = Pedido.objects.create(mesa="2")
+        tomado, soltar = threading.Event(), threading.Event()
+
+        def otro_worker():
+            with transaction.atomic():
+                Pedido.objects.select_for_update().get(pk=a.pk)
+                tomado.set()
+                soltar.wait(10)
+            connections.close_all()
+
+        hilo = threading.Thread(target=otro_worker)
+        hilo.start()
+        try:
+            tomado.wait(10)
+            resultados = services.transicionar_lote([
+                {"id": a.id, "accion": "confirmar"},
+                {"id": b.id, "accion": "confirmar"},
+            ])
+        finally:
+            soltar.set()
+            hilo.join()
+        self.assertEqual([r["resultado"] for r in resultados], ["conflicto", "ok"])
+        self.assertEqual(resultados[0]["detalle"], "El pedido está siendo modificado por otra operación.")
+
+    @override_settings(M3_WEBHOOK_SECRET="secreto-test")
+    def test_webhook_espera_pedido_bloqueado(self):
+        p = Pedido.objects.create(mesa="1")
+        tomado, soltar = threading.Event(), threading.Event()
+
+        def otro_worker():
+            with transaction.atomic():
+                Pedido.objects.select_for_update().get(pk=p.pk)
+                tomado.set()
+                soltar.wait(10)
+            connections.close_all()
+
+        hilo = threading.Thread(target=otro_worker)
+        hilo.start()
+        cuerpo = json.dumps({"id": "e1", "tipo": "pedido.cancelado", "pedido_id": str(p.pk)}).encode()
+        firma = "sha256=" + adapters.build_signature("secreto-test", cuerpo)
+        try:
+            tomado.wait(10)
+            threading.Timer(0.2, soltar.set).start()
+            r = self.client.post(
+                reverse("webhook-cocina-eventos"), cuerpo,
+                content_type="application/json", HTTP_X_SIGNATURE=firma,
+            )
+        finally:
+            soltar.set()
+            hilo.join()
+        self.assertEqual(r.json()["resultados"][0]["resultado"], "ok")
+        p.refresh_from_db()
+        self.assertEqual(p.estado, Pedido.Estado.CANCELADO)
+
+
+class ServidorFalso:
+    """Servidor HTTP local que hace de M1/M4, con latencia y fallos inyectables."""
+
+    def __init__(self):
+        self.latencia = 0.0
+        self.fallos = 0  # próximas N respuestas con 503
+        self.llamadas = 0
+        self.rutas = []
+        self.conexiones = set()
+        falso = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                falso.llamadas += 1
+                falso.rutas.append(self.path)
+                falso.conexiones.add(self.client_address)
+                time.sleep(falso.latencia)
+                codigo = 200
+                if falso.fallos > 0:
+                    falso.fallos -= 1
+                    codigo = 503
+                datos = {"ok": codigo == 200}
+                if codigo == 200 and self.path == "/stock/validar-reservar":
+                    datos["reserva_id"] = f"r{falso.llamadas}"
+                cuerpo = json.dumps(datos).encode()
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        class Servidor(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                pass  # el cliente cortó por timeout
+
+        self.srv = Servidor(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.srv.server_port}"
+        threading.Thread(target=self.srv.serve_forever, args=(0.05,), daemon=True).start()
+
+    def cerrar(self):
+        self.srv.shutdown()
+        self.srv.server_close()
+
+
+@override_settings(CIRCUITO_UMBRAL=3, CIRCUITO_ESPERA=60, INTEGRACIONES_BACKOFF=0.001)
+class AdaptadoresHTTPTest(SimpleTestCase):
+    def setUp(self):
+        adapters.reiniciar_integraciones()
+        self.remoto = ServidorFalso()
+        self.addCleanup(self.remoto.cerrar)
+        self.addCleanup(adapters.reiniciar_integraciones)
+        self.m1 = adapters.StockClientM1(base_url=self.remoto.url, timeout=1)
+
+    def test_reusa_conexion(self):
+        for _ in range(5):
+            self.m1.confirmar_descuento("r1")
+        self.assertEqual(len(self.remoto.conexiones), 1)
+
+    def test_reintenta_llamada_idempotente(self):
+        self.remoto.fallos = 2
+        self.assertEqual(self.m1.liberar_reserva("r1"), {"ok": True})
+        self.assertEqual(self.remoto.llamadas, 3)
+        m = adapters.metricas.snapshot()["M1 /stock/liberar"]
+        self.assertEqual((m["llamadas"], m["errores"], m["reintentos"]), (3, 2, 2))
+
+    def test_no_reintenta_reserva(self):
+        self.remoto.fallos = 1
+        with self.assertRaises(requests.HTTPError):
+            self.m1.validar_reservar("p1", [])
+        self.assertEqual(self.remoto.llamadas, 1)
+
+    def test_circuito_falla_rapido(self):
+        self.remoto.fallos = 100
+        for _ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                self.m1.validar_reservar("p1", [])
+        with self.assertRaises(adapters.CircuitoAbierto):
+            self.m1.validar_reservar("p1", [])
+        self.assertEqual(self.remoto.llamadas, 3)
+        self.assertEqual(adapters.estado_circuitos()["M1"], "ABIERTO")
+
+    def test_latencia_excede_timeout(self):
+        self.remoto.latencia = 0.3
+        lento = adapters.StockClientM1(base_url=self.remoto.url, timeout=0.05, reintentos=0)
+        with self.assertRaises(requests.Timeout):
+            lento.confirmar_descuento("r1")
+        self.assertEqual(adapters.metricas.snapshot()["M1 /stock/confirmar"]["errores"], 1)
+
+
+@override_settings(INTEGRACIONES_BACKOFF=0.001, INTEGRACIONES_OUTBOX=False)
+class TransicionAsyncTest(TestCase):
+    def setUp(self):
+        adapters.reiniciar_integraciones()
+        self.remoto = ServidorFalso()
+        self.addCleanup(self.remoto.cerrar)
+        self.addCleanup(adapters.reiniciar_integraciones)
+        urls = override_settings(M1_BASE_URL=self.remoto.url, M4_BASE_URL=self.remoto.url)
+        urls.enable()
+        self.addCleanup(urls.disable)
+
+    async def test_confirmar_llama_m1_y_m4_en_paralelo(self):
+        p = await Pedido.objects.acreate(mesa="1", plato="7")
+        self.remoto.latencia = 0.3
+        inicio = time.perf_counter()
+        r = await self.async_client.post(reverse("pedido-transicion-async", args=[p.id, "confirmar"]))
+        duracion = time.perf_counter() - inicio
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["estado"], "EN_PREPARACION")
+        self.assertEqual(self.remoto.llamadas, 2)
+        self.assertLess(duracion, 0.55)
+
+    async def test_reintento_no_vuelve_a_reservar(self):
+        idempotencia.recientes.limpiar()
+        self.addCleanup(idempotencia.recientes.limpiar)
+        p = await Pedido.objects.acreate(mesa="1", plato="7")
+        url = reverse("pedido-transicion-async", args=[p.id, "confirmar"])
+        self.remoto.fallos = 1
+        r = await self.async_client.post(url, headers={"Idempotency-Key": "a1"})
+        self.assertEqual(r.status_code, 502)  # no se guarda: el reintento se ejecuta
+        llamadas = self.remoto.llamadas
+        for _ in range(2):
+            r = await self.async_client.post(url, headers={"Idempotency-Key": "a1"})
+            self.assertEqual(r.json()["estado"], "EN_PREPARACION")
+        self.assertEqual(self.remoto.llamadas, llamadas + 2)  # M1 y M4 una sola vez
+
+    async def test_confirmar_sin_m1_deja_creado(self):
+        p = await Pedido.objects.acreate(mesa="1", plato="7")
+        self.remoto.fallos = 1
+        r = await self.async_client.post(reverse("pedido-transicion-async", args=[p.id, "confirmar"]))
+        self.assertEqual(r.status_code, 502)
+        await p.arefresh_from_db()
+        self.assertEqual(p.estado, Pedido.Estado.CREADO)
+
+    async def test_confirmacion_perdedora_libera_reserva(self):
+        p = await Pedido.objects.acreate(mesa="1", plato="7")
+        # otra confirmación gana mientras M1/M4 responden
+        await Pedido.objects.filter(pk=p.pk).aupdate(estado=Pedido.Estado.EN_PREPARACION)
+        with self.assertRaises(ValidationError) as ctx:
+            await services.aconfirmar(p)
+        self.assertTrue(services.es_conflicto(ctx.exception))
+        self.assertEqual(self.remoto.rutas.count("/stock/liberar"), 1)
+
+    async def test_otras_acciones(self):
+        p = await Pedido.objects.acreate(mesa="1", estado=Pedido.Estado.EN_PREPARACION)
+        r = await self.async_client.patch(reverse("pedido-transicion-async", args=[p.id, "listo"]))
+        self.assertEqual(r.json()["estado"], "LISTO")
+        r = await self.async_client.patch(reverse("pedido-transicion-async", args=[p.id, "cerrar"]))
+        self.assertEqual(r.status_code, 400)
@@ -1,6 +1,9 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import PedidoViewSet, cocina_estado, cocina_list
+from .views import (
+    PedidoViewSet, cocina_estado, cocina_list, eventos_sse, integraciones_metricas,
+    transicion_async, webhook_cocina,
+)
 
 router = DefaultRouter()
 router.register(r'pedidos', PedidoViewSet, basename='pedido')
@@ -8,6 +11,10 @@ router.register(r'pedidos', PedidoViewSet, basename='pedido')
 urlpatterns = [
     path("cocina/estado/", cocina_estado, name="cocina-estado"),
     path("cocina/lista/", cocina_list, name="cocina-lista"),
+    path("pedidos/eventos/", eventos_sse, name="pedidos-eventos"),
+    path("pedidos/<uuid:pk>/async/<str:accion>/", transicion_async, name="pedido-transicion-async"),
+    path("integraciones/metricas/", integraciones_metricas, name="integraciones-metricas"),
+    path("webhooks/cocina/eventos/", webhook_cocina, name="webhook-cocina-eventos"),
 ]
 
 urlpatterns += router.urls
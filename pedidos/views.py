@@ -1,10 +1,23 @@
+import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 
+from . import (
+    adapters, cola_cocina, despachador, eventos, historial, idempotencia, salida, services, webhooks,
+)
 from .models import Pedido
-from .serializers import PedidoSerializer
+from .paginacion import PedidoCursorPagination
+from .serializers import PedidoSerializer, TransicionSerializer
 
 
 class PedidoViewSet(ModelViewSet):
@@ -19,86 +32,178 @@ class PedidoViewSet(ModelViewSet):
     - PATCH  /api/pedidos/{id}/      -> partial_update
     - DELETE /api/pedidos/{id}/      -> destroy
 
+    El listado pagina por cursor (?cursor=, ?limite=) y acepta filtros
+    ?estado=CREADO,LISTO  ?mesa=3  ?creado_desde= / ?creado_hasta= (fecha o
+    fecha-hora ISO) y ?fields=id,mesa,estado para respuestas reducidas.
+
     Acciones personalizadas:
     - POST   /api/pedidos/{id}/confirmar/
     - POST   /api/pedidos/{id}/cancelar/
     - PATCH  /api/pedidos/{id}/listo/
     - PATCH  /api/pedidos/{id}/entregar/
     - PATCH  /api/pedidos/{id}/cerrar/
+    - POST   /api/pedidos/transiciones/   (lote)
+    - GET    /api/pedidos/{id}/historial/ (?en=<fecha-hora>)
+
+    create y las acciones respetan el header Idempotency-Key: un reintento
+    con la misma clave recibe la respuesta original (idempotencia.py).
     """
 
-    queryset = Pedido.objects.all()
+    MAX_TRANSICIONES_LOTE = 500
+
+    queryset = Pedido.objects.prefetch_related("items")
     serializer_class = PedidoSerializer
+    pagination_class = PedidoCursorPagination
 
-    @action(detail=True, methods=["post"])
-    def confirmar(self, request, pk=None):
-        """
-        Confirma el pedido: valida stock (Módulo 1) y lo pasa a EN_PREPARACION.
-        """
+    def get_queryset(self):
+        if self.action != "list":
+            return super().get_queryset()
+        params = self.request.query_params
+        estados = [e for valor in params.getlist("estado") for e in valor.split(",") if e]
+        invalidos = set(estados) - set(Pedido.Estado.values)
+        if invalidos:
+            raise ValidationError({"estado": f"Estados inválidos: {', '.join(sorted(invalidos))}."})
+        return services.filtrar_pedidos(
+            estados=estados,
+            mesa=params.get("mesa"),
+            desde=self._fecha("creado_desde"),
+            hasta=self._fecha("creado_hasta"),
+            campos=self._campos(),
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ("list", "retrieve"):
+            kwargs.setdefault("campos", self._campos())
+        return super().get_serializer(*args, **kwargs)
+
+    def _campos(self):
+        valor = self.request.query_params.get("fields")
+        if not valor:
+            return None
+        campos = [c.strip() for c in valor.split(",") if c.strip()]
+        desconocidos = set(campos) - set(PedidoSerializer.Meta.fields)
+        if desconocidos:
+            raise ValidationError({"fields": f"Campos desconocidos: {', '.join(sorted(desconocidos))}."})
+        return campos
+
+    def _fecha(self, nombre):
+        valor = self.request.query_params.get(nombre)
+        if not valor:
+            return None
+        fecha = parse_datetime(valor)
+        if fecha is None and parse_date(valor):
+            fecha = datetime.datetime.combine(parse_date(valor), datetime.time.min)
+        if fecha is None:
+            raise ValidationError({nombre: "Fecha inválida (use ISO 8601)."})
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        return fecha
+
+    def create(self, request, *args, **kwargs):
+        return idempotencia.responder(request, self._crear)
+
+    def _crear(self):
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            # sólo los campos de creación: el estado lo fija el ciclo de vida
+            datos = serializer.validated_data
+            pedido = services.crear_pedido(**{
+                campo: datos[campo] for campo in ("mesa", "cliente", "plato", "mesa_ref", "items") if campo in datos
+            })
+        except DjangoValidationError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(pedido).data, status=status.HTTP_201_CREATED)
+
+    def _transicionar(self, accion):
+        return idempotencia.responder(self.request, lambda: self._aplicar(accion))
+
+    def _aplicar(self, accion):
         pedido = self.get_object()
         try:
-            pedido.confirmar()  # método del modelo
+            services.transicionar(pedido, accion)
             serializer = self.get_serializer(pedido)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except DjangoValidationError as e:
+            codigo = status.HTTP_409_CONFLICT if services.es_conflicto(e) else status.HTTP_400_BAD_REQUEST
+            return Response({"detail": str(e)}, status=codigo)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=["post"])
+    def confirmar(self, request, pk=None):
+        """
+        Confirma el pedido: valida stock (Módulo 1) y lo pasa a EN_PREPARACION.
+        """
+        return self._transicionar("confirmar")
+
     @action(detail=True, methods=["post"])
     def cancelar(self, request, pk=None):
         """
         Cancela el pedido y libera el stock reservado.
         """
-        pedido = self.get_object()
-        try:
-            pedido.cancelar()  # método del modelo
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicionar("cancelar")
 
     @action(detail=True, methods=["patch"])
     def listo(self, request, pk=None):
         """
         Marca el pedido como LISTO desde la cocina.
 
-        Este endpoint lo llama el webhook:
-          POST /api/webhooks/cocina/pedido-listo/
-        que internamente hace PATCH a:
-          /api/pedidos/{id}/listo/
+        Los eventos de M3 llegan por el webhook firmado
+          POST /api/webhooks/cocina/eventos/
+        que aplica las transiciones en lote, sin pasar por aquí.
         """
-        pedido = self.get_object()
-        try:
-            pedido.marcar_listo()  # método del modelo
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicionar("listo")
 
     @action(detail=True, methods=["patch"])
     def entregar(self, request, pk=None):
         """
         Marca el pedido como ENTREGADO al cliente.
         """
-        pedido = self.get_object()
-        try:
-            pedido.entregar()  # método del modelo
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicionar("entregar")
 
     @action(detail=True, methods=["patch"])
     def cerrar(self, request, pk=None):
         """
         Cierra el pedido (venta finalizada).
         """
-        pedido = self.get_object()
+        return self._transicionar("cerrar")
+
+    @action(detail=True, methods=["get"])
+    def historial(self, request, pk=None):
+        """
+        Historial del pedido (incluido lo ya compactado a archivos) y su
+        estado reconstruido a partir de él; ?en=<fecha-hora> los da en ese
+        momento. Sirve aunque el pedido ya no esté en la tabla.
+        """
+        en = self._fecha("en")
         try:
-            pedido.cerrar()  # método del modelo
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            historia = historial.eventos(pk, hasta=en)
+        except ValueError:
+            historia = []
+        if not historia:
+            return Response({"detail": "Pedido sin historial a esa fecha."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"estado": historial.plegar(historia), "eventos": historia})
+
+    @action(detail=False, methods=["post"], url_path="transiciones")
+    def transiciones(self, request):
+        """
+        Aplica varias transiciones en una sola transacción.
+        body: [{"id": "<uuid>", "accion": "confirmar|listo|entregar|cerrar|cancelar"}, ...]
+        Responde un resultado por item ("ok" o "conflicto" con el motivo).
+        """
+        return idempotencia.responder(request, self._lote)
+
+    def _lote(self):
+        serializer = TransicionSerializer(data=self.request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        if len(serializer.validated_data) > self.MAX_TRANSICIONES_LOTE:
+            return Response(
+                {"detail": f"Máximo {self.MAX_TRANSICIONES_LOTE} transiciones por lote."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        resultados = services.transicionar_lote(serializer.validated_data)
+        return Response({"resultados": resultados}, status=status.HTTP_200_OK)
 
 
 @api_view(["POST"])
@@ -116,20 +221,18 @@ def cocina_estado(request):
         )
 
     try:
-        p = Pedido.objects.get(pk=pid)
+        p = services.obtener_pedido(pid)
         if estado == "EN_PREPARACION":
             if p.estado != Pedido.Estado.CREADO:
                 return Response(
                     {"detail": "Solo desde CREADO."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            p.estado = Pedido.Estado.EN_PREPARACION
-            p.full_clean()
-            p.save(update_fields=["estado", "actualizado_en"])
+            services.transicionar(p, "confirmar")
         elif estado == "LISTO":
-            p.marcar_listo()
+            services.transicionar(p, "listo")
         elif estado == "CANCELADO":
-            p.cancelar()
+            services.transicionar(p, "cancelar")
         else:
             return Response({"detail": "Estado inválido."}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -143,10 +246,98 @@ def cocina_estado(request):
 @api_view(["GET"])
 def cocina_list(request):
     """
-    Devuelve pedidos activos para visualizar en la cocina.
-    (excluye CANCELADO y CERRADO)
+    Cola de cocina (CREADO, EN_PREPARACION, LISTO) en orden de llegada.
+    GET /api/cocina/lista/                 -> todos los tickets
+    GET /api/cocina/lista/?since=<version> -> sólo lo que cambió desde esa versión
+    Responde {"version", "completo", "tickets", "retirados", "orden"}; si
+    `since` ya no sirve (otro worker, reinicio) llega la cola completa con
+    completo=true. En un delta "orden" es null si no cambió.
+    """
+    return Response(cola_cocina.leer(request.query_params.get("since")))
+
+
+@api_view(["GET"])
+def integraciones_metricas(request):
+    """
+    Latencia, errores y reintentos por endpoint de M1/M4 (en este proceso),
+    el estado de cada circuit breaker, el outbox (mensajes por estado y
+    retraso del pendiente más viejo) y, si el despachador corre en este
+    proceso, su rendimiento.
+    """
+    return Response({
+        "endpoints": adapters.metricas.snapshot(),
+        "circuitos": adapters.estado_circuitos(),
+        "salida": salida.resumen(),
+        "despacho": despachador.metricas.snapshot(),
+    })
+
+
+async def eventos_sse(request):
+    """
+    Flujo Server-Sent Events con los cambios de pedidos de un tablero.
+    GET /api/pedidos/eventos/?tablero=cocina|sala
+    Reanuda desde el header Last-Event-ID (o ?ultimo_id=).
+    Necesita servirse por ASGI (restaurante/asgi.py).
+    """
+    tablero = request.GET.get("tablero", "sala")
+    if tablero not in eventos.TABLEROS:
+        return JsonResponse({"detail": "Tablero inválido."}, status=400)
+
+    ultimo = request.headers.get("Last-Event-ID") or request.GET.get("ultimo_id")
+    try:
+        ultimo_id = int(ultimo) if ultimo else None
+    except ValueError:
+        ultimo_id = None
+
+    resp = StreamingHttpResponse(
+        eventos.flujo_sse(tablero, ultimo_id), content_type="text/event-stream"
+    )
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def webhook_cocina(request):
+    """
+    Eventos de cocina firmados (webhooks.py):
+    POST /api/webhooks/cocina/eventos/   header X-Signature: sha256=<hmac del cuerpo>
+    body: un evento o una lista [{"id", "tipo", "pedido_id", "item_id"}, ...]
+    Responde un resultado por evento ("ok", "duplicado" o "conflicto").
     """
-    activos = Pedido.objects.exclude(
-        estado__in=[Pedido.Estado.CANCELADO, Pedido.Estado.CERRADO]
-    ).order_by("creado_en")
-    return Response(PedidoSerializer(activos, many=True).data)
+    cuerpo = request.body
+    if not webhooks.firma_valida(cuerpo, request.headers.get(webhooks.HEADER_FIRMA)):
+        return JsonResponse({"detail": "Firma inválida."}, status=401)
+    try:
+        eventos_cocina = webhooks.leer(cuerpo)
+    except webhooks.EventoInvalido as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    return JsonResponse({"resultados": webhooks.procesar(eventos_cocina)})
+
+
+@csrf_exempt
+@require_http_methods(["POST", "PATCH"])
+async def transicion_async(request, pk, accion):
+    """
+    Versión asíncrona (ASGI) de las acciones de PedidoViewSet:
+    POST /api/pedidos/{id}/async/{confirmar|listo|entregar|cerrar|cancelar}/
+
+    En confirmar, la reserva de stock (M1) y el envío a cocina (M4) se
+    hacen en paralelo y el worker atiende otras peticiones mientras esperan.
+    Con Idempotency-Key un reintento no vuelve a reservar stock.
+    """
+    return await idempotencia.aresponder(request, lambda: _transicion_async(pk, accion))
+
+
+async def _transicion_async(pk, accion):
+    try:
+        pedido = await services.atransicionar(pk, accion)
+    except Pedido.DoesNotExist:
+        return JsonResponse({"detail": "Pedido no existe."}, status=404)
+    except services.IntegracionFallida as e:
+        return JsonResponse({"detail": str(e)}, status=e.status)
+    except DjangoValidationError as e:
+        codigo = 409 if services.es_conflicto(e) else 400
+        return JsonResponse({"detail": str(e)}, status=codigo)
+    return JsonResponse(PedidoSerializer(pedido).data)
@@ -0,0 +1,238 @@
+"""
+Webhook de cocina (M3): la cocina informa el avance de los pedidos.
+
+    POST /api/webhooks/cocina/eventos/
+    X-Signature: sha256=<hex>   (HMAC-SHA256 del cuerpo con M3_WEBHOOK_SECRET)
+
+    [{"id": "evt-1", "tipo": "item.listo", "pedido_id": "<uuid>", "item_id": 12}, ...]
+
+    item.en_preparacion   la línea (PedidoItem) pasa de PENDIENTE a EN_PREPARACION
+    item.listo            la línea pasa a LISTO; con todas sus líneas listas,
+                          el pedido pasa a LISTO
+    pedido.listo          el pedido pasa a LISTO
+    pedido.cancelado      la cocina rechazó el pedido: se cancela
+
+La firma se compara en tiempo constante. Un cuerpo trae un evento o una
+lista de hasta WEBHOOK_COCINA_MAX_EVENTOS, y se aplica entero en una
+transacción directamente sobre la capa de servicios
+(services.transicionar_lote), con un número fijo de consultas sin importar
+cuántos eventos traiga.
+
+Cada evento se aplica una sola vez: su id queda en EventoCocina en la misma
+transacción, y un reenvío (la cocina reintenta si no recibió la respuesta)
+se responde como "duplicado" sin tocar nada. Los ids se recuerdan
+WEBHOOK_COCINA_TTL segundos. Por eso el resultado de cada evento debe ser
+definitivo: los pedidos que otra transacción tiene tomados se esperan
+(transicionar_lote(esperar=True)) en vez de informarse como conflicto.
+"""
+import datetime
+import hmac
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import services
+from .adapters import build_signature
+from .eventos import publicar_cambio
+from .models import EventoCocina, Pedido, PedidoEvento, PedidoItem
+
+HEADER_FIRMA = "X-Signature"
+MAX_ID = 64
+PURGA_CADA = 300  # segundos entre borrados de ids vencidos (por proceso)
+
+I = PedidoItem.Estado
+P = Pedido.Estado
+# las líneas sólo cambian mientras el pedido está en cocina: un item.* tardío
+# para un pedido ENTREGADO, CERRADO o CANCELADO es un conflicto
+ESTADOS_COCINA = (P.CREADO, P.EN_PREPARACION, P.LISTO)
+# tipo -> (estados desde los que aplica, estado nuevo de la línea)
+TIPOS_ITEM = {
+    "item.en_preparacion": ((I.PENDIENTE,), I.EN_PREPARACION),
+    "item.listo": ((I.PENDIENTE, I.EN_PREPARACION), I.LISTO),
+}
+# tipo -> acción de services.transicionar_lote
+TIPOS_PEDIDO = {
+    "pedido.listo": "listo",
+    "pedido.cancelado": "cancelar",
+}
+
+_purga_lock = threading.Lock()
+_purgado_en = None
+
+
+class EventoInvalido(ValueError):
+    """El cuerpo no es un evento o lista de eventos válida: se rechaza entero."""
+
+
+def firma_valida(cuerpo, firma):
+    """Compara (en tiempo constante) la firma recibida con la del cuerpo."""
+    if not firma:
+        return False
+    esperada = build_signature(settings.M3_WEBHOOK_SECRET, cuerpo).encode()
+    recibida = firma.strip().removeprefix("sha256=").lower().encode()
+    return hmac.compare_digest(esperada, recibida)
+
+
+def leer(cuerpo):
+    """Eventos del cuerpo JSON (bytes), validados. Lanza EventoInvalido."""
+    try:
+        datos = json.loads(cuerpo)
+    except (ValueError, UnicodeDecodeError):
+        raise EventoInvalido("JSON inválido.")
+    return validar(datos)
+
+
+def validar(datos):
+    """Normaliza un evento o lista de eventos ya decodificados."""
+    if isinstance(datos, dict):
+        datos = [datos]
+    if not isinstance(datos, list) or not datos:
+        raise EventoInvalido("Se espera un evento o una lista de eventos.")
+    if len(datos) > settings.WEBHOOK_COCINA_MAX_EVENTOS:
+        raise EventoInvalido(f"Máximo {settings.WEBHOOK_COCINA_MAX_EVENTOS} eventos por petición.")
+    return [_evento(n, e) for n, e in enumerate(datos)]
+
+
+def _evento(n, e):
+    if not isinstance(e, dict):
+        raise EventoInvalido(f"Evento {n}: debe ser un objeto.")
+    eid, tipo = e.get("id"), e.get("tipo")
+    if not isinstance(eid, str) or not 0 < len(eid) <= MAX_ID:
+        raise EventoInvalido(f"Evento {n}: id requerido (1 a {MAX_ID} caracteres).")
+    if tipo not in TIPOS_ITEM and tipo not in TIPOS_PEDIDO:
+        raise EventoInvalido(f"Evento {n}: tipo inválido ({tipo}).")
+    try:
+        pedido = str(uuid.UUID(str(e.get("pedido_id"))))
+    except ValueError:
+        raise EventoInvalido(f"Evento {n}: pedido_id inválido.")
+    item = e.get("item_id")
+    if tipo in TIPOS_ITEM and (not isinstance(item, int) or isinstance(item, bool)):
+        raise EventoInvalido(f"Evento {n}: item_id requerido.")
+    return {"id": eid, "tipo": tipo, "pedido_id": pedido, "item_id": item}
+
+
+def procesar(eventos):
+    """
+    Aplica eventos ya validados en una transacción. Devuelve un resultado
+    por evento: {"id", "resultado": "ok" | "duplicado" | "conflicto", ...}.
+    """
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                resultados = _procesar(eventos)
+            break
+        except IntegrityError:
+            # otra petición registró alguno de estos ids entre el SELECT y el
+            # INSERT; al repetir salen como duplicados
+            if intento:
+                raise
+    _purgar_si_toca()
+    return resultados
+
+
+def _procesar(eventos):
+    vistos = set(
+        EventoCocina.objects.filter(pk__in={e["id"] for e in eventos}).values_list("pk", flat=True)
+    )
+    resultados, de_items, de_pedidos = [], [], []
+    for e in eventos:
+        res = {"id": e["id"]}
+        resultados.append(res)
+        if e["id"] in vistos:
+            res["resultado"] = "duplicado"
+            continue
+        vistos.add(e["id"])
+        (de_items if e["tipo"] in TIPOS_ITEM else de_pedidos).append((e, res))
+
+    nuevos = [EventoCocina(pk=e["id"]) for e, _ in de_items + de_pedidos]
+    if not nuevos:
+        return resultados
+    EventoCocina.objects.bulk_create(nuevos)
+
+    completos = _aplicar_items(de_items) if de_items else []
+    con_evento = {e["pedido_id"] for e, _ in de_pedidos}
+    acciones = [{"id": e["pedido_id"], "accion": TIPOS_PEDIDO[e["tipo"]]} for e, _ in de_pedidos]
+    # pedidos con todas sus líneas listas (salvo que un evento del lote ya diga qué hacer)
+    acciones += [{"id": pid, "accion": "listo"} for pid in completos if pid not in con_evento]
+    if acciones:
+        lote = services.transicionar_lote(acciones, esperar=True)
+        for (_, res), r in zip(de_pedidos, lote):
+            res.update({k: v for k, v in r.items() if k not in ("id", "accion")})
+    return resultados
+
+
+def _aplicar_items(de_items):
+    """
+    Cambia el estado de las líneas (un SELECT y un UPDATE por estado nuevo),
+    publica sus pedidos y anota el cambio en su historial. Devuelve los ids
+    de pedidos EN_PREPARACION que quedaron con todas sus líneas listas.
+    """
+    filas = {
+        pk: (str(pedido), estado, estado_pedido)
+        for pk, pedido, estado, estado_pedido in PedidoItem.objects.select_for_update()
+        .filter(pk__in={e["item_id"] for e, _ in de_items})
+        .values_list("pk", "pedido_id", "estado", "pedido__estado")
+    }
+    actuales = {pk: fila[1] for pk, fila in filas.items()}
+    for e, res in de_items:
+        fila = filas.get(e["item_id"])
+        if fila is None or fila[0] != e["pedido_id"]:
+            res.update(resultado="conflicto", detalle="La línea no existe en ese pedido.")
+            continue
+        if fila[2] not in ESTADOS_COCINA:
+            res.update(resultado="conflicto", detalle=f"El pedido ya está {fila[2]}.")
+            continue
+        desde, hacia = TIPOS_ITEM[e["tipo"]]
+        if actuales[e["item_id"]] not in desde:
+            res.update(resultado="conflicto", detalle=f"La línea ya está {actuales[e['item_id']]}.")
+            continue
+        actuales[e["item_id"]] = hacia
+        res.update(resultado="ok", estado=hacia)
+
+    por_estado = {}
+    for pk, estado in actuales.items():
+        if estado != filas[pk][1]:
+            por_estado.setdefault(estado, []).append(pk)
+    if not por_estado:
+        return []
+    for estado, pks in por_estado.items():
+        PedidoItem.objects.filter(pk__in=pks).update(estado=estado)
+
+    # la cola de cocina y el tablero reciben las líneas con su estado nuevo
+    cambiadas = {pk for pks in por_estado.values() for pk in pks}
+    afectados = {filas[pk][0] for pk in cambiadas}
+    completos, historial, ahora = [], [], timezone.now()
+    for pedido in Pedido.objects.filter(pk__in=afectados).prefetch_related("items"):
+        publicar_cambio(pedido, pedido.estado)
+        lineas = [i for i in pedido.items.all() if i.pk in cambiadas]
+        historial.append(PedidoEvento.de(
+            pedido, PedidoEvento.Tipo.LINEAS, pedido.estado, ahora, PedidoEvento.lineas(lineas),
+        ))
+        if pedido.estado == Pedido.Estado.EN_PREPARACION and all(
+            i.estado == I.LISTO for i in pedido.items.all()
+        ):
+            completos.append(str(pedido.pk))
+    PedidoEvento.objects.bulk_create(historial)
+    return completos
+
+
+def _purgar_si_toca():
+    global _purgado_en
+    with _purga_lock:
+        ahora = time.monotonic()
+        if _purgado_en is not None and ahora - _purgado_en < PURGA_CADA:
+            return
+        _purgado_en = ahora
+    purgar()
+
+
+def purgar():
+    """Borra los ids de eventos vencidos. Devuelve cuántos."""
+    vence = timezone.now() - datetime.timedelta(seconds=settings.WEBHOOK_COCINA_TTL)
+    borrados, _ = EventoCocina.objects.filter(recibido_en__lt=vence).delete()
+    return borrados
@@ -3,6 +3,9 @@ ASGI config for restaurante project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Es el punto de entrada en producción (ver Procfile): el flujo SSE de
+/api/pedidos/eventos/ mantiene conexiones abiertas y necesita ASGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
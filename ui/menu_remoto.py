@@ -0,0 +1,80 @@
+"""
+Caché local (por proceso) del menú remoto que muestran mesero, cocina y stock.
+
+Sólo la primera carga espera al servicio. Después se sirve lo que hay en
+memoria; si pasó más de UI_MENU_TTL segundos se refresca en un hilo
+aparte con If-None-Match (304 = sigue igual) y la página no espera.
+Si el refresco falla se sigue mostrando la última copia.
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+from menu_stock.cache import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class MenuRemoto:
+    def __init__(self, url, clave, timeout=10, ttl=None, reloj=time.monotonic):
+        self.url = url
+        self.clave = clave
+        self.timeout = timeout
+        self._ttl = ttl
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._datos = None
+        self._etag = None
+        self._cargado_en = 0.0
+        self._refrescando = False
+
+    @property
+    def ttl(self):
+        return settings.UI_MENU_TTL if self._ttl is None else self._ttl
+
+    def obtener(self):
+        with self._lock:
+            datos = self._datos
+            vencido = self._reloj() - self._cargado_en > self.ttl
+            lanzar = datos is not None and vencido and not self._refrescando
+            if lanzar:
+                self._refrescando = True
+
+        if datos is None:
+            metricas.registrar(self.clave, "fallos")
+            return self._refrescar()
+        metricas.registrar(self.clave, "aciertos")
+        if lanzar:
+            threading.Thread(target=self._refrescar_en_fondo, daemon=True).start()
+        return datos
+
+    def invalidar(self):
+        with self._lock:
+            self._datos = None
+            self._etag = None
+
+    def _refrescar(self):
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        r = requests.get(self.url, timeout=self.timeout, headers=headers)
+        with self._lock:
+            if r.status_code == 304 and self._datos is not None:
+                metricas.registrar(self.clave, "no_modificados")
+            else:
+                r.raise_for_status()
+                self._datos = r.json()
+                self._etag = r.headers.get("ETag")
+            self._cargado_en = self._reloj()
+            return self._datos
+
+    def _refrescar_en_fondo(self):
+        try:
+            metricas.registrar(self.clave, "refrescos")
+            self._refrescar()
+        except Exception:
+            logger.warning("No se pudo refrescar %s; se sigue usando la copia local", self.url, exc_info=True)
+        finally:
+            with self._lock:
+                self._refrescando = False
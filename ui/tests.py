@@ -1,3 +1,69 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+
+from mesas.models import Mesa
+from pedidos import cola_cocina, ocupacion
+from pedidos.models import Pedido
+
+from .menu_remoto import MenuRemoto
+
+
+@mock.patch("ui.views._load_platos", return_value=[])
+class UiPedidosEnProcesoTest(TestCase):
+    """Las vistas de la UI usan la capa de servicios, sin HTTP contra /api/pedidos/."""
+
+    def setUp(self):
+        for estructura in (ocupacion.indice, cola_cocina.cola):
+            estructura.invalidar()
+            self.addCleanup(estructura.invalidar)
+
+    def test_crear_y_confirmar(self, *_):
+        with mock.patch("requests.post") as post, mock.patch("requests.patch") as patch:
+            self.client.post(reverse("ui:crear_pedido"), {"mesa": "3", "cliente": "Ana", "plato": "1"})
+            p = Pedido.objects.get(mesa="3")
+            self.client.get(reverse("ui:confirmar", args=[p.id]))
+        post.assert_not_called()
+        patch.assert_not_called()
+        p.refresh_from_db()
+        self.assertEqual(p.estado, Pedido.Estado.EN_PREPARACION)
+
+    def test_mesero_lista_mesas_libres(self, *_):
+        Mesa.objects.create(numero=1, capacidad=4)
+        Mesa.objects.create(numero=2, capacidad=2)
+        Mesa.objects.create(numero=3, capacidad=2, estado=Mesa.RESERVADA)
+        self.client.post(reverse("ui:crear_pedido"), {"mesa": "1", "cliente": "Ana", "plato": "1"})
+        r = self.client.get(reverse("ui:mesero"))
+        self.assertEqual([m["numero"] for m in r.context["mesas"]], [2])
+
+    def test_cocina_lista_solo_pendientes(self, *_):
+        a = Pedido.objects.create(mesa="1", estado=Pedido.Estado.EN_PREPARACION)
+        Pedido.objects.create(mesa="2", estado=Pedido.Estado.LISTO)
+        r = self.client.get(reverse("ui:cocina"))
+        self.assertEqual([p["id"] for p in r.context["pedidos"]], [str(a.id)])
+        self.assertEqual(r.context["pedidos"][0]["prioridad"], 1)
+
+
+class MenuRemotoTest(TestCase):
+    def _respuesta(self, status=200, datos=None, etag='"v1"'):
+        r = mock.Mock(status_code=status, headers={"ETag": etag})
+        r.json.return_value = datos
+        return r
+
+    def test_sirve_copia_local_y_refresca_con_etag(self):
+        reloj = mock.Mock(return_value=0.0)
+        menu = MenuRemoto("http://menu/", "test:platos", ttl=60, reloj=reloj)
+        with mock.patch("requests.get", return_value=self._respuesta(datos={"results": [1]})) as get:
+            self.assertEqual(menu.obtener(), {"results": [1]})
+            self.assertEqual(menu.obtener(), {"results": [1]})
+        self.assertEqual(get.call_count, 1)
 
-# Create your tests here.
+        reloj.return_value = 61.0
+        with mock.patch("requests.get", return_value=self._respuesta(status=304)) as get:
+            with mock.patch("threading.Thread") as hilo:
+                self.assertEqual(menu.obtener(), {"results": [1]})  # no espera al refresco
+            hilo.return_value.start.assert_called_once()
+            menu._refrescar_en_fondo()
+        self.assertEqual(get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+        self.assertEqual(menu.obtener(), {"results": [1]})
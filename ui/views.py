@@ -2,50 +2,86 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
-import requests
+from django.core.exceptions import ValidationError
 import datetime
+from django.utils import timezone
 from django.utils.timezone import localtime
 
+from menu_stock.disponibilidad import porciones_actuales
+from mesas.models import Mesa
+from pedidos import cola_cocina, services
+from pedidos.models import Pedido, PedidoItem
+
+from .menu_remoto import MenuRemoto
+
 # ================== APIS ==================
-MESAS_API  = "https://sistema-gestion-restaurant.up.railway.app/api/mesas/"
 PLATOS_API = "https://web-production-2d3fb.up.railway.app/api/platos/"
 
-ESTADOS_ACTIVOS = {"CREADO", "EN_PREPARACION", "LISTO", "ENTREGADO"}
-
 # ================== HELPERS ==================
-def _load_mesas():
-    r = requests.get(MESAS_API, timeout=10)
-    r.raise_for_status()
-    return r.json().get("results", [])
+def _mesas_libres():
+    """Una consulta indexada: Mesa.estado lo mantienen los pedidos."""
+    return list(
+        Mesa.objects.filter(estado=Mesa.LIBRE)
+        .order_by("numero")
+        .values("id", "numero", "capacidad")
+    )
+
+# el menú cambia pocas veces al día: copia local con TTL (ver ui/menu_remoto.py)
+menu_platos = MenuRemoto(PLATOS_API, "ui:platos")
 
 def _load_platos():
-    r = requests.get(PLATOS_API, timeout=10)
-    r.raise_for_status()
-    data = r.json().get("results", [])
+    data = menu_platos.obtener().get("results", [])
     return [p for p in data if p.get("activo")]
 
+def _marcar_porciones(platos):
+    """Agrega las porciones preparables (motor de menu_stock); 0 = agotado."""
+    porciones = porciones_actuales()
+    for p in platos:
+        p["porciones"] = porciones.get(p.get("id"))
+    return platos
+
+PEDIDO_CAMPOS = ("id", "mesa", "cliente", "plato", "estado", "creado_en", "actualizado_en")
+
+PEDIDOS_RECIENTES = 20  # pedidos cerrados/cancelados que se siguen mostrando en sala
+
 def _load_pedidos(request):
-    r = requests.get(
-        request.build_absolute_uri("/api/pedidos/"),
-        timeout=10
+    """Activos y los últimos finalizados, filtrados en la base: no todo el historial."""
+    activos = list(services.listar_activos().values(*PEDIDO_CAMPOS))
+    recientes = list(
+        services.filtrar_pedidos(estados=services.ESTADOS_FINALES)
+        .order_by("-creado_en", "-id")
+        .values(*PEDIDO_CAMPOS)[:PEDIDOS_RECIENTES]
     )
-    r.raise_for_status()
-    data = r.json()
-    if isinstance(data, dict) and "results" in data:
-        data = data["results"]
-    return data
-
-def _mesa_ocupada(pedidos, mesa_num):
+    pedidos = activos + recientes
+    # líneas de todos los pedidos mostrados en una consulta
+    items = {}
+    for pid, plato, cantidad in (
+        PedidoItem.objects.filter(pedido__in=[p["id"] for p in pedidos])
+        .order_by("id")
+        .values_list("pedido_id", "plato_id", "cantidad")
+    ):
+        items.setdefault(pid, []).append({"plato": plato, "cantidad": cantidad})
     for p in pedidos:
-        if str(p.get("mesa")) == str(mesa_num) and p.get("estado") in ESTADOS_ACTIVOS:
-            return True
-    return False
+        p["items"] = items.get(p["id"], [])
+    return sorted(pedidos, key=lambda p: p["creado_en"], reverse=True)
+
+def _nombre_platos(pedido, platos_dict):
+    """Los platos del pedido para mostrar: sus líneas o, si no tiene, `plato`."""
+    items = pedido.get("items")
+    if not items:
+        return platos_dict.get(str(pedido.get("plato")), pedido.get("plato"))
+    return ", ".join(
+        f"{i['cantidad']} x {platos_dict.get(str(i['plato']), i['plato'])}" for i in items
+    )
 
 def _fmt_fecha(iso):
     if not iso:
         return "—"
     try:
-        dt = datetime.datetime.fromisoformat(iso.replace("Z", "+00:00"))
+        if isinstance(iso, datetime.datetime):
+            dt = iso
+        else:
+            dt = datetime.datetime.fromisoformat(iso.replace("Z", "+00:00"))
         dt = localtime(dt) if dt.tzinfo else dt
         return dt.strftime("%d/%m %H:%M")
     except Exception:
@@ -53,31 +89,24 @@ def _fmt_fecha(iso):
 
 # ================== MESERO ==================
 def mesero(request):
+    pedidos = _load_pedidos(request)
     try:
-        pedidos = _load_pedidos(request)
-        mesas = _load_mesas()
         platos = _load_platos()
     except Exception as e:
         messages.error(request, f"Error cargando datos: {e}")
-        pedidos, mesas, platos = [], [], []
+        platos = []
 
     # Enriquecer pedidos
     platos_dict = {str(p["id"]): p["nombre"] for p in platos}
     for p in pedidos:
-        p["plato_nombre"] = platos_dict.get(str(p.get("plato")), p.get("plato"))
+        p["plato_nombre"] = _nombre_platos(p, platos_dict)
         p["creado_str"] = _fmt_fecha(p.get("creado_en"))
         p["actu_str"] = _fmt_fecha(p.get("actualizado_en"))
 
-    # Marcar mesas ocupadas
-    mesas_disponibles = []
-    for m in mesas:
-        if not _mesa_ocupada(pedidos, m["numero"]) and m["estado"] == "disponible":
-            mesas_disponibles.append(m)
-
     context = {
         "pedidos": pedidos,
-        "mesas": mesas_disponibles,
-        "platos": platos,
+        "mesas": _mesas_libres(),
+        "platos": _marcar_porciones(platos),
     }
     return render(request, "ui/mesero.html", context)
 
@@ -91,70 +120,70 @@ def crear_pedido(request):
         messages.error(request, "Todos los campos son obligatorios.")
         return redirect("ui:mesero")
 
-    try:
-        pedidos = _load_pedidos(request)
-        if _mesa_ocupada(pedidos, mesa):
-            messages.error(request, f"La mesa {mesa} ya está ocupada.")
-            return redirect("ui:mesero")
-    except Exception as e:
-        messages.error(request, f"No se pudo validar la mesa: {e}")
+    if services.mesa_ocupada(mesa):
+        messages.error(request, f"La mesa {mesa} ya está ocupada.")
         return redirect("ui:mesero")
 
     try:
-        body = {
-            "mesa": mesa,
-            "cliente": cliente,
-            "plato": plato
-        }
-        r = requests.post(
-            request.build_absolute_uri("/api/pedidos/"),
-            json=body,
-            timeout=10
-        )
-        if r.status_code in (200, 201):
-            messages.success(request, f"Pedido creado para mesa {mesa}.")
-        else:
-            messages.error(request, f"Error al crear pedido (HTTP {r.status_code}).")
-    except Exception as e:
-        messages.error(request, f"Error creando pedido: {e}")
+        services.crear_pedido(mesa=mesa, cliente=cliente, plato=plato)
+        messages.success(request, f"Pedido creado para mesa {mesa}.")
+    except ValidationError as e:
+        messages.error(request, f"Error al crear pedido: {' '.join(e.messages)}")
 
     return redirect("ui:mesero")
 
 # ================== ACCIONES ==================
+def _transicionar(request, pedido_id, accion):
+    """Aplica la acción en proceso; devuelve False y deja un mensaje si falla."""
+    try:
+        services.transicionar(pedido_id, accion)
+        return True
+    except Pedido.DoesNotExist:
+        messages.error(request, "El pedido no existe.")
+    except ValidationError as e:
+        messages.error(request, " ".join(e.messages))
+    return False
+
 def accion_confirmar(request, pedido_id):
-    requests.post(request.build_absolute_uri(f"/api/pedidos/{pedido_id}/confirmar/"))
+    _transicionar(request, pedido_id, "confirmar")
     return redirect("ui:mesero")
 
 def accion_cancelar(request, pedido_id):
-    requests.post(request.build_absolute_uri(f"/api/pedidos/{pedido_id}/cancelar/"))
+    _transicionar(request, pedido_id, "cancelar")
     return redirect("ui:mesero")
 
 def accion_entregar(request, pedido_id):
-    requests.patch(request.build_absolute_uri(f"/api/pedidos/{pedido_id}/entregar/"))
+    _transicionar(request, pedido_id, "entregar")
     return redirect("ui:mesero")
 
 def accion_cerrar(request, pedido_id):
-    requests.patch(request.build_absolute_uri(f"/api/pedidos/{pedido_id}/cerrar/"))
+    _transicionar(request, pedido_id, "cerrar")
     return redirect("ui:mesero")
 
 def cocina(request):
+    """Pendientes de cocina en el orden del planificador (pedidos/planificador.py)."""
+    cola = cola_cocina.leer()
+    tickets = {t["id"]: t for t in cola["tickets"]}
     try:
-        pedidos = _load_pedidos(request)
         platos = _load_platos()
     except Exception as e:
-        messages.error(request, f"Error cargando pedidos: {e}")
-        return render(request, "ui/cocina.html", {"pedidos": []})
+        messages.error(request, f"Error cargando platos: {e}")
+        platos = []
 
     # Enriquecer pedidos
     platos_dict = {str(p["id"]): p["nombre"] for p in platos}
+    ahora = timezone.now()
     pedidos_cocina = []
 
-    for p in pedidos:
-        if p.get("estado") in ("CREADO", "EN_PREPARACION"):
-            p["plato_nombre"] = platos_dict.get(str(p.get("plato")), p.get("plato"))
-            p["creado_str"] = _fmt_fecha(p.get("creado_en"))
-            p["actu_str"] = _fmt_fecha(p.get("actualizado_en"))
-            pedidos_cocina.append(p)
+    for prioridad, plan in enumerate(cola["orden"], 1):
+        p = dict(tickets[plan["id"]], **plan, prioridad=prioridad)
+        limite = datetime.datetime.fromisoformat(plan["inicio_limite"])
+        p["plato_nombre"] = _nombre_platos(p, platos_dict)
+        p["creado_str"] = _fmt_fecha(p.get("creado_en"))
+        p["actu_str"] = _fmt_fecha(p.get("actualizado_en"))
+        p["limite_str"] = _fmt_fecha(limite)
+        p["atrasado"] = limite < ahora
+        pedidos_cocina.append(p)
 
     return render(request, "ui/cocina.html", {
         "pedidos": pedidos_cocina
@@ -164,17 +193,13 @@ def cocina(request):
 
 @require_http_methods(["POST"])
 def cocina_en_preparacion(request, pedido_id):
-    requests.patch(
-        request.build_absolute_uri(f"/api/pedidos/{pedido_id}/en-preparacion/")
-    )
+    _transicionar(request, pedido_id, "confirmar")
     return redirect("ui:cocina")
 
 
 @require_http_methods(["POST"])
 def cocina_sin_ingredientes(request, pedido_id):
-    requests.post(
-        request.build_absolute_uri(f"/api/pedidos/{pedido_id}/cancelar/")
-    )
+    _transicionar(request, pedido_id, "cancelar")
     return redirect("ui:cocina")
 
 
@@ -182,14 +207,8 @@ def cocina_sin_ingredientes(request, pedido_id):
 @require_http_methods(["POST"])
 @require_http_methods(["POST"])
 def cocina_listo(request, pedido_id):
-    r = requests.patch(
-        request.build_absolute_uri(f"/api/pedidos/{pedido_id}/listo/")
-    )
-    if r.status_code not in (200, 204):
-        messages.error(
-            request,
-            f"No se pudo marcar el pedido como listo (HTTP {r.status_code})."
-        )
+    if not _transicionar(request, pedido_id, "listo"):
+        messages.error(request, "No se pudo marcar el pedido como listo.")
     return redirect("ui:cocina")
 
 
@@ -201,5 +220,5 @@ def stock(request):
         platos = []
 
     return render(request, "ui/stock.html", {
-        "platos": platos
+        "platos": _marcar_porciones(platos)
     })